@@ -0,0 +1,389 @@
+import argparse
+import base64
+import itertools
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import command_stream
+import kinematics
+import preflight
+import serial_protocol
+
+# Long running owner of the Arduino port.
+#
+# Opening the port resets the board, so every script start costs the 2 s wait (and the
+# arm loses its position). The daemon opens the port once and takes work from any number
+# of local clients over a Unix socket, one job at a time in submission order :
+#   python arm_daemon.py serve --port /dev/ttyACM0            # or ARDUINO_PORT
+#   ARM_DAEMON=/tmp/robotic_arm.sock python move_3d/main_3D.py  # connects in milliseconds
+#
+# The protocol is one JSON object per line each way :
+#   {"op": "submit", "commands": [[a, b, c], ...]}   step commands, encoded by the daemon
+#   {"op": "submit", "curve": [[x, y, z], ...]}      3D points, IK done by the daemon after preflight.py
+#   {"op": "submit", "curve": [...], "feed_rate": 2}  and the step rate checked at that tip speed
+#   {"op": "submit", "data": "<base64 bytes>"}       bytes written as they are
+#   {"op": "status"} / {"op": "status", "job": 3}
+#   {"op": "cancel", "job": 3} / {"op": "cancel", "job": "all"}
+# Answers are {"ok": true, ...} or {"ok": false, "error": "..."}. A submit answers with
+# the job id straight away, the job then goes queued -> running -> done / cancelled / failed.
+# Jobs are written CHUNK_MOVES moves at a time, so cancelling stops a running job at the
+# next chunk. The daemon keeps the absolute step counts and moves them on by each chunk
+# of steps as it is written, and "curve" jobs are solved when they start, so they all
+# continue from where the arm is, also after a job before them was cancelled or failed.
+# A curve is checked for reach and joint limits when it is submitted, and again with the
+# step rate from that start pose when it starts (a job failing then sends nothing).
+#
+# ArmClient has a serial-like write() and close(), so scripts can use it in place of
+# serial.Serial under serial_transport.SerialWriter.
+
+DEFAULT_SOCKET = os.environ.get("ARM_DAEMON_SOCKET", "/tmp/robotic_arm.sock")
+CHUNK_MOVES = 32
+KEEP_FINISHED = 256  # finished jobs kept for status queries
+
+
+class Job:
+    def __init__(self, job_id, client, chunks=None, commands=None, curve=None, feed_rate=None):
+        self.id = job_id
+        self.chunks = chunks or []  # encoded when the job starts, except for raw data
+        self.commands = commands
+        self.curve = curve
+        self.feed_rate = feed_rate
+        self.moves = len(curve) if curve is not None else len(commands) if commands is not None else None
+        self.client = client
+        self.state = "queued"
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.chunks_written = 0
+
+    def info(self):
+        return {"job": self.id, "state": self.state, "moves": self.moves, "chunks": len(self.chunks),
+                "chunks_written": self.chunks_written, "client": self.client, "error": self.error,
+                "submitted": self.submitted, "finished": self.finished}
+
+
+class ArmDaemon:
+    def __init__(self, port, binary=False, ack_streaming=False, arm=None, max_speed=(800, 800, 800),
+                 feed_rate=None):
+        self.port = port
+        self.out = command_stream.CommandStreamer(port, rx_buffer_size=64, window=4) if ack_streaming else port
+        self.binary = binary
+        self.arm = arm if arm is not None else kinematics.ArmModel.load("arm_3d")  # from arm_config.json
+        self.max_speed = max_speed  # steps/s, with feed_rate (tip units/s) for the step rate check of curves
+        self.feed_rate = feed_rate
+        self.tracker = self.arm.accumulator()
+        self.frame_seq = 0
+        self.jobs = OrderedDict()  # id -> Job, queued / running and the last finished ones
+        self.queue = deque()
+        self.current = None
+        self.bytes_written = 0
+        self.started = time.time()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="arm-daemon-writer", daemon=True)
+        self._thread.start()
+
+    def _encode(self, commands):
+        chunks = []
+        for start in range(0, len(commands), CHUNK_MOVES):
+            part = commands[start:start + CHUNK_MOVES]
+            if self.binary:
+                frames, self.frame_seq = serial_protocol.encode_frames(part, self.frame_seq)
+                chunks.append(b"".join(frames))
+            else:
+                chunks.append(serial_protocol.format_ascii(part))
+        return chunks
+
+    def submit(self, request, client=None):
+        with self._cond:
+            if "data" in request:
+                job = Job(next(self._ids), client, chunks=[base64.b64decode(request["data"])])
+            elif "curve" in request:
+                # A curve out of reach or the joint limits is refused with the summary, the
+                # step rate depends on where the arm is when it starts and is checked then
+                preflight.check_trajectory(request["curve"], self.arm, max_speed=None).check()
+                job = Job(next(self._ids), client, curve=request["curve"],
+                          feed_rate=request.get("feed_rate", self.feed_rate))
+            elif "commands" in request:
+                job = Job(next(self._ids), client, commands=[[int(s) for s in cmd] for cmd in request["commands"]])
+            else:
+                raise ValueError("submit needs one of commands, curve or data")
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self._cond.notify()
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job ("all" for everything), returns the cancelled ids.
+        """
+        with self._cond:
+            jobs = list(self.jobs.values()) if job_id == "all" else [self.jobs[int(job_id)]]
+            cancelled = []
+            for job in jobs:
+                if job.state in ("queued", "running"):
+                    job.state = "cancelled"
+                    job.finished = time.time()
+                    cancelled.append(job.id)
+            self.queue = deque(job for job in self.queue if job.state == "queued")
+        return cancelled
+
+    def status(self, job_id=None):
+        with self._cond:
+            if job_id is not None:
+                return self.jobs[int(job_id)].info()
+            return {"queued": [job.id for job in self.queue],
+                    "running": self.current.id if self.current else None,
+                    "bytes_written": self.bytes_written, "uptime": time.time() - self.started,
+                    "position": self.tracker.position}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                job = self.current = self.queue.popleft()
+                job.state = "running"
+                position = list(self.tracker.position)  # only this thread moves it
+            # A curve is solved without the lock, status and cancel are answered meanwhile
+            try:
+                commands = self._solve(job, position) if job.curve is not None else job.commands
+                error = None
+            except Exception as exc:
+                error = exc
+            with self._cond:
+                if job.state == "running" and error is not None:
+                    job.state, job.error = "failed", repr(error)
+                elif job.state == "running":
+                    self._prepare(job, commands)
+            try:
+                for index, chunk in enumerate(job.chunks):
+                    if job.state != "running":  # cancelled
+                        break
+                    self.out.write(chunk)
+                    with self._cond:
+                        self.bytes_written += len(chunk)
+                        job.chunks_written += 1
+                        self._advance(job, index)
+            except Exception as exc:
+                with self._cond:
+                    if job.state == "running":
+                        job.state, job.error = "failed", repr(exc)
+            with self._cond:
+                if job.state == "running":
+                    job.state = "done"
+                job.finished = job.finished or time.time()
+                self.current = None
+                self._trim()
+                self._cond.notify_all()
+
+    def _solve(self, job, position):
+        # The steps of a curve from `position`, where the arm is when the job starts, after
+        # the pre-flight checks from there. The tracker is moved on chunk by chunk by _advance
+        tracker = self.arm.accumulator()
+        tracker.position = position
+        angles = self.arm.ik_3d_batch(job.curve)
+        preflight.check_trajectory(job.curve, self.arm, start=tracker.angles(), angles=angles,
+                                   max_speed=self.max_speed, feed_rate=job.feed_rate).check()
+        return self.arm.commands_batch(angles, accumulator=tracker).tolist()
+
+    def _prepare(self, job, commands):
+        # Under the lock, once the job is solved : frames are numbered in the order they are written
+        job.commands = commands
+        if commands is not None:
+            job.chunks = self._encode(commands)
+
+    def _advance(self, job, index):
+        # The tracker follows what was written, a job cut short leaves it where the arm stopped
+        if job.commands is None:
+            return
+        part = job.commands[index * CHUNK_MOVES:(index + 1) * CHUNK_MOVES]
+        a, b, c = (sum(cmd[axis] for cmd in part) for axis in range(3))
+        base, shoulder, elbow = self.tracker.position
+        # Commands are [-elbow, base, shoulder], the tracker is base, shoulder, elbow
+        self.tracker.position = [base + b, shoulder + c, elbow - a]
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state not in ("queued", "running")]
+        for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.jobs[job_id]
+
+    def wait_idle(self):
+        with self._cond:
+            while self.queue or self.current:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def handle(self, request, client=None):
+        op = request.get("op")
+        if op == "submit":
+            return {"ok": True, "job": self.submit(request, client).id}
+        if op == "status":
+            return {"ok": True, **self.status(request.get("job"))}
+        if op == "cancel":
+            return {"ok": True, "cancelled": self.cancel(request.get("job", "all"))}
+        raise ValueError(f"unknown op {op!r}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        client = f"pid {self._peer_pid()}"
+        for line in self.rfile:
+            try:
+                reply = self.server.daemon_state.handle(json.loads(line), client)
+            except KeyError as exc:
+                reply = {"ok": False, "error": f"no job {exc.args[0]}"}
+            except Exception as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+    def _peer_pid(self):
+        try:
+            creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+            return struct.unpack("3i", creds)[0]
+        except (AttributeError, OSError):
+            return None
+
+
+def serve(daemon_state, path=DEFAULT_SOCKET):
+    """
+    Listen on the Unix socket `path`, returns the server (serve_forever() runs it).
+    """
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a daemon that didn't shut down cleanly
+    server = socketserver.ThreadingUnixStreamServer(path, _Handler)
+    server.daemon_threads = True
+    server.daemon_state = daemon_state
+    return server
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class ArmClient:
+    """
+    Connection to a running daemon. write() submits raw bytes, like serial.Serial.write.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def request(self, **request):
+        with self._lock:
+            self.file.write((json.dumps(request) + "\n").encode())
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise DaemonError("daemon closed the connection")
+        reply = json.loads(line)
+        if not reply.pop("ok"):
+            raise DaemonError(reply["error"])
+        return reply
+
+    def submit(self, commands=None, curve=None, data=None, feed_rate=None):
+        if commands is not None:
+            return self.request(op="submit", commands=[[int(s) for s in cmd] for cmd in commands])["job"]
+        if curve is not None:
+            extra = {"feed_rate": float(feed_rate)} if feed_rate is not None else {}
+            return self.request(op="submit", curve=[[float(v) for v in point] for point in curve], **extra)["job"]
+        return self.request(op="submit", data=base64.b64encode(data).decode())["job"]
+
+    def status(self, job=None):
+        return self.request(op="status", job=job) if job is not None else self.request(op="status")
+
+    def cancel(self, job="all"):
+        return self.request(op="cancel", job=job)["cancelled"]
+
+    def wait(self, job, poll=0.01):
+        while True:
+            info = self.status(job)
+            if info["state"] not in ("queued", "running"):
+                return info
+            time.sleep(poll)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.submit(data=data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="keep the Arduino port open and share it between scripts")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("serve")
+    run.add_argument("--port", default=os.environ.get("ARDUINO_PORT", "COM5"))
+    run.add_argument("--baud", type=int, default=9600)
+    run.add_argument("--binary", action="store_true", help="encode step commands as binary frames")
+    run.add_argument("--ack-streaming", action="store_true", help="pace writes by the sketch's ok acks")
+    run.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    run.add_argument("--max-speed", type=float, nargs=3, default=[800, 800, 800], help="steps/s per motor")
+    run.add_argument("--feed-rate", type=float, default=None,
+                     help="tip speed (units/s) curves are checked at, unless they give their own")
+    sub.add_parser("status")
+    cancel = sub.add_parser("cancel")
+    cancel.add_argument("job", nargs="?", default="all")
+    send = sub.add_parser("send")
+    send.add_argument("text", help='e.g. "A10,B0,C5;A-3,B2,C0" or "on"')
+    args = parser.parse_args()
+
+    if args.command != "serve":
+        start = time.perf_counter()
+        client = ArmClient(args.socket)
+        connect = time.perf_counter() - start
+        if args.command == "status":
+            print(json.dumps(client.status(), indent=2))
+        elif args.command == "cancel":
+            print("cancelled", client.cancel(args.job))
+        else:
+            print("job", client.submit(data=(args.text + "\n").encode()))
+        print(f"connected in {connect * 1000:.2f} ms", file=sys.stderr)
+        client.close()
+        return
+
+    import serial
+
+    port = serial.Serial(args.port, args.baud, timeout=1)
+    time.sleep(2)  # the one reset wait, clients don't pay it
+    state = ArmDaemon(port, binary=args.binary, ack_streaming=args.ack_streaming,
+                      arm=kinematics.ArmModel.load(args.arm), max_speed=args.max_speed, feed_rate=args.feed_rate)
+    server = serve(state, args.socket)
+    print(f"serving {args.port} on {args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        state.wait_idle()
+        state.close()
+        port.close()
+
+
+if __name__ == '__main__':
+    main()
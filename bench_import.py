@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Import time of the kinematics modules, each in a fresh interpreter :
+#   python bench_import.py                  # median of 5 cold imports per module
+#   python bench_import.py --max-ms 50      # exit 1 if kinematics takes longer
+# Modules whose dependencies are missing are reported and skipped.
+
+MODULES = ["kinematics", "step_accumulator", "serial_protocol", "xy_to_step_3D", "ik_table",
+           "two_D_UI", "three_D_UI"]
+
+_PROBE = """
+import sys, time
+sys.path[:0] = {paths!r}
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def import_time(module, repeat):
+    """
+    Median seconds to import `module` in a new python, None if it can't be imported.
+    """
+    paths = [HERE, os.path.join(HERE, "move_3d"), os.path.join(HERE, "move_2D")]
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _PROBE.format(paths=paths, module=module)],
+                                capture_output=True, text=True, cwd=HERE,
+                                env={**os.environ, "PYGAME_HIDE_SUPPORT_PROMPT": "1"})
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cold import time of the kinematics modules")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--max-ms", type=float, help="fail when kinematics imports slower than this")
+    parser.add_argument("--output", help="save the results as json")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        seconds, error = import_time(module, args.repeat)
+        if error:
+            print(f"{module:<18} skipped : {error}")
+            continue
+        results[module] = seconds * 1000
+        print(f"{module:<18} {seconds * 1000:>9.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.max_ms is not None and results.get("kinematics", 0) > args.max_ms:
+        print(f"kinematics imports in {results['kinematics']:.2f} ms, over the {args.max_ms} ms limit")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
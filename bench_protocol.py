@@ -0,0 +1,58 @@
+import argparse
+import random
+import time
+
+import serial_protocol
+
+# Bytes per move and encode throughput of the ASCII format vs binary frames
+# python bench_protocol.py --moves 100000 --baud 9600
+
+BITS_PER_BYTE = 10  # 8N1 : start + 8 data + stop
+
+
+def random_commands(n, spread, seed=0):
+    rng = random.Random(seed)
+    return [[rng.randint(-spread, spread), rng.randint(-spread, spread), rng.randint(-spread, spread)]
+            for _ in range(n)]
+
+
+def encode_ascii(commands, batch):
+    return [serial_protocol.format_ascii(commands[i:i + batch]) for i in range(0, len(commands), batch)]
+
+
+def encode_binary(commands, batch):
+    return serial_protocol.encode_frames(commands, 0, batch)[0]
+
+
+def measure(name, encoder, commands, batch, baud):
+    start = time.perf_counter()
+    chunks = encoder(commands, batch)
+    elapsed = time.perf_counter() - start
+    total = sum(len(c) for c in chunks)
+    per_move = total / len(commands)
+    moves_per_s_on_wire = baud / BITS_PER_BYTE / per_move
+    print(f"{name:<18} {batch:>6} {per_move:>10.2f} {moves_per_s_on_wire:>12.1f} {len(commands) / elapsed:>14.0f}")
+    return per_move
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serial protocol size / speed benchmark")
+    parser.add_argument("--moves", type=int, default=100000)
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--spread", type=int, default=100, help="max |steps| per axis in the random moves")
+    args = parser.parse_args()
+
+    commands = random_commands(args.moves, args.spread)
+    decoder = serial_protocol.FrameDecoder()
+    decoded = [cmd for frame in encode_binary(commands, 255) for _, cmds in decoder.feed(frame) for cmd in cmds]
+    assert decoded == commands, "binary round trip mismatch"
+
+    print(f"{'format':<18} {'batch':>6} {'bytes/move':>10} {'moves/s@baud':>12} {'encode moves/s':>14}")
+    for batch in (1, 16, 255):
+        ascii_size = measure("ascii", encode_ascii, commands, batch, args.baud)
+        binary_size = measure("binary", encode_binary, commands, batch, args.baud)
+        print(f"{'  -> gain':<18} {batch:>6} {ascii_size / binary_size:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
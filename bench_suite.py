@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import serial
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "move_3d"))
+sys.path.append(os.path.join(HERE, "move_2D"))
+
+import kinematics
+import serial_protocol
+import xy_to_step_3D
+
+# Headless benchmark suite, no board and no display needed :
+#   python bench_suite.py --output bench.json
+#   python bench_suite.py --baseline bench.json --threshold 0.2    # exit 1 on a >20 % slowdown
+# Every benchmark times single calls, and reports ops/s with p50 / p99 latency.
+# The 2D kinematics come from two_D_UI, which needs pygame; they are skipped without it.
+
+L1, L2 = 21, 15
+
+
+def measure(func, repeat, warmup=50):
+    """
+    Time `repeat` single calls of func(), returns ops/s and latency percentiles in us.
+    """
+    for _ in range(warmup):
+        func()
+    timer = time.perf_counter_ns
+    samples = []
+    start = timer()
+    for _ in range(repeat):
+        t0 = timer()
+        func()
+        samples.append(timer() - t0)
+    total = timer() - start
+    samples.sort()
+    return {
+        "ops_per_s": repeat / (total / 1e9),
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000,
+        "repeat": repeat,
+    }
+
+
+def benchmarks(repeat):
+    """
+    (name, callable, repeat) for everything we time.
+    """
+    points = kinematics.random_curve(1000, L1, L2)
+    point = points[0].tolist()
+    angles = xy_to_step_3D.inverse_kinematics(*point, L1, L2)
+    commands = xy_to_step_3D.xyz_to_steps_batch(points).tolist()
+    short = commands[:20]
+
+    loop = serial.serial_for_url("loop://", timeout=1)
+    line = serial_protocol.format_ascii(short[:3])
+
+    def round_trip():
+        loop.write(line)
+        loop.readline()
+
+    yield "ik_3d", lambda: xy_to_step_3D.inverse_kinematics(*point, L1, L2), repeat
+    yield "fk_3d", lambda: xy_to_step_3D.forward_kinematics(*angles, L1, L2), repeat
+    yield "angle_to_step_3d", lambda: xy_to_step_3D.angle_to_step(*angles), repeat
+    yield "xyz_to_steps_100", lambda: xy_to_step_3D.xyz_to_steps(points[:100].tolist(), L1, L2), max(1, repeat // 100)
+    yield "xyz_to_steps_batch_1000", lambda: xy_to_step_3D.xyz_to_steps_batch(points, L1, L2), max(1, repeat // 10)
+    yield "command_str_20", lambda: ";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in short]), repeat
+    yield "binary_frame_20", lambda: serial_protocol.encode_frame(short), repeat
+    yield "loopback_round_trip", round_trip, repeat
+
+    try:
+        import two_D_UI
+    except ImportError:
+        print("pygame not installed, skipping the 2D benchmarks", file=sys.stderr)
+        return
+    yield "ik_2d", lambda: two_D_UI.inverse_kinematics(100, 50, two_D_UI.ARM.L1, two_D_UI.ARM.L2), repeat
+    yield "fk_2d", lambda: two_D_UI.get_joint_positions(0.3, 1.2, (400, 300), two_D_UI.ARM.L1, two_D_UI.ARM.L2), repeat
+    yield "angle_to_step_2d", lambda: two_D_UI.angle_to_step(12.5, -40.0), repeat
+
+
+def compare(results, baseline, threshold):
+    """
+    Names whose ops/s fell by more than threshold (a fraction) against the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        change = result["ops_per_s"] / old["ops_per_s"] - 1
+        marker = "  REGRESSION" if change < -threshold else ""
+        print(f"{name:<26} {old['ops_per_s']:>14.0f} -> {result['ops_per_s']:>14.0f} ops/s  {change:+7.1%}{marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless benchmark suite")
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--output", help="save the results as json")
+    parser.add_argument("--baseline", help="json from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20 %%")
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':<26} {'ops/s':>14} {'p50 us':>10} {'p99 us':>10}")
+    for name, func, repeat in benchmarks(args.repeat):
+        if args.only and name not in args.only:
+            continue
+        result = measure(func, repeat)
+        results[name] = result
+        print(f"{name:<26} {result['ops_per_s']:>14.0f} {result['p50_us']:>10.2f} {result['p99_us']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the {args.threshold:.0%} threshold")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
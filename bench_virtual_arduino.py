@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import serial
+
+import command_stream
+import serial_protocol
+import serial_transport
+
+# End-to-end commands/s and queueing latency (send() -> "ok" from the board) of the
+# Python side against virtual_arduino.py, no hardware needed :
+#   python bench_virtual_arduino.py --commands 500 --time-scale 20
+# "writer" is SerialWriter straight on the port (what the scripts do by default),
+# "streamer" puts command_stream.CommandStreamer under it (ACK_STREAMING = True).
+# Every command goes as a binary frame (BINARY_MODE) numbered by its index, so each
+# "ok <seq>" is timed against the send of its own command, also when the writer overruns
+# the board and frames are lost (up to 255 lost in a row).
+# Rates and latencies are in simulated board time, enqueue cost is real time.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def start_board(args):
+    board = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "virtual_arduino.py"), "--baud", str(args.baud),
+         "--speed", str(args.speed), "--time-scale", str(args.time_scale)],
+        stdout=subprocess.PIPE, text=True)
+    return board, board.stdout.readline().strip()
+
+
+def stop_board(board):
+    board.terminate()
+    out, _ = board.communicate(timeout=10)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(mode, args):
+    board, path = start_board(args)
+    port = serial.Serial(path, args.baud, timeout=0.05)
+    sent_at, acked_at = [], []
+    acked = []  # index of the command each entry of acked_at acks
+
+    def on_ack(n):  # the streamer never loses a frame, its acks come in send order
+        acked.extend(range(len(acked), len(acked) + n))
+        acked_at.extend([time.perf_counter()] * n)
+
+    if mode == "streamer":
+        streamer = command_stream.CommandStreamer(port, rx_buffer_size=64, window=4, ack_timeout=10, on_ack=on_ack)
+        writer = serial_transport.SerialWriter(streamer, maxsize=args.commands)
+    else:
+        writer = serial_transport.SerialWriter(port, maxsize=args.commands)
+        stop = threading.Event()
+
+        def read_acks():
+            # "ok <seq>" : the first command from the last one acked on whose index has that seq
+            index = 0
+            while not stop.is_set():
+                parts = port.readline().split()
+                if len(parts) == 2 and parts[0] == b"ok":
+                    index += (int(parts[1]) - index) & 0xFF
+                    acked.append(index)
+                    acked_at.append(time.perf_counter())
+                    index += 1
+        reader = threading.Thread(target=read_acks, daemon=True)
+        reader.start()
+
+    start = time.perf_counter()
+    for i in range(args.commands):
+        sent_at.append(time.perf_counter())
+        writer.send(serial_protocol.encode_frame([[args.steps, -args.steps, i % 7]], seq=i & 0xFF))
+    enqueue_time = time.perf_counter() - start
+
+    writer.close()
+    if mode == "streamer":
+        streamer.wait_idle()
+    else:
+        deadline = time.perf_counter() + args.drain_timeout
+        while len(acked_at) < args.commands and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        stop.set()
+        reader.join()
+    elapsed = (acked_at[-1] if acked_at else time.perf_counter()) - start
+
+    port.close()
+    summary = stop_board(board)
+    # Report in board time, so the numbers don't depend on --time-scale
+    elapsed *= args.time_scale
+    latencies = [(a - sent_at[i]) * 1000 * args.time_scale for i, a in zip(acked, acked_at)]
+    return {
+        "mode": mode,
+        "commands": args.commands,
+        "acked": len(acked_at),
+        "overrun_bytes": summary["overrun_bytes"],
+        "commands_per_s": len(acked_at) / elapsed if elapsed > 0 else 0.0,
+        "enqueue_us": enqueue_time / args.commands * 1e6,
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p99_ms": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end benchmark against virtual_arduino.py")
+    parser.add_argument("--commands", type=int, default=300)
+    parser.add_argument("--steps", type=int, default=40, help="steps per axis in every command")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--speed", type=float, default=800.0)
+    parser.add_argument("--time-scale", type=float, default=10.0)
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--modes", nargs="+", default=["writer", "streamer"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'acked':>7} {'overrun B':>10} {'cmd/s':>9} {'enqueue us':>11} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in args.modes:
+        r = run(mode, args)
+        print(f"{r['mode']:<10} {r['acked']:>4}/{r['commands']:<3} {r['overrun_bytes']:>9} {r['commands_per_s']:>9.1f} "
+              f"{r['enqueue_us']:>11.1f} {r['latency_p50_ms']:>9.1f} {r['latency_p99_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import math
+import statistics
+import threading
+import time
+
+import kinematics
+import telemetry
+
+# Keyboard jogging of the tool tip in x / y / z instead of the raw motors.
+#
+# JogController moves one motor per key, so nudging the tip along x means working out
+# which mix of base, shoulder and elbow that is. CartesianJog keeps a target tip position
+# that the held keys move at `speed` (length units/s) and, at a fixed rate, turns the
+# way to it into joint motion with the analytic Jacobian (kinematics.jacobian_3d) :
+#   dq = J^T (J J^T + damping^2 I)^-1 (v + gain * (target - tip)) * dt
+# The damped least squares keeps dq small near the singular poses (arm stretched out,
+# tip over the base axis) where the plain inverse blows up, the tip then lags behind the
+# target instead of the joints spinning. The error term pulls the tip back onto the
+# target so the small linearisation errors of every tick don't add up. The target stops
+# `margin` inside the reach (and outside the folded-up |L1 - L2|), so holding a key at
+# the edge stops the tip there instead of sliding it along the boundary, and it is never
+# let more than max_error ahead of the tip. Joint speeds are capped to max_joint_speed steps/s.
+#
+#   jog = CartesianJog(lambda cmd: send_commands_to_arduino([cmd]), ARM, step_tracker, rate=50, lock=tracker_lock)
+#   jog.start()
+#   keyboard.hook(jog.handle_event)        # gets both presses and releases
+#   ...
+#   jog.stop()
+#
+# Anything else that moves the tracker (typed curves, files) has to hold the same `lock`
+# while it does, the jog takes it for every tick and key press.
+#
+# A tick is a 3x3 solve in plain floats, about 20 us, so 50 - 100 Hz leaves the CPU idle :
+#   python cartesian_jog.py                # per tick cost and how straight the tip moves
+
+# key name -> (axis, direction), the keys handle_keypress already calls x, y and z
+CARTESIAN_KEYS = {
+    'up': (0, 1), 'down': (0, -1),
+    'left': (1, 1), 'right': (1, -1),
+    'comma': (2, 1), 'period': (2, -1),
+}
+
+
+def damped_least_squares(J, v, damping):
+    """
+    J^T (J J^T + damping^2 I)^-1 v for a 3x3 Jacobian (rows of floats), the joint velocity
+    that moves the tip at `v` as well as the pose allows.
+    """
+    (a0, a1, a2), (b0, b1, b2), (c0, c1, c2) = J
+    d2 = damping * damping
+    # A = J J^T + d2 I is symmetric positive definite, solved with its adjugate
+    aa = a0 * a0 + a1 * a1 + a2 * a2 + d2
+    ab = a0 * b0 + a1 * b1 + a2 * b2
+    ac = a0 * c0 + a1 * c1 + a2 * c2
+    bb = b0 * b0 + b1 * b1 + b2 * b2 + d2
+    bc = b0 * c0 + b1 * c1 + b2 * c2
+    cc = c0 * c0 + c1 * c1 + c2 * c2 + d2
+    m00, m01, m02 = bb * cc - bc * bc, ac * bc - ab * cc, ab * bc - ac * bb
+    m11, m12, m22 = aa * cc - ac * ac, ab * ac - aa * bc, aa * bb - ab * ab
+    det = aa * m00 + ab * m01 + ac * m02
+    vx, vy, vz = v
+    wx = (m00 * vx + m01 * vy + m02 * vz) / det
+    wy = (m01 * vx + m11 * vy + m12 * vz) / det
+    wz = (m02 * vx + m12 * vy + m22 * vz) / det
+    return (a0 * wx + b0 * wy + c0 * wz,
+            a1 * wx + b1 * wy + c1 * wz,
+            a2 * wx + b2 * wy + c2 * wz)
+
+
+class CartesianJog:
+    def __init__(self, send, arm, tracker, speed=2.0, tap=0.5, rate=50, damping=None, gain=None,
+                 max_error=None, margin=None, max_joint_speed=(800, 800, 800), keymap=CARTESIAN_KEYS, clock=time.monotonic,
+                 lock=None):
+        """
+        send gets [a, b, c] step commands (motor order, like handle_keypress), arm is a
+        kinematics.ArmModel and tracker the StepAccumulator of the session, which the
+        jog reads the pose from and keeps up to date. lock is the threading.Lock the
+        other users of the tracker hold, by default the jog's own.
+        """
+        self.send = send
+        self.arm = arm
+        self.tracker = tracker
+        self.speed = speed                  # length units/s
+        self.tap = tap                      # length units a press moves straight away
+        self.interval = 1.0 / rate
+        self.damping = damping if damping is not None else 0.04 * arm.reach
+        self.gain = gain if gain is not None else 0.5 / self.interval  # 1/s, half the error per tick
+        self.max_error = max_error if max_error is not None else max(tap, 2 * speed * self.interval)
+        self.margin = margin if margin is not None else 0.01 * arm.reach
+        self.max_joint_speed = tuple(float(s) for s in max_joint_speed)
+        self.keymap = keymap
+        self.clock = clock
+        self.commands_sent = 0
+        self.ticks = 0
+        self.overruns = 0                   # ticks that started a whole interval late
+        self._pressed = {}                  # key -> time its continuous motion starts
+        self._since = {}                    # key -> time its motion was last added to the target
+        self._angles = None
+        self._target = None
+        self._position = None               # tracker.position after our last command
+        self._last = None
+        self._lock = lock if lock is not None else threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tip(self):
+        """
+        The tip position of the commanded pose.
+        """
+        self._sync()
+        return self.arm.fk_3d(*self._angles)[1]
+
+    def _sync(self):
+        # Start from the tracker's pose, again whenever something else moved the arm
+        if self._position != self.tracker.position:
+            self._angles = list(self.tracker.angles())
+            self._target = list(self.arm.fk_3d(*self._angles)[1])
+            self._position = list(self.tracker.position)
+
+    def _advance(self, key, now):
+        start = self._since[key]
+        if now <= start:
+            return
+        axis, direction = self.keymap[key]
+        self._move_target(axis, direction, self.speed * (now - start))
+        self._since[key] = now
+
+    def _move_target(self, axis, direction, distance):
+        # Along the axis, but not past the edge of the workspace : the shell between
+        # |L1 - L2| and L1 + L2 from the shoulder, a margin inside so the arm never ends
+        # up fully stretched or folded where it can't move back along the axis
+        target = self._target
+        outer = self.arm.reach - self.margin
+        inner = abs(self.arm.L1 - self.arm.L2) + self.margin
+        b = direction * target[axis]
+        norm_sq = target[0] ** 2 + target[1] ** 2 + target[2] ** 2
+        distance = min(distance, max(0.0, -b + math.sqrt(max(0.0, b * b - norm_sq + outer * outer))))
+        crossing = b * b - norm_sq + inner * inner
+        if crossing > 0 and -b - math.sqrt(crossing) >= 0:
+            distance = min(distance, -b - math.sqrt(crossing))
+        target[axis] += direction * distance
+
+    def press(self, key, now=None):
+        """
+        Key went down, returns False for keys that don't jog.
+        """
+        if key not in self.keymap:
+            return False
+        now = self.clock() if now is None else now
+        with self._lock:
+            if key in self._pressed:  # repeats of a held key change nothing
+                return True
+            self._sync()
+            axis, direction = self.keymap[key]
+            self._move_target(axis, direction, self.tap)
+            # Continuous motion takes over once the tap would have been done at `speed`
+            self._pressed[key] = self._since[key] = now + self.tap / self.speed
+        return True
+
+    def release(self, key, now=None):
+        if key not in self.keymap:
+            return False
+        now = self.clock() if now is None else now
+        with self._lock:
+            if key in self._pressed:
+                self._advance(key, now)
+                del self._pressed[key], self._since[key]
+        return True
+
+    def handle_event(self, event):
+        """
+        keyboard.hook callback, events have .name and .event_type 'down' / 'up'.
+        """
+        if event.event_type == 'down':
+            self.press(event.name)
+        else:
+            self.release(event.name)
+
+    def tick(self, now=None):
+        """
+        One control step : joint motion towards the target, sent as one command.
+        Returns the command, None when the arm doesn't need to move.
+        """
+        now = self.clock() if now is None else now
+        with telemetry.span("cartesian_jog.tick"), self._lock:
+            self._sync()
+            # Time since the last tick, a late tick doesn't get to make up for more than one
+            dt = min(now - self._last, 2 * self.interval) if self._last is not None else self.interval
+            self._last = now
+            self.ticks += 1
+            if dt <= 0:
+                return None
+            before = list(self._target)
+            for key in self._pressed:
+                self._advance(key, now)
+            angles = self._angles
+            target = self._target
+            # What the target actually did this tick, nothing once it is held at the edge
+            velocity = [(t - b) / dt for t, b in zip(target, before)]
+            tip = self.arm.fk_3d(*angles)[1]
+            error = [t - p for t, p in zip(target, tip)]
+            distance = math.sqrt(error[0] ** 2 + error[1] ** 2 + error[2] ** 2)
+            if distance > self.max_error:
+                # Out of reach or too fast for the joints : hold the target just ahead of the tip
+                shrink = self.max_error / distance
+                error = [e * shrink for e in error]
+                self._target = [p + e for p, e in zip(tip, error)]
+                velocity = [0.0, 0.0, 0.0]
+            command_velocity = [v + self.gain * e for v, e in zip(velocity, error)]
+            dq = damped_least_squares(self.arm.jacobian_3d(*angles), command_velocity, self.damping)
+            # Slow every joint down together when one would go over its step rate
+            over = max(abs(d) * k / s for d, k, s in zip(dq, self.arm.steps_per_rad, self.max_joint_speed))
+            scale = dt / over if over > 1 else dt
+            self._angles = [a + d * scale for a, d in zip(angles, dq)]
+            steps = self.tracker.to_steps(*self._angles)
+            self._position = list(self.tracker.position)
+        if not any(steps):
+            return None
+        command = [-steps[2], steps[0], steps[1]]  # [-elbow, base, shoulder] like xyz_to_steps
+        self.commands_sent += 1
+        self.send(command)
+        return command
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cartesian-jog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Ticks on a fixed schedule rather than sleeping `interval` after each one,
+        # so the rate holds whatever a tick and the send cost
+        deadline = self.clock()
+        while True:
+            deadline += self.interval
+            if self._stop.wait(max(0.0, deadline - self.clock())):
+                return
+            self.tick()
+            if self.clock() > deadline + self.interval:
+                self.overruns += 1
+                deadline = self.clock()
+
+
+def simulate(arm, start, moves, rate, speed):
+    """
+    Drive the jog with simulated key holds, `moves` is a list of (key, seconds).
+    Returns the per tick seconds and, for each move, the tip's largest distance from the
+    straight line it should follow and how far it got along it.
+    """
+    tracker = arm.accumulator(arm.ik_3d(*start))
+    sent = []
+    jog = CartesianJog(sent.append, arm, tracker, speed=speed, rate=rate)
+    now, tick_times, moves_report = 0.0, [], []
+    for key, seconds in moves:
+        axis, direction = jog.keymap[key]
+        origin = jog.tip()
+        jog.press(key, now)
+        end = now + seconds
+        deviation = 0.0
+        while now < end + 0.5:  # and half a second to settle after the release
+            now += jog.interval
+            if key in jog._pressed and now >= end:
+                jog.release(key, end)
+            began = time.perf_counter()
+            jog.tick(now)
+            tick_times.append(time.perf_counter() - began)
+            # The pose the motors were actually sent to
+            tip = arm.fk_3d(*tracker.angles())[1]
+            off_axis = [t - o for i, (t, o) in enumerate(zip(tip, origin)) if i != axis]
+            deviation = max(deviation, math.sqrt(sum(d * d for d in off_axis)))
+        moved = (jog.tip()[axis] - origin[axis]) * direction
+        moves_report.append((key, seconds, moved, deviation))
+    return tick_times, moves_report, jog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per tick cost and path accuracy of the Cartesian jog")
+    parser.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    parser.add_argument("--rate", type=float, default=50.0, help="ticks/s")
+    parser.add_argument("--speed", type=float, default=2.0, help="length units/s")
+    parser.add_argument("--start", type=float, nargs=3, default=(20.0, 5.0, 10.0), help="x y z")
+    args = parser.parse_args()
+
+    arm = kinematics.ArmModel.load(args.arm)
+    # Along each axis, then straight out past the reach to check the arm stops at the edge
+    moves = [("up", 2.0), ("left", 2.0), ("comma", 2.0), ("down", 2.0), ("right", 2.0), ("period", 2.0),
+             ("up", 2 * arm.reach / args.speed)]
+    tick_times, report, jog = simulate(arm, args.start, moves, args.rate, args.speed)
+    for key, seconds, moved, deviation in report:
+        axis = "xyz"[CARTESIAN_KEYS[key][0]]
+        print(f"  hold {key:<7} {seconds:5.1f} s : {axis} moved {moved:+7.3f} (asked {max(jog.tap, args.speed * seconds):.3f}), "
+              f"off the line by at most {deviation:.3f}")
+    tip = jog.tip()
+    print(f"  tip stopped {math.dist(tip, (0.0, 0.0, 0.0)):.3f} from the shoulder, reach {arm.reach}")
+
+    tick_times.sort()
+    budget = 1.0 / args.rate
+    print(f"{len(tick_times)} ticks, {jog.commands_sent} commands : per tick median "
+          f"{statistics.median(tick_times) * 1e6:.1f} us, p99 {tick_times[int(len(tick_times) * 0.99)] * 1e6:.1f} us, "
+          f"max {tick_times[-1] * 1e6:.1f} us, {tick_times[-1] / budget:.2%} of the {budget * 1000:.0f} ms tick")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import time
+
+import numpy as np
+
+import kinematics
+
+# Fewer bytes for the same motion on the slow serial link.
+#
+# A densified path turns into many short moves that point the same way
+# ("A3,B2,C0;A3,B2,C0;A6,B4,C0"), and the 2D sketch gets a B0 in every move. Two passes,
+# usable on their own :
+#   merge_moves()    joins consecutive moves into one when every position in between lies
+#                    on the straight move from the first to the last (within `tolerance`
+#                    steps) and is passed in order. Runs are cut at the positions the
+#                    original moves end on and the steps add up, so the position after
+#                    each merged move is one the arm went through anyway, and the
+#                    StepAccumulator / firmware end position is unchanged.
+#   format_compact() leaves zero fields out and writes n identical moves in a row once
+#                    with "*n" : "A6,B4;C-3*5;A1\n". Moves that are all zero are dropped.
+# parse_compact() expands such a line back to [[a, b, c], ...], which is what the sketch
+# has to do (virtual_arduino.py reads it too). The output of merge_moves() is plain
+# commands for any sketch and for binary frames; the compact text needs a sketch that
+# defaults missing fields to 0 and understands "*n".
+#
+#   line = command_compress.compress(commands, tolerance=0.5)
+#   python command_compress.py --baud 9600     # bytes and time on the wire, dense paths
+
+MAX_STEPS = 32767  # per axis in a merged move, fits the int16 binary frames and an Arduino int
+MAX_RUN = 4096     # moves merged into one at most, bounds the work per merged move
+AXES = "ABC"
+BITS_PER_BYTE = 10  # 8N1
+
+
+def _run_fits(positions, start, end, tolerance, max_steps):
+    """
+    Whether moves start .. end - 1 can be sent as the one move positions[end] - positions[start].
+    """
+    move = positions[end] - positions[start]
+    if np.abs(move).max() > max_steps:
+        return False
+    if end - start == 1:
+        return True
+    length_sq = float(move @ move)
+    if length_sq == 0:
+        return False  # goes somewhere and comes back, not a straight move
+    inner = positions[start + 1:end] - positions[start]
+    along = inner @ move / length_sq
+    off = inner - along[:, None] * move
+    if (off * off).sum(axis=1).max() > tolerance * tolerance + 1e-9:
+        return False
+    # In order along the move and not past either end, backwards by at most `tolerance`
+    slack = tolerance / np.sqrt(length_sq) + 1e-9
+    return (along.min() >= -slack and along.max() <= 1 + slack
+            and (along.size < 2 or np.diff(along).min() >= -slack))
+
+
+def merge_moves(commands, tolerance=0.0, max_steps=MAX_STEPS, max_run=MAX_RUN):
+    """
+    Merge consecutive [a, b, c] step moves that lie on one straight move, see the header.
+    `tolerance` is how far (in steps) the positions in between may be off that move, 0 only
+    merges moves with exactly the same step ratios. Returns a list of [a, b, c].
+    """
+    moves = np.asarray(commands, dtype=np.int64).reshape(-1, 3)
+    moves = moves[moves.any(axis=1)]  # all zero moves go nowhere
+    n = len(moves)
+    positions = np.zeros((n + 1, 3), dtype=np.int64)
+    np.cumsum(moves, axis=0, out=positions[1:])
+    positions = positions.astype(np.float64)
+
+    merged = []
+    start = 0
+    while start < n:
+        # Double the run while it fits, then bisect between the last length that fit and the first that didn't
+        good, bad = 1, None
+        while start + good < n and good < max_run:
+            length = min(2 * good, n - start, max_run)
+            if not _run_fits(positions, start, start + length, tolerance, max_steps):
+                bad = length
+                break
+            good = length
+        while bad is not None and bad - good > 1:
+            middle = (good + bad) // 2
+            if _run_fits(positions, start, start + middle, tolerance, max_steps):
+                good = middle
+            else:
+                bad = middle
+        merged.append(moves[start:start + good].sum(axis=0).tolist())
+        start += good
+    return merged
+
+
+def _format_move(move, count):
+    text = ",".join(f"{axis}{value}" for axis, value in zip(AXES, move) if value)
+    return f"{text}*{count}" if count > 1 else text
+
+
+def format_compact(commands, repeat=True):
+    """
+    [[a, b, c], ...] -> b"A6,B4;C-3*5\\n" : no zero fields, "*n" for n identical moves in a
+    row (with `repeat`), all zero moves dropped. b"" when nothing is left to send.
+    """
+    parts = []
+    last, count = None, 0
+    for cmd in commands:
+        move = (int(cmd[0]), int(cmd[1]), int(cmd[2]))
+        if move == (0, 0, 0):
+            continue
+        if repeat and move == last:
+            count += 1
+            continue
+        if last is not None:
+            parts.append(_format_move(last, count))
+        last, count = move, 1
+    if last is not None:
+        parts.append(_format_move(last, count))
+    return (";".join(parts) + "\n").encode() if parts else b""
+
+
+def parse_compact(line):
+    """
+    Reference decoder for format_compact() (and the plain "A..,B..,C.." text) : one line ->
+    [[a, b, c], ...] with the repeats expanded. Raises ValueError on anything else.
+    """
+    if isinstance(line, bytes):
+        line = line.decode()
+    moves = []
+    for command in line.strip().split(";"):
+        if not command:
+            continue
+        fields, star, count = command.partition("*")
+        count = int(count) if star else 1
+        if count < 1:
+            raise ValueError(f"bad repeat count in {command!r}")
+        move = [0, 0, 0]
+        for field in fields.split(","):
+            field = field.strip()
+            if len(field) < 2 or field[0].upper() not in AXES:
+                raise ValueError(f"bad field {field!r} in {command!r}")
+            move[AXES.index(field[0].upper())] = int(field[1:])
+        moves.extend(list(move) for _ in range(count))
+    return moves
+
+
+def compress(commands, tolerance=0.0, repeat=True, max_steps=MAX_STEPS):
+    """
+    merge_moves() then format_compact() : the line to send for `commands`.
+    """
+    return format_compact(merge_moves(commands, tolerance, max_steps), repeat)
+
+
+def max_deviation(commands, merged):
+    """
+    Furthest (in steps) any position of `commands` is from the merged path, and whether every
+    merged move ends on a position of `commands` in order with the same final position.
+    """
+    original = np.cumsum(np.asarray(commands, dtype=np.int64).reshape(-1, 3), axis=0)
+    original = np.vstack((np.zeros((1, 3), dtype=np.int64), original)).astype(np.float64)
+    ends = np.cumsum(np.asarray(merged, dtype=np.int64).reshape(-1, 3), axis=0)
+    ends = np.vstack((np.zeros((1, 3), dtype=np.int64), ends)).astype(np.float64)
+    worst, i = 0.0, 0
+    for a, b in zip(ends[:-1], ends[1:]):
+        j = i
+        while j < len(original) and not (original[j] == b).all():
+            j += 1
+        if j == len(original):
+            return np.inf, False
+        move = b - a
+        inner = original[i:j + 1] - a
+        along = np.clip(inner @ move / max(float(move @ move), 1e-12), 0, 1)
+        worst = max(worst, float(np.linalg.norm(inner - along[:, None] * move, axis=1).max()))
+        i = j
+    return worst, bool((original[-1] == ends[-1]).all())
+
+
+def _dense_paths(arm, spacing):
+    # Straight strokes and a circle sampled every `spacing` units, what densify() and
+    # the G-code / pen plotting paths send
+    reach = arm.reach
+    strokes = [np.linspace(a, b, int(np.linalg.norm(np.subtract(b, a)) / spacing) + 1)
+               for a, b in (([-0.5 * reach, 0.4 * reach, 0], [0.5 * reach, 0.4 * reach, 0]),
+                            ([0.3 * reach, 0.3 * reach, -0.2 * reach], [0.3 * reach, 0.7 * reach, 0.1 * reach]))]
+    turns = np.linspace(0, 2 * np.pi, int(2 * np.pi * 0.2 * reach / spacing) + 1)
+    circle = np.column_stack((0.2 * reach * np.cos(turns), 0.5 * reach + 0.2 * reach * np.sin(turns),
+                              np.zeros_like(turns)))
+    return {"straight strokes": np.vstack(strokes), "circle": circle}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bytes on the wire of plain vs merged / compact step commands")
+    parser.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    parser.add_argument("--spacing", type=float, default=0.02, help="distance between path points, arm units")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="steps the merged path may be off")
+    parser.add_argument("--baud", type=int, default=9600)
+    args = parser.parse_args()
+
+    arm = kinematics.ArmModel.load(args.arm)
+    rate = args.baud / BITS_PER_BYTE
+    print(f"{'path':<17} {'format':<28} {'moves':>7} {'bytes':>9} {'s at baud':>10} {'off (steps)':>11} {'ms':>6}")
+    for name, points in _dense_paths(arm, args.spacing).items():
+        commands = arm.xyz_to_steps_batch(points, accumulator=arm.accumulator()).tolist()
+        plain = (";".join(f"A{a},B{b},C{c}" for a, b, c in commands) + "\n").encode()
+        print(f"{name:<17} {'plain A..,B..,C..':<28} {len(commands):>7} {len(plain):>9} {len(plain) / rate:>10.1f}")
+        for label, tolerance in (("merged exact", 0.0), (f"merged within {args.tolerance:g}", args.tolerance)):
+            began = time.perf_counter()
+            merged = merge_moves(commands, tolerance)
+            line = format_compact(merged)
+            elapsed = time.perf_counter() - began
+            decoded = parse_compact(line)
+            assert decoded == [m for m in merged if any(m)], "compact text round trip mismatch"
+            off, ends_on_path = max_deviation(commands, decoded)
+            assert ends_on_path and off <= tolerance + 1e-6, (off, ends_on_path)
+            print(f"{'':<17} {label + ', compact':<28} {len(merged):>7} {len(line):>9} {len(line) / rate:>10.1f}"
+                  f" {off:>11.2f} {elapsed * 1000:>6.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import collections
+import time
+
+import serial_protocol
+
+# Acknowledged streaming of commands to the Arduino.
+#
+# The Arduino only has a small serial receive buffer (64 bytes on the Uno), so a whole
+# trajectory sent as one "A..;A..;...\n" line overruns it. CommandStreamer splits what
+# it is given into frames that each fit the buffer, and only sends a frame when
+#   - fewer than `window` frames are waiting for an ack, and
+#   - the bytes of all un-acked frames plus the new one still fit in the buffer
+# so the device can never be overrun, and the link runs as fast as the device acks.
+#
+# The firmware answers every frame it has taken out of its buffer with a line :
+#   "ok"        acks the oldest frame in flight
+#   "ok <seq>"  acks every frame in flight up to and including seq
+#   "error..."  raises StreamError
+# Any other line (debug prints from the sketch) is ignored. ASCII frames are numbered
+# 0, 1, 2 ... (mod 256) in the order they are sent, binary frames carry their seq.
+#
+# It has a serial-like write(), so it can sit under serial_transport.SerialWriter :
+#   writer = serial_transport.SerialWriter(command_stream.CommandStreamer(arduino))
+
+
+class StreamError(RuntimeError):
+    pass
+
+
+class CommandStreamer:
+    def __init__(self, port, rx_buffer_size=64, window=4, ack_timeout=2.0, on_ack=None):
+        self.port = port
+        self.on_ack = on_ack  # called with the number of frames each ack releases
+        self.rx_buffer_size = rx_buffer_size
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.in_flight = []  # [(seq, size)] oldest first
+        self.seq = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.acks = 0
+        self.other_lines = collections.deque(maxlen=100)  # the latest non-ack lines, for debugging
+
+    def in_flight_bytes(self):
+        return sum(size for _, size in self.in_flight)
+
+    def split_ascii(self, data):
+        """
+        Split "A..,B..,C..;A..;...\\n" text into newline terminated frames that
+        each fit rx_buffer_size.
+        """
+        frames = []
+        for line in data.decode().splitlines():
+            current = ""
+            for command in line.split(";"):
+                candidate = f"{current};{command}" if current else command
+                if len(candidate) + 1 <= self.rx_buffer_size:
+                    current = candidate
+                    continue
+                if not current:
+                    raise ValueError(f"command {command!r} does not fit a {self.rx_buffer_size} byte buffer")
+                frames.append((current + "\n").encode())
+                current = command
+                if len(current) + 1 > self.rx_buffer_size:
+                    raise ValueError(f"command {command!r} does not fit a {self.rx_buffer_size} byte buffer")
+            if current:
+                frames.append((current + "\n").encode())
+        return frames
+
+    def split_binary(self, data):
+        """
+        Re-frame binary frames so each fits rx_buffer_size, numbered with our own seq.
+        """
+        decoder = serial_protocol.FrameDecoder()
+        moves = [cmd for _, cmds in decoder.feed(data) for cmd in cmds]
+        if decoder.dropped or decoder.buffer:
+            raise ValueError("write() got an incomplete or corrupt binary frame")
+
+        frames = []
+        start = 0
+        while start < len(moves):
+            # Largest move count that fits, for the width this chunk needs
+            count = min(len(moves) - start, serial_protocol.MAX_MOVES_PER_FRAME)
+            frame = serial_protocol.encode_frame(moves[start:start + count], self.seq + len(frames))
+            while len(frame) > self.rx_buffer_size and count > 1:
+                count = max(1, count * self.rx_buffer_size // len(frame))
+                frame = serial_protocol.encode_frame(moves[start:start + count], self.seq + len(frames))
+            if len(frame) > self.rx_buffer_size:
+                raise ValueError(f"one move does not fit a {self.rx_buffer_size} byte buffer")
+            frames.append(frame)
+            start += count
+        return frames
+
+    def write(self, data):
+        """
+        Send bytes as buffer sized frames, waiting for acks whenever the device is full.
+        Returns once the last frame is written (it may still be un-acked).
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        binary = data[:1] == bytes([serial_protocol.SYNC])
+        frames = self.split_binary(data) if binary else self.split_ascii(data)
+
+        for frame in frames:
+            while self.in_flight and (len(self.in_flight) >= self.window
+                                      or self.in_flight_bytes() + len(frame) > self.rx_buffer_size):
+                self._read_ack()
+            self.port.write(frame)
+            self.in_flight.append((self.seq, len(frame)))
+            self.seq = (self.seq + 1) & 0xFF
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+        return len(data)
+
+    def stream(self, commands, binary=False):
+        """
+        Send a whole trajectory of [a, b, c] step commands and wait until all are acked.
+        """
+        if binary:
+            frames, _ = serial_protocol.encode_frames(commands)
+            self.write(b"".join(frames))
+        else:
+            self.write(serial_protocol.format_ascii(commands))
+        self.wait_idle()
+
+    def wait_idle(self):
+        while self.in_flight:
+            self._read_ack()
+
+    def _read_ack(self):
+        deadline = time.monotonic() + self.ack_timeout
+        while time.monotonic() < deadline:
+            line = self.port.readline()
+            if not line:
+                continue
+            text = line.decode(errors="replace").strip()
+            if text.lower().startswith("error"):
+                raise StreamError(f"device reported {text!r}")
+            parts = text.split()
+            if not parts or parts[0].lower() != "ok":
+                self.other_lines.append(text)
+                continue
+            self._ack(int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None)
+            return
+        raise TimeoutError(f"no ack within {self.ack_timeout} s, {len(self.in_flight)} frames in flight")
+
+    def _ack(self, seq):
+        if seq is None and self.in_flight:
+            released = 1
+        else:
+            released = next((i + 1 for i, (frame_seq, _) in enumerate(self.in_flight) if frame_seq == seq), 0)
+        if released:
+            del self.in_flight[:released]
+            self.acks += released
+            if self.on_ack is not None:
+                self.on_ack(released)
+            return
+        self.other_lines.append(f"ok {seq}")  # stale or unknown seq
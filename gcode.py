@@ -0,0 +1,440 @@
+import argparse
+import os
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import kinematics
+import preflight
+import serial_protocol
+import serial_transport
+
+# G-code toolpaths (from CAM tools) streamed to the arm.
+#
+# Every stage is a generator and they are chained, so a file of any size goes through
+# in constant memory :
+#   lines -> parse() -> moves (x, y, z, feed, rapid, line) -> batches() -> (n, 3) point arrays
+#         -> commands() : preflight + IK + StepAccumulator -> encode() -> bytes -> SerialWriter
+# stream() runs the reading / parsing in its own thread and the IK / encoding in the
+# caller's, with bounded queues in between, and the SerialWriter thread writes to the
+# port, so parsing and IK of what comes next overlap with the transmission of what is
+# already done; the bounded queues make the slowest stage (usually the port) set the pace.
+#
+#   parser, sent, _ = gcode.stream("part.gcode", writer.send, ARM, accumulator=tracker, scale=0.1)
+#
+# Understood : G0 / G1 (modal, any of X Y Z F), G90 / G91 absolute / relative, G20 / G21
+# inches / mm, F feed rate (units/min, kept with each move), ';' and '( )' comments, N
+# line numbers and *checksums. The modal codes of the usual CAM preamble that don't change
+# a straight move (G17 - G19, G40, G49, G54, G61, G64, G80, G94) are accepted and do nothing.
+# Other G codes are refused (G2 / G3 arcs would otherwise be skipped and the arm would cut
+# straight, G28 would not go home), M / T / S words and unknown letters are ignored.
+# Coordinates are in the file's units (mm unless G20), times `scale` to get arm units,
+# plus `offset` (where the program origin is in the arm's frame).
+# Every batch goes through preflight.check_trajectory before it is encoded : a point out of
+# reach (which the IK would quietly pull onto the reach sphere) stops the stream with a
+# GcodeError naming its line. The batches before it have been sent by then.
+#
+#   python gcode.py bench --lines 1000000        # lines/s of each stage and of the whole pipeline
+#   python gcode.py send part.gcode --port /dev/ttyACM0 --scale 0.1
+
+BATCH_MOVES = 1024
+QUEUE_BATCHES = 8
+INCH = 25.4
+# Plane select, cutter / tool length compensation off, first work offset, exact stop /
+# blending, canned cycle off, feed per minute : nothing to do for straight moves
+NO_OP_CODES = {17.0, 18.0, 19.0, 40.0, 49.0, 54.0, 61.0, 61.1, 64.0, 80.0, 94.0}
+
+_WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+_PAREN_COMMENT = re.compile(r"\([^)]*\)")
+
+
+class GcodeError(ValueError):
+    def __init__(self, line_number, message):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
+
+
+class GcodeParser:
+    """
+    Modal G-code state : position, absolute / relative, units, motion mode and feed rate.
+    """
+
+    def __init__(self, start=(0.0, 0.0, 0.0), scale=1.0, offset=(0.0, 0.0, 0.0)):
+        self.scale = scale
+        self.offset = tuple(float(o) for o in offset)
+        # Kept in file units (mm), without the offset
+        self.position = [float(p) for p in start]
+        self.absolute = True
+        self.unit = 1.0   # mm per file unit, INCH after G20
+        self.rapid = False
+        self.feed = None  # file units / min
+        self.lines = 0
+        self.moves = 0
+        self.ignored = 0  # words that don't move anything (M, T, S, ...)
+
+    def parse(self, lines):
+        """
+        Yield (x, y, z, feed, rapid, line number) in arm units for every line that moves the arm.
+        """
+        scale, (ox, oy, oz) = self.scale, self.offset
+        findall = _WORD.findall
+        x, y, z = self.position
+        try:
+            for line in lines:
+                self.lines += 1
+                if ";" in line:
+                    line = line[:line.index(";")]
+                if "(" in line:
+                    line = _PAREN_COMMENT.sub(" ", line)
+                if "*" in line:
+                    line = line[:line.index("*")]
+                moved = False
+                line = line.upper()
+                words = findall(line)
+                if "G" in line:
+                    # Modes apply to the whole line, wherever the G word is on it
+                    for letter, value in words:
+                        if letter == "G":
+                            self._g_code(value)
+                for letter, value in words:
+                    # Coordinates first, they are most of the words
+                    if letter == "X":
+                        value = float(value) * self.unit
+                        x = value if self.absolute else x + value
+                        moved = True
+                    elif letter == "Y":
+                        value = float(value) * self.unit
+                        y = value if self.absolute else y + value
+                        moved = True
+                    elif letter == "Z":
+                        value = float(value) * self.unit
+                        z = value if self.absolute else z + value
+                        moved = True
+                    elif letter == "G":
+                        pass
+                    elif letter == "F":
+                        self.feed = float(value) * self.unit
+                    elif letter != "N":
+                        self.ignored += 1
+                if moved:
+                    self.moves += 1
+                    yield (x * scale + ox, y * scale + oy, z * scale + oz,
+                           self.feed * scale if self.feed is not None else None, self.rapid, self.lines)
+        finally:
+            self.position = [x, y, z]
+
+    def _g_code(self, value):
+        code = float(value)
+        if code == 0 or code == 1:
+            self.rapid = code == 0
+        elif code == 90:
+            self.absolute = True
+        elif code == 91:
+            self.absolute = False
+        elif code == 20:
+            self.unit = INCH
+        elif code == 21:
+            self.unit = 1.0
+        elif code in NO_OP_CODES:
+            pass
+        else:
+            raise GcodeError(self.lines, f"G{value} is not supported")
+
+
+def read_lines(path):
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        yield from f
+
+
+def batches(moves, size=BATCH_MOVES):
+    """
+    Group moves into (n, 3) point arrays, (n,) feed arrays (NaN for rapids and before any F)
+    and (n,) arrays of their line numbers.
+    """
+    points, feeds, lines = [], [], []
+    for x, y, z, feed, rapid, line in moves:
+        points.append((x, y, z))
+        feeds.append(feed if feed is not None and not rapid else np.nan)
+        lines.append(line)
+        if len(points) == size:
+            yield np.array(points), np.array(feeds), np.array(lines)
+            points, feeds, lines = [], [], []
+    if points:
+        yield np.array(points), np.array(feeds), np.array(lines)
+
+
+def _preflight(points, feeds, lines, arm, accumulator, max_speed):
+    # Feed moves get the step rate check when max_speed is given, NaN feeds (rapids) never fail it
+    timing = {"max_speed": max_speed, "feed_rate": feeds / 60} if max_speed is not None else {}
+    report = preflight.check_trajectory(points, arm, start=accumulator.angles(), **timing)
+    if report.ok:
+        return
+    failed = {check: indices for check, indices in report.offenders.items() if len(indices)}
+    first = min(int(indices[0]) for indices in failed.values())
+    details = ", ".join(f"{check} at lines {lines[indices[:5]].tolist()}" + (" ..." if len(indices) > 5 else "")
+                        for check, indices in failed.items())
+    raise GcodeError(int(lines[first]), f"refused by the pre-flight checks : {details}")
+
+
+def commands(point_batches, arm, accumulator=None, tolerance=None, max_speed=None):
+    """
+    Step commands ([-elbow, base, shoulder], int32) for each batch of points. Each batch is
+    checked with preflight.check_trajectory first (reach, joint limits and, with max_speed
+    in steps/s per joint, the step rate the feed rate needs), a batch that fails raises
+    GcodeError with the line of the first offender. With `tolerance` the straight lines
+    between points are densified (path_interpolation), continuing from the previous batch.
+    """
+    accumulator = accumulator or arm.accumulator()
+    if tolerance is not None:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "move_3d"))
+        import path_interpolation
+    last = None
+    for points, feeds, lines in point_batches:
+        _preflight(points, feeds, lines, arm, accumulator, max_speed)
+        if tolerance is not None:
+            if last is not None:
+                # Starts with `last`, which was sent with the previous batch
+                pieces = list(path_interpolation.iter_densify(np.vstack((last, points)), tolerance, arm.L1, arm.L2))
+                dense = np.concatenate(pieces[1:]) if len(pieces) > 1 else np.empty((0, 3))
+            else:
+                dense = path_interpolation.densify(points, tolerance, arm.L1, arm.L2)
+            last = points[-1]
+            points = dense
+        yield arm.xyz_to_steps_batch(points, accumulator=accumulator)
+
+
+def encode(command_batches, binary=False, frame_seq=0, line_moves=32):
+    """
+    (bytes, next frame sequence number) for each batch of commands : ASCII lines of
+    `line_moves` moves or binary frames.
+    """
+    for batch in command_batches:
+        if binary:
+            frames, frame_seq = serial_protocol.encode_frames(batch, frame_seq)
+            yield b"".join(frames), frame_seq
+        else:
+            rows = batch.tolist()
+            yield b"".join(serial_protocol.format_ascii(rows[i:i + line_moves])
+                           for i in range(0, len(rows), line_moves)), frame_seq
+
+
+_DONE = object()
+
+
+def threaded(iterable, maxsize=QUEUE_BATCHES):
+    """
+    Run `iterable` in a thread, at most `maxsize` items ahead of the consumer. Errors are
+    raised in the consumer, leaving the loop early stops the thread.
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # False once the consumer has left, never blocks on a queue nobody reads
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as exc:
+            put(exc)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()  # a generator reading the file closes it
+
+    thread = threading.Thread(target=produce, name="gcode-stage", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def stream(source, send, arm, accumulator=None, scale=1.0, offset=(0.0, 0.0, 0.0), tolerance=None,
+           binary=False, frame_seq=0, batch=BATCH_MOVES, max_speed=None):
+    """
+    Send a G-code file (path or iterable of lines) through `send` (e.g. SerialWriter.send).
+    Returns the parser, with its line / move counts, the bytes sent and the next frame
+    sequence number.
+    """
+    lines = read_lines(source) if isinstance(source, str) else source
+    parser = GcodeParser(scale=scale, offset=offset)
+    sent = 0
+    point_batches = threaded(batches(parser.parse(lines), batch))
+    for data, frame_seq in encode(commands(point_batches, arm, accumulator, tolerance, max_speed), binary, frame_seq):
+        send(data)
+        sent += len(data)
+    return parser, sent, frame_seq
+
+
+def synthetic(path, lines, arm, seed=0):
+    """
+    Write a CAM-like file of `lines` lines : G1 moves in mm around the arm's workspace,
+    with comments, feed changes, rapids and relative blocks.
+    """
+    rng = np.random.default_rng(seed)
+    centre = np.array([0.5, 0.0, 0.2]) * arm.reach * 10  # mm, for an arm in cm (--scale 0.1)
+    radius = 0.25 * arm.reach * 10
+    with open(path, "w") as f:
+        f.write("; synthetic toolpath\nG21 G90\nG0 X%.3f Y%.3f Z%.3f\n" % tuple(centre))
+        written = 3
+        t = 0.0
+        while written < lines:
+            block = rng.normal(0.0, 1.0, (1000, 3)).cumsum(axis=0) * 0.02
+            out = []
+            for i, (dx, dy, dz) in enumerate(block):
+                t += 0.001
+                x, y, z = centre + radius * np.array([np.cos(t * 7), np.sin(t * 5), 0.3 * np.sin(t * 3)])
+                if i % 250 == 0:
+                    out.append(f"G1 X{x:.3f} Y{y:.3f} Z{z:.3f} F{rng.integers(300, 3000)} (feed change)")
+                elif i % 97 == 0:
+                    out.append(f"G91 G1 X{dx:.3f} Y{dy:.3f}\nG90")
+                elif i % 50 == 0:
+                    out.append(f"; pass {i}")
+                else:
+                    out.append(f"X{x:.3f} Y{y:.3f} Z{z:.3f}")
+            text = "\n".join(out) + "\n"
+            f.write(text)
+            written += text.count("\n")
+
+
+class _ThrottledPort:
+    """
+    Stands in for the serial port at `baud` (0 : no limit), 10 bits per byte.
+    """
+
+    def __init__(self, baud=0):
+        self.seconds_per_byte = 10.0 / baud if baud else 0.0
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        if self.seconds_per_byte:
+            time.sleep(len(data) * self.seconds_per_byte)
+        return len(data)
+
+
+def _peak_rss_mb():
+    try:
+        import resource  # not on Windows
+    except ImportError:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stream G-code to the arm")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="lines/s on a synthetic file")
+    bench.add_argument("--lines", type=int, default=1_000_000)
+    bench.add_argument("--baud", type=int, default=0, help="throttle the stand-in port, 0 for no limit")
+    send = sub.add_parser("send")
+    send.add_argument("path")
+    send.add_argument("--port", default=os.environ.get("ARDUINO_PORT"))
+    send.add_argument("--baud", type=int, default=9600)
+    for p in (bench, send):
+        p.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+        p.add_argument("--scale", type=float, default=0.1, help="arm units per mm")
+        p.add_argument("--offset", type=float, nargs=3, default=(0.0, 0.0, 0.0))
+        p.add_argument("--tolerance", type=float, help="densify the lines to this tip deviation")
+        p.add_argument("--binary", action="store_true")
+    args = parser.parse_args()
+    arm = kinematics.ArmModel.load(args.arm)
+
+    if args.command == "send":
+        import serial
+
+        port = serial.Serial(args.port, args.baud, timeout=1)
+        time.sleep(2)  # board reset
+        writer = serial_transport.SerialWriter(port, maxsize=QUEUE_BATCHES, policy="block")
+        start = time.perf_counter()
+        try:
+            state, sent, _ = stream(args.path, writer.send, arm, scale=args.scale, offset=args.offset,
+                                    tolerance=args.tolerance, binary=args.binary)
+        finally:
+            writer.close()
+            port.close()
+        print(f"{state.lines} lines, {state.moves} moves, {sent} bytes in {time.perf_counter() - start:.1f} s")
+        return
+
+    path = os.path.join(tempfile.gettempdir(), f"gcode_bench_{args.lines}.gcode")
+    if not os.path.exists(path):
+        synthetic(path, args.lines, arm)
+    size = os.path.getsize(path)
+    print(f"{path} : {size / 1e6:.0f} MB")
+    rss_before = _peak_rss_mb()
+
+    def timed(label, run):
+        start = time.perf_counter()
+        state, sent = run()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<34} {state.lines / elapsed / 1e3:>7.0f} k lines/s  {elapsed:6.2f} s")
+        return elapsed
+
+    def parse_only():
+        state = GcodeParser()
+        for _ in state.parse(read_lines(path)):
+            pass
+        return state, 0
+
+    def ik_only():
+        state = GcodeParser(scale=args.scale, offset=args.offset)
+        for _ in commands(batches(state.parse(read_lines(path))), arm, tolerance=args.tolerance):
+            pass
+        return state, 0
+
+    def encode_only():
+        state = GcodeParser(scale=args.scale, offset=args.offset)
+        sent = 0
+        for data, _ in encode(commands(batches(state.parse(read_lines(path))), arm, tolerance=args.tolerance),
+                              args.binary):
+            sent += len(data)
+        return state, sent
+
+    def pipeline(baud):
+        def run():
+            port = _ThrottledPort(baud)
+            writer = serial_transport.SerialWriter(port, maxsize=QUEUE_BATCHES, policy="block")
+            state, sent, _ = stream(path, writer.send, arm, scale=args.scale, offset=args.offset,
+                                    tolerance=args.tolerance, binary=args.binary)
+            writer.close()
+            return state, sent
+        return run
+
+    timed("parse", parse_only)
+    timed("parse + preflight + IK", ik_only)
+    serial_stages = timed("all stages, one thread", encode_only)
+    timed("stream() to a null port", pipeline(0))
+    if args.baud:
+        # What the port alone needs, against the pipeline feeding it
+        state, sent = encode_only()
+        wire = sent * 10.0 / args.baud
+        total = timed(f"stream() to a {args.baud} baud port", pipeline(args.baud))
+        print(f"  the port alone needs {wire:.2f} s and the stages {serial_stages:.2f} s : "
+              f"{wire + serial_stages:.2f} s one after the other, {total:.2f} s overlapped")
+    print(f"peak RSS {rss_before:.0f} MB before the runs, {_peak_rss_mb():.0f} MB after")
+
+
+if __name__ == '__main__':
+    main()
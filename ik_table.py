@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import math
+import os
+import time
+
+import numpy as np
+
+import kinematics
+
+# Precomputed inverse kinematics, looked up instead of solved.
+#
+# Both arms come down to the same planar 2-link problem : two_D_UI solves it for the
+# mouse position, the 3D arm for (r, z) once the base angle atan2(y, x) is taken out.
+# IKTable holds the two joint angles of that planar solve on a regular grid, saved once
+# as a .npy file named after the arm geometry and the grid, and memory mapped on later
+# runs, so a warm start only maps the file. Queries are bilinear interpolation between
+# the four surrounding grid points, constant time whatever the grid size.
+#
+# For this closed form 2-link solve the table is not faster : python ik_table.py measures
+# a scalar 3D lookup at about 2x the math solve and a batch at several times numpy
+# planar_ik, so the UIs solve the IK directly. The table is for IK that costs more than the lookup (more
+# links, joint limits solved numerically) behind the same lookup() interface.
+#
+#   table = ik_table.for_3d_arm(L1=10, L2=10, resolution=0.05)
+#   theta1, theta2, theta3 = ik_table.inverse_kinematics_3d(table, x, y, z)
+#
+#   table = ik_table.IKTable.load_or_build(180, 120, (-300, 300), (-300, 300), 1.0)
+#   theta1, theta2 = table.lookup(rel_x, rel_y)      # (None, None) out of reach
+#
+# Points beyond reach store the solution of the closest reachable point, so the grid is
+# continuous right up to the boundary; lookup() still reports them as out of reach.
+# The first joint angle is atan2(v, u) minus an offset that only depends on the distance,
+# and atan2 jumps by 2 pi across the -u axis, so the table stores the offset and queries
+# add atan2 back : blending the angles themselves would average across the jump.
+# Step counts are the angles times a constant (angle_to_step), so they are not stored.
+
+FORMAT_VERSION = 2
+
+
+def default_cache_dir():
+    return os.environ.get("ARM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "robotic_arm"))
+
+
+def planar_ik(u, v, L1, L2):
+    """
+    inverse_kinematics2D on arrays. Out of reach points are pulled back onto the reach
+    circle and points too close to the shoulder get the folded solution, no None / errors.
+    """
+    dist = np.sqrt(u**2 + v**2)
+    scale = np.where(dist > L1 + L2, (L1 + L2) / np.where(dist > 0, dist, 1), 1.0)
+    u = u * scale
+    v = v * scale
+    cos_angle2 = np.clip((u**2 + v**2 - L1**2 - L2**2) / (2 * L1 * L2), -1.0, 1.0)
+    theta2 = np.arccos(cos_angle2)
+    k1 = L1 + L2 * cos_angle2
+    k2 = L2 * np.sin(theta2)
+    theta1 = np.arctan2(v, u) - np.arctan2(k2, k1)
+    return theta1, theta2
+
+
+class IKTable:
+    def __init__(self, angles, L1, L2, u_min, v_min, resolution):
+        self.angles = angles  # (nu, nv, 2) float32 offset, theta2, usually a read only memmap
+        self.L1 = L1
+        self.L2 = L2
+        self.reach_sq = (L1 + L2) ** 2
+        self.u_min = u_min
+        self.v_min = v_min
+        self.resolution = resolution
+        self.nu, self.nv = angles.shape[:2]
+        # Flat float view : indexing a memoryview gives python floats without numpy overhead
+        self._flat = memoryview(np.ascontiguousarray(angles).reshape(-1))
+        self._scale = 1.0 / resolution
+        self._row = 2 * self.nv  # floats per u step in _flat
+
+    @staticmethod
+    def cache_path(L1, L2, u_range, v_range, resolution, cache_dir=None):
+        key = repr((FORMAT_VERSION, float(L1), float(L2), tuple(map(float, u_range)),
+                    tuple(map(float, v_range)), float(resolution)))
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return os.path.join(cache_dir or default_cache_dir(), f"ik_L1_{L1}_L2_{L2}_{digest}.npy")
+
+    @classmethod
+    def build(cls, L1, L2, u_range, v_range, resolution):
+        u = np.arange(round((u_range[1] - u_range[0]) / resolution) + 1) * resolution + u_range[0]
+        v = np.arange(round((v_range[1] - v_range[0]) / resolution) + 1) * resolution + v_range[0]
+        uu, vv = np.meshgrid(u, v, indexing="ij")
+        theta1, theta2 = planar_ik(uu, vv, L1, L2)
+        angles = np.stack((np.arctan2(vv, uu) - theta1, theta2), axis=-1).astype(np.float32)
+        return cls(angles, L1, L2, u_range[0], v_range[0], resolution)
+
+    @classmethod
+    def load_or_build(cls, L1, L2, u_range, v_range, resolution, cache_dir=None):
+        """
+        Memory map the table for this geometry, building and saving it on first use.
+        """
+        path = cls.cache_path(L1, L2, u_range, v_range, resolution, cache_dir)
+        if not os.path.exists(path):
+            table = cls.build(L1, L2, u_range, v_range, resolution)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, table.angles)
+            os.replace(tmp, path)  # other processes never see half a file
+        return cls(np.load(path, mmap_mode="r"), L1, L2, u_range[0], v_range[0], resolution)
+
+    def lookup(self, u, v):
+        """
+        Planar joint angles for one point, (None, None) when out of reach like inverse_kinematics2D.
+        """
+        if u * u + v * v > self.reach_sq:
+            return None, None
+        return self.interpolate(u, v)
+
+    def interpolate(self, u, v):
+        # Plain float and index math, no numpy and no builtin calls per query
+        fu = (u - self.u_min) * self._scale
+        fv = (v - self.v_min) * self._scale
+        i = int(fu) if fu > 0 else 0
+        j = int(fv) if fv > 0 else 0
+        if i > self.nu - 2:
+            i = self.nu - 2
+        if j > self.nv - 2:
+            j = self.nv - 2
+        du = fu - i
+        dv = fv - j
+        du = 0.0 if du < 0 else 1.0 if du > 1 else du
+        dv = 0.0 if dv < 0 else 1.0 if dv > 1 else dv
+        a = self._flat
+        k = i * self._row + 2 * j
+        offset0 = a[k] + (a[k + 2] - a[k]) * dv
+        theta0 = a[k + 1] + (a[k + 3] - a[k + 1]) * dv
+        k += self._row
+        offset1 = a[k] + (a[k + 2] - a[k]) * dv
+        theta1 = a[k + 1] + (a[k + 3] - a[k + 1]) * dv
+        return math.atan2(v, u) - (offset0 + (offset1 - offset0) * du), theta0 + (theta1 - theta0) * du
+
+    def interpolate_batch(self, u, v):
+        """
+        Bilinear interpolation for arrays of points, returns two arrays (no reach check).
+        """
+        u = np.asarray(u, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        fu = (u - self.u_min) / self.resolution
+        fv = (v - self.v_min) / self.resolution
+        i = np.clip(fu.astype(np.int64), 0, self.nu - 2)
+        j = np.clip(fv.astype(np.int64), 0, self.nv - 2)
+        du = np.clip(fu - i, 0.0, 1.0)[..., None]
+        dv = np.clip(fv - j, 0.0, 1.0)[..., None]
+        a = self.angles
+        result = (a[i, j] * ((1 - du) * (1 - dv)) + a[i + 1, j] * (du * (1 - dv))
+                  + a[i, j + 1] * ((1 - du) * dv) + a[i + 1, j + 1] * (du * dv))
+        return np.arctan2(v, u) - result[..., 0], result[..., 1]
+
+
+def for_3d_arm(L1=10, L2=10, resolution=0.05, cache_dir=None):
+    """
+    The (r, z) table the 3D arm needs : r from 0 to the reach, z from -reach to reach.
+    """
+    reach = L1 + L2
+    return IKTable.load_or_build(L1, L2, (0, reach), (-reach, reach), resolution, cache_dir)
+
+
+def inverse_kinematics_3d(table, x, y, z):
+    """
+    Lookup version of xy_to_step_3D.inverse_kinematics : theta1 (base), theta2, theta3.
+    """
+    r = math.sqrt(x * x + y * y)
+    d = math.sqrt(r * r + z * z)
+    if d * d > table.reach_sq:  # same rescaling onto the reach sphere as the solver
+        scale = (table.L1 + table.L2) / d
+        r *= scale
+        z *= scale
+    theta2, theta3 = table.interpolate(r, z)
+    return math.atan2(y, x), theta2, theta3
+
+
+def inverse_kinematics_3d_batch(table, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    r = np.sqrt(x**2 + y**2)
+    d = np.sqrt(r**2 + z**2)
+    scale = np.where(d**2 > table.reach_sq, (table.L1 + table.L2) / np.where(d > 0, d, 1), 1.0)
+    theta2, theta3 = table.interpolate_batch(r * scale, z * scale)
+    return np.arctan2(y, x), theta2.astype(np.float64), theta3.astype(np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build / check the 3D IK lookup table")
+    parser.add_argument("--L1", type=float, default=10)
+    parser.add_argument("--L2", type=float, default=10)
+    parser.add_argument("--resolution", type=float, default=0.05)
+    parser.add_argument("--queries", type=int, default=100000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = for_3d_arm(args.L1, args.L2, args.resolution)
+    print(f"load / build {time.perf_counter() - start:.4f} s, {table.angles.nbytes / 1e6:.1f} MB")
+    start = time.perf_counter()
+    table = for_3d_arm(args.L1, args.L2, args.resolution)
+    print(f"warm load {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    # Accuracy against the exact solution, away from the singular inner / outer limits
+    rng = np.random.default_rng(0)
+    reach, inner = args.L1 + args.L2, abs(args.L1 - args.L2)
+    direction = rng.normal(size=(args.queries, 3))
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    points = direction * rng.uniform(inner + 0.02 * reach, 0.98 * reach, size=(args.queries, 1))
+    r = np.hypot(points[:, 0], points[:, 1])
+    exact = np.stack(planar_ik(r, points[:, 2], args.L1, args.L2), axis=1)
+    looked_up = np.stack(inverse_kinematics_3d_batch(table, points)[1:], axis=1)
+    error = np.degrees(np.abs(exact - looked_up)).max(axis=1)
+    print(f"angle error deg : p50 {np.percentile(error, 50):.5f}  p99 {np.percentile(error, 99):.5f}  "
+          f"max {error.max():.5f}")
+
+    # Against the closed form solvers the scripts use : plain math on floats, numpy on arrays
+    start = time.perf_counter()
+    for x, y, z in points[:10000].tolist():
+        inverse_kinematics_3d(table, x, y, z)
+    lookup = (time.perf_counter() - start) / 10000
+    start = time.perf_counter()
+    for x, y, z in points[:10000].tolist():
+        kinematics.inverse_kinematics_3d(x, y, z, args.L1, args.L2)
+    solve = (time.perf_counter() - start) / 10000
+    print(f"scalar : lookup {lookup * 1e6:.2f} us / point, math solve {solve * 1e6:.2f} us, "
+          f"lookup / solve {lookup / solve:.2f}")
+    start = time.perf_counter()
+    inverse_kinematics_3d_batch(table, points)
+    lookup = time.perf_counter() - start
+    start = time.perf_counter()
+    planar_ik(r, points[:, 2], args.L1, args.L2)
+    solve = time.perf_counter() - start
+    print(f"batch  : lookup {lookup * 1e3:.2f} ms / {args.queries} points, planar_ik {solve * 1e3:.2f} ms, "
+          f"lookup / solve {lookup / solve:.2f}")
+
+
+if __name__ == '__main__':
+    main()
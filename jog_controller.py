@@ -0,0 +1,199 @@
+import argparse
+import threading
+import time
+
+# Keyboard jogging that sends one combined command per tick instead of one per key event.
+#
+# With keyboard.on_press every OS auto-repeat event (about 30 a second while a key is held)
+# becomes its own serial command, so holding a key queues more motion than the arm can do,
+# it keeps going long after the key is released, and two keys held together send two
+# interleaved streams. JogController instead keeps track of which keys are down and,
+# every `interval` seconds, sends the motion of all held keys as one [a, b, c] command :
+#   - a new press sends tap_steps straight away, like one event did before
+#   - a held key then moves at `speed` steps/s, ramping up to max_speed over ramp_time,
+#     give max_speed the motor's speed or the queued steps outrun it and the arm keeps going
+#   - auto-repeat events of a held key are ignored, opposite keys cancel out
+#   - once every key is up nothing more is sent, so at most one tick of motion is queued
+#
+#   jog = JogController(lambda cmd: send_commands_to_arduino([cmd]), tap_steps=100, max_speed=min(MAX_SPEED))
+#   jog.start()
+#   keyboard.hook(jog.handle_event)        # gets both presses and releases
+#   ...
+#   jog.stop()
+
+# key name -> (axis, direction), the arrows and < > like handle_keypress
+JOG_KEYS = {
+    'up': (0, 1), 'down': (0, -1),
+    'left': (1, 1), 'right': (1, -1),
+    'comma': (2, 1), 'period': (2, -1),
+}
+
+
+class JogController:
+    def __init__(self, send, tap_steps=100, speed=None, max_speed=None, ramp_time=1.5,
+                 interval=0.1, keymap=JOG_KEYS, n_axes=3, clock=time.monotonic):
+        self.send = send
+        self.tap_steps = tap_steps
+        self.speed = speed if speed is not None else 5 * tap_steps               # steps/s
+        self.max_speed = max_speed if max_speed is not None else 4 * self.speed  # steps/s
+        self.speed = min(self.speed, self.max_speed)
+        self.ramp_time = ramp_time
+        self.interval = interval
+        self.keymap = keymap
+        self.clock = clock
+        self.commands_sent = 0
+        self.events = 0
+        self._pending = [0.0] * n_axes  # steps owed per axis, the fraction carries to the next tick
+        self._pressed = {}              # key -> time its continuous motion starts
+        self._since = {}                # key -> time its motion was last added to _pending
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def velocity(self, held_for):
+        """
+        Jog speed in steps/s after holding a key for `held_for` seconds.
+        """
+        if self.ramp_time <= 0:
+            return self.max_speed
+        return self.speed + (self.max_speed - self.speed) * min(1.0, held_for / self.ramp_time)
+
+    def _advance(self, key, now):
+        start = self._since[key]
+        if now <= start:
+            return
+        axis, direction = self.keymap[key]
+        # The speed changes linearly during the ramp, the midpoint gives its mean
+        steps = self.velocity((start + now) / 2 - self._pressed[key]) * (now - start)
+        self._pending[axis] += direction * steps
+        self._since[key] = now
+
+    def press(self, key, now=None):
+        """
+        Key went down, returns False for keys that don't jog.
+        """
+        if key not in self.keymap:
+            return False
+        now = self.clock() if now is None else now
+        with self._lock:
+            self.events += 1
+            if key in self._pressed:  # repeats of a held key change nothing
+                return True
+            axis, direction = self.keymap[key]
+            self._pending[axis] += direction * self.tap_steps
+            # Continuous motion takes over once the tap would have been done at `speed`
+            self._pressed[key] = self._since[key] = now + self.tap_steps / self.speed
+        self.tick(now)
+        return True
+
+    def release(self, key, now=None):
+        if key not in self.keymap:
+            return False
+        now = self.clock() if now is None else now
+        with self._lock:
+            self.events += 1
+            if key in self._pressed:
+                self._advance(key, now)
+                del self._pressed[key], self._since[key]
+                axis = self.keymap[key][0]
+                if not any(self.keymap[k][0] == axis for k in self._pressed):
+                    self._pending[axis] = float(round(self._pending[axis]))
+        return True
+
+    def handle_event(self, event):
+        """
+        keyboard.hook callback, events have .name and .event_type 'down' / 'up'.
+        """
+        if event.event_type == 'down':
+            self.press(event.name)
+        else:
+            self.release(event.name)
+
+    def tick(self, now=None):
+        """
+        Send the motion gathered since the last tick as one command, returns it (None if idle).
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            for key in self._pressed:
+                self._advance(key, now)
+            command = [int(p) for p in self._pending]  # whole steps, toward zero
+            self._pending = [p - c for p, c in zip(self._pending, command)]
+        if not any(command):
+            return None
+        self.commands_sent += 1
+        self.send(command)
+        return command
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="jog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the ticking thread, sending whatever motion is still owed.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.tick()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.tick()
+
+
+def simulate_hold(hold, repeat_delay, repeat_rate, tap_steps, arm_speed, interval):
+    """
+    Hold 'up' for `hold` seconds with OS auto-repeat, per-event commands against the controller.
+    Returns (commands, bytes, steps, seconds the arm keeps moving after release) for both.
+    """
+    press_times = [0.0]
+    t = repeat_delay
+    while t < hold:
+        press_times.append(t)
+        t += 1 / repeat_rate
+
+    def stats(commands):
+        sent = sum(len(f"A{c[0]},B{c[1]},C{c[2]}\n") for c in commands)
+        steps = sum(abs(c[0]) for c in commands)
+        return len(commands), sent, steps, max(0.0, steps / arm_speed - hold)
+
+    per_event = [[tap_steps, 0, 0] for _ in press_times]
+
+    sent = []
+    jog = JogController(sent.append, tap_steps=tap_steps, max_speed=arm_speed, interval=interval)
+    events = [(p, "press") for p in press_times] + [(hold, "release")]
+    ticks = [i * interval for i in range(1, int(hold / interval) + 2)]
+    for when, kind in sorted(events + [(tick, "tick") for tick in ticks], key=lambda e: (e[0], e[1] != "tick")):
+        if kind == "press":
+            jog.press("up", when)
+        elif kind == "release":
+            jog.release("up", when)
+        else:
+            jog.tick(when)
+    return stats(per_event), stats(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per key event commands against the jog controller")
+    parser.add_argument("--hold", type=float, default=2.0, help="seconds the key is held")
+    parser.add_argument("--repeat-delay", type=float, default=0.5)
+    parser.add_argument("--repeat-rate", type=float, default=30.0, help="auto-repeat events/s")
+    parser.add_argument("--tap-steps", type=int, default=100)
+    parser.add_argument("--arm-speed", type=float, default=800.0, help="steps/s the motor can do, the jog's max_speed")
+    parser.add_argument("--interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    old, new = simulate_hold(args.hold, args.repeat_delay, args.repeat_rate, args.tap_steps,
+                             args.arm_speed, args.interval)
+    print(f"holding a key {args.hold} s :")
+    for name, (commands, sent, steps, overrun) in (("per event", old), ("jog", new)):
+        print(f"  {name:<10} {commands:>4} commands {sent:>5} bytes {steps:>6} steps, "
+              f"still moving {overrun:.2f} s after release")
+
+
+if __name__ == '__main__':
+    main()
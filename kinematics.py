@@ -0,0 +1,520 @@
+import json
+import math
+import os
+
+# Arm kinematics and step conversion with nothing but the standard library.
+#
+# xy_to_step_3D needs numpy, two_D_UI pygame and three_D_UI dash / plotly, all at import
+# time, which is most of a second before a batch job or a worker can do anything. This
+# module imports in well under a millisecond : the scalar functions use math, and numpy
+# is only imported by the *_batch functions, the first time one is called.
+#
+#   import kinematics
+#   theta1, theta2, theta3 = kinematics.inverse_kinematics_3d(x, y, z, L1=21, L2=15)
+#   commands = kinematics.xyz_to_steps(curve)                 # [-elbow, shoulder1, shoulder2]
+#   commands = kinematics.xyz_to_steps_batch(points)          # (N, 3) int32, numpy
+#
+# The results match xy_to_step_3D / two_D_UI, python bench_import.py times the imports.
+#
+# ArmModel bundles one arm's geometry and gearing, read from arm_config.json (ARM_CONFIG
+# overrides the path), with everything derived from them computed once :
+#   arm = kinematics.ArmModel.load("arm_3d")
+#   arm.ik_3d(x, y, z), arm.fk_3d(*angles), arm.jacobian_3d(*angles), arm.steps(angles)
+#   arm.xyz_to_steps(curve)
+#   arm.ik_3d_batch(points), arm.xyz_to_steps_batch(points), arm.within_limits_batch(angles)
+#
+# Every reachable point has several joint solutions : elbow up or down, the base turned
+# half a turn with the arm reaching back over the top, and the base angle plus any number
+# of full turns. ik_3d_batch always takes the same one, so crossing the -x axis turns the
+# base almost a full revolution. plan_ik() picks, along the whole trajectory, the sequence
+# of solutions with the least weighted step travel (or move time) from the current pose :
+#   angles = arm.plan_ik(points, start=tracker.angles())
+#   commands = arm.xyz_to_steps_min_travel(points, accumulator=tracker)
+
+STEPS_PER_REV_3D = (2500, 2500, 2500)
+STEPS_PER_REV_2D = (2200, 5000)
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arm_config.json")
+
+
+def inverse_kinematics_2d(x, y, L1, L2):
+    """
+    Planar 2-link IK, (theta1, theta2) in radians, (None, None) out of reach.
+    """
+    dist = math.sqrt(x * x + y * y)
+    if dist > (L1 + L2):
+        return None, None
+    cos_angle2 = (x * x + y * y - L1 * L1 - L2 * L2) / (2 * L1 * L2)
+    theta2 = math.acos(cos_angle2)
+    k1 = L1 + L2 * cos_angle2
+    k2 = L2 * math.sin(theta2)
+    theta1 = math.atan2(y, x) - math.atan2(k2, k1)
+    return theta1, theta2
+
+
+def forward_kinematics_2d(theta1, theta2, L1, L2, origin=(0, 0)):
+    """
+    Elbow and tip positions, like two_D_UI.get_joint_positions.
+    """
+    elbow_x = origin[0] + L1 * math.cos(theta1)
+    elbow_y = origin[1] + L1 * math.sin(theta1)
+    tip_x = elbow_x + L2 * math.cos(theta1 + theta2)
+    tip_y = elbow_y + L2 * math.sin(theta1 + theta2)
+    return (elbow_x, elbow_y), (tip_x, tip_y)
+
+
+def angle_to_step_2d(angle1, angle2, steps_per_rev_1=2200, steps_per_rev_2=5000):
+    """
+    Degrees to steps, truncated like two_D_UI.angle_to_step.
+    """
+    return int((angle1 * steps_per_rev_1) / 360), int((angle2 * steps_per_rev_2) / 360)
+
+
+def inverse_kinematics_3d(x, y, z, L1=10, L2=10):
+    """
+    Base angle and planar solve on (r, z), like xy_to_step_3D.inverse_kinematics.
+    (None, None) for the two arm joints when the point is out of reach.
+    """
+    r = math.sqrt(x * x + y * y)
+    theta1 = math.atan2(y, x)
+    theta2, theta3 = inverse_kinematics_2d(r, z, L1, L2)
+    return theta1, theta2, theta3
+
+
+def forward_kinematics_3d(theta1, theta2, theta3, L1=10, L2=10):
+    """
+    Elbow and wrist (x, y, z) tuples.
+    """
+    elbow_x = L1 * math.cos(theta1) * math.cos(theta2)
+    elbow_y = L1 * math.sin(theta1) * math.cos(theta2)
+    elbow_z = L1 * math.sin(theta2)
+    wrist_x = elbow_x + L2 * math.cos(theta1) * math.cos(theta2 + theta3)
+    wrist_y = elbow_y + L2 * math.sin(theta1) * math.cos(theta2 + theta3)
+    wrist_z = elbow_z + L2 * math.sin(theta2 + theta3)
+    return (elbow_x, elbow_y, elbow_z), (wrist_x, wrist_y, wrist_z)
+
+
+def jacobian_3d(theta1, theta2, theta3, L1=10, L2=10):
+    """
+    Analytic Jacobian of the forward_kinematics_3d wrist : 3 rows (d/dx, d/dy, d/dz) of
+    the derivatives by theta1, theta2, theta3, in length units per radian.
+    """
+    c1, s1 = math.cos(theta1), math.sin(theta1)
+    c23, s23 = math.cos(theta2 + theta3), math.sin(theta2 + theta3)
+    r = L1 * math.cos(theta2) + L2 * c23   # distance from the base axis
+    h = L1 * math.sin(theta2) + L2 * s23   # height
+    return ((-s1 * r, -c1 * h, -c1 * L2 * s23),
+            (c1 * r, -s1 * h, -s1 * L2 * s23),
+            (0.0, r, L2 * c23))
+
+
+def angle_to_step_3d(angle1, angle2, angle3, steps_per_rev=STEPS_PER_REV_3D):
+    """
+    Radians to steps, truncated like xy_to_step_3D.angle_to_step.
+    """
+    return tuple(int((math.degrees(angle) * spr) / 360) for angle, spr in zip((angle1, angle2, angle3), steps_per_rev))
+
+
+def xyz_to_steps(curve, L1=21, L2=15, accumulator=None, steps_per_rev=STEPS_PER_REV_3D):
+    """
+    Relative [-elbow, shoulder1, shoulder2] step commands through the points of `curve`,
+    starting from zero angles, like xy_to_step_3D.xyz_to_steps.
+    """
+    commands = []
+    current = (0.0, 0.0, 0.0)
+    for x, y, z in curve:
+        angles = inverse_kinematics_3d(x, y, z, L1, L2)
+        if accumulator is not None:
+            step1, step2, step3 = accumulator.to_steps(*angles)
+        else:
+            step1, step2, step3 = angle_to_step_3d(*(a - c for a, c in zip(angles, current)), steps_per_rev)
+            current = angles
+        commands.append([-step3, step1, step2])
+    return commands
+
+
+def inverse_kinematics_batch(points, L1=10, L2=10):
+    """
+    Vectorized inverse_kinematics_3d for an (N,3) array of x, y, z points.
+    Returns theta1, theta2, theta3 as three (N,) arrays in radians.
+    Unreachable points are pulled back onto the reachable sphere.
+    """
+    import numpy as np
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    r = np.sqrt(x**2 + y**2)  # Projection in the xy-plane
+    d = np.sqrt(r**2 + z**2)  # Distance in 3D space
+
+    # Check for reachability, scale r and z together so the 2D solve stays valid
+    scale = np.where(d > (L1 + L2), (L1 + L2) / np.where(d > 0, d, 1), 1.0)
+    r = r * scale
+    z = z * scale
+
+    theta1 = np.arctan2(y, x)
+
+    # Same as inverse_kinematics_2d but on whole arrays
+    cos_angle2 = (r**2 + z**2 - L1**2 - L2**2) / (2 * L1 * L2)
+    cos_angle2 = np.clip(cos_angle2, -1.0, 1.0)  # Handle numerical errors for acos
+    theta3 = np.arccos(cos_angle2)
+    k1 = L1 + L2 * cos_angle2
+    k2 = L2 * np.sin(theta3)
+    theta2 = np.arctan2(z, r) - np.arctan2(k2, k1)
+    return theta1, theta2, theta3
+
+
+def xyz_to_steps_batch(curve, L1=21, L2=15, steps_per_rev=STEPS_PER_REV_3D, accumulator=None):
+    """
+    Vectorized version of xyz_to_steps for large curves.
+    Takes an (N,3) array of x, y, z points and returns an (N,3) int32 array of
+    relative step commands in the same [-elbow, shoulder1, shoulder2] order.
+    With an accumulator, steps come from its absolute counts as in xyz_to_steps.
+    """
+    import numpy as np
+
+    theta1, theta2, theta3 = inverse_kinematics_batch(curve, L1, L2)
+    angles = np.stack((theta1, theta2, theta3), axis=1)
+
+    if accumulator is not None:
+        steps = accumulator.to_steps_batch(angles)
+    else:
+        # Relative movement from the previous point, starting from 0 angles
+        deltas = np.diff(angles, axis=0, prepend=np.zeros((1, 3)))
+
+        # Convert the angle differences to steps, int() truncation like angle_to_step
+        steps = np.trunc(np.degrees(deltas) * np.asarray(steps_per_rev, dtype=np.float64) / 360)
+        steps = steps.astype(np.int32)
+
+    commands = np.empty_like(steps)
+    commands[:, 0] = -steps[:, 2]
+    commands[:, 1] = steps[:, 0]
+    commands[:, 2] = steps[:, 1]
+    return commands
+
+
+
+def random_curve(n, L1=21, L2=15, seed=0):
+    """
+    (N, 3) random reachable points, kept away from the inner and outer workspace limits,
+    the test load of the benchmarks and multi_arm.py.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(n, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    radius = rng.uniform(abs(L1 - L2) + 1, L1 + L2 - 1, size=(n, 1))
+    return directions * radius
+
+
+class ArmModel:
+    """
+    Geometry and gearing of one arm, immutable. Angles are radians, joints are in the
+    order of steps_per_rev : base, shoulder, elbow for the 3D arm, shoulder, elbow in 2D.
+    """
+
+    __slots__ = ("name", "L1", "L2", "steps_per_rev", "joint_limits", "reach", "reach_sq", "L1_sq",
+                 "L2_sq", "two_L1_L2", "steps_per_rad")
+
+    def __init__(self, L1, L2, steps_per_rev, joint_limits=None, name="arm"):
+        steps_per_rev = tuple(float(s) for s in steps_per_rev)
+        if joint_limits is None:
+            joint_limits = ((-math.inf, math.inf),) * len(steps_per_rev)
+        joint_limits = tuple((float(low), float(high)) for low, high in joint_limits)
+        if len(joint_limits) != len(steps_per_rev):
+            raise ValueError(f"{name} : {len(steps_per_rev)} joints but {len(joint_limits)} joint limits")
+        values = {
+            "name": name, "L1": float(L1), "L2": float(L2), "steps_per_rev": steps_per_rev,
+            "joint_limits": joint_limits, "reach": float(L1 + L2), "reach_sq": float((L1 + L2) ** 2),
+            "L1_sq": float(L1 * L1), "L2_sq": float(L2 * L2), "two_L1_L2": float(2 * L1 * L2),
+            "steps_per_rad": tuple(s / (2 * math.pi) for s in steps_per_rev),
+        }
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"ArmModel is immutable, can't set {key}")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"ArmModel is immutable, can't delete {key}")
+
+    def __repr__(self):
+        return f"ArmModel(name={self.name!r}, L1={self.L1}, L2={self.L2}, steps_per_rev={self.steps_per_rev})"
+
+    @classmethod
+    def from_dict(cls, config, name="arm"):
+        limits = config.get("joint_limits_deg")
+        if limits is not None:
+            limits = [(math.radians(low), math.radians(high)) for low, high in limits]
+        return cls(config["L1"], config["L2"], config["steps_per_rev"], limits, name)
+
+    @classmethod
+    def load(cls, name, path=None):
+        """
+        The arm called `name` in the config file (ARM_CONFIG, default arm_config.json).
+        """
+        path = path or os.environ.get("ARM_CONFIG", DEFAULT_CONFIG)
+        with open(path) as f:
+            config = json.load(f)
+        if name not in config:
+            raise KeyError(f"no arm {name!r} in {path}, have {sorted(config)}")
+        return cls.from_dict(config[name], name)
+
+    # Scalar, plain floats
+
+    def ik_2d(self, u, v):
+        """
+        Planar solve, (None, None) out of reach like inverse_kinematics_2d.
+        """
+        dist_sq = u * u + v * v
+        if dist_sq > self.reach_sq:
+            return None, None
+        cos_angle2 = (dist_sq - self.L1_sq - self.L2_sq) / self.two_L1_L2
+        theta2 = math.acos(cos_angle2)
+        theta1 = math.atan2(v, u) - math.atan2(self.L2 * math.sin(theta2), self.L1 + self.L2 * cos_angle2)
+        return theta1, theta2
+
+    def fk_2d(self, theta1, theta2, origin=(0, 0)):
+        return forward_kinematics_2d(theta1, theta2, self.L1, self.L2, origin)
+
+    def ik_3d(self, x, y, z):
+        theta2, theta3 = self.ik_2d(math.sqrt(x * x + y * y), z)
+        return math.atan2(y, x), theta2, theta3
+
+    def fk_3d(self, theta1, theta2, theta3):
+        return forward_kinematics_3d(theta1, theta2, theta3, self.L1, self.L2)
+
+    def jacobian_3d(self, theta1, theta2, theta3):
+        return jacobian_3d(theta1, theta2, theta3, self.L1, self.L2)
+
+    def steps(self, angles):
+        """
+        Joint angles to steps, truncated toward zero like the angle_to_step functions.
+        """
+        return [int(angle * k) for angle, k in zip(angles, self.steps_per_rad)]
+
+    def angles(self, steps):
+        return [s / k for s, k in zip(steps, self.steps_per_rad)]
+
+    def within_limits(self, angles):
+        return all(low <= angle <= high for angle, (low, high) in zip(angles, self.joint_limits))
+
+    def accumulator(self, start_angles=None):
+        import step_accumulator
+
+        return step_accumulator.StepAccumulator(self.steps_per_rev, start_angles)
+
+    def xyz_to_steps(self, curve, accumulator=None):
+        """
+        kinematics.xyz_to_steps for this arm : [-elbow, base, shoulder] commands.
+        """
+        commands = []
+        current = (0.0, 0.0, 0.0)
+        for x, y, z in curve:
+            angles = self.ik_3d(x, y, z)
+            if accumulator is not None:
+                step1, step2, step3 = accumulator.to_steps(*angles)
+            else:
+                step1, step2, step3 = self.steps([a - c for a, c in zip(angles, current)])
+                current = angles
+            commands.append([-step3, step1, step2])
+        return commands
+
+    # Batched, numpy arrays
+
+    def ik_2d_batch(self, u, v):
+        """
+        Planar solve on arrays, out of reach points pulled back onto the reach circle.
+        """
+        import numpy as np
+
+        u = np.asarray(u, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        dist = np.sqrt(u**2 + v**2)
+        scale = np.where(dist > self.reach, self.reach / np.where(dist > 0, dist, 1), 1.0)
+        u = u * scale
+        v = v * scale
+        cos_angle2 = np.clip((u**2 + v**2 - self.L1_sq - self.L2_sq) / self.two_L1_L2, -1.0, 1.0)
+        theta2 = np.arccos(cos_angle2)
+        theta1 = np.arctan2(v, u) - np.arctan2(self.L2 * np.sin(theta2), self.L1 + self.L2 * cos_angle2)
+        return theta1, theta2
+
+    def ik_3d_batch(self, points):
+        """
+        (N, 3) points to an (N, 3) array of base, shoulder, elbow angles.
+        """
+        import numpy as np
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        theta2, theta3 = self.ik_2d_batch(np.sqrt(x**2 + y**2), z)
+        return np.stack((np.arctan2(y, x), theta2, theta3), axis=1)
+
+    def fk_3d_batch(self, angles):
+        """
+        (N, 3) angles to (N, 3) elbow and (N, 3) wrist positions.
+        """
+        import numpy as np
+
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1, 3)
+        theta1, theta2, theta3 = angles[:, 0], angles[:, 1], angles[:, 2]
+        c1, s1 = np.cos(theta1), np.sin(theta1)
+        reach1, reach2 = self.L1 * np.cos(theta2), self.L2 * np.cos(theta2 + theta3)
+        elbow = np.stack((c1 * reach1, s1 * reach1, self.L1 * np.sin(theta2)), axis=1)
+        wrist = elbow + np.stack((c1 * reach2, s1 * reach2, self.L2 * np.sin(theta2 + theta3)), axis=1)
+        return elbow, wrist
+
+    def steps_batch(self, angles):
+        import numpy as np
+
+        return np.trunc(np.asarray(angles, dtype=np.float64) * np.asarray(self.steps_per_rad)).astype(np.int32)
+
+    def within_limits_batch(self, angles):
+        """
+        Boolean (N,) mask of the poses with every joint inside its limits.
+        """
+        import numpy as np
+
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1, len(self.joint_limits))
+        low, high = np.asarray(self.joint_limits).T
+        return ((angles >= low) & (angles <= high)).all(axis=1)
+
+    def xyz_to_steps_batch(self, curve, accumulator=None):
+        """
+        Same commands as kinematics.xyz_to_steps_batch, with this arm's lengths and gearing.
+        """
+        return self.commands_batch(self.ik_3d_batch(curve), accumulator)
+
+    def commands_batch(self, angles, accumulator=None):
+        """
+        [-elbow, base, shoulder] int32 step commands through (N, 3) joint poses : from the
+        accumulator's absolute counts, or relative to the pose before from zero angles.
+        """
+        import numpy as np
+
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1, 3)
+        if accumulator is not None:
+            steps = accumulator.to_steps_batch(angles)
+        else:
+            steps = self.steps_batch(np.diff(angles, axis=0, prepend=np.zeros((1, 3))))
+        return np.stack((-steps[:, 2], steps[:, 0], steps[:, 1]), axis=1).astype(np.int32)
+
+    def ik_3d_branches(self, points, allow_flip=False):
+        """
+        Every IK solution of each point, (N, B, 3) : elbow down, elbow up, and with
+        allow_flip the same two with the base turned half a turn. Base angles in (-pi, pi].
+        """
+        import numpy as np
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        r = np.sqrt(x**2 + y**2)
+        dist = np.sqrt(r**2 + z**2)
+        scale = np.where(dist > self.reach, self.reach / np.where(dist > 0, dist, 1), 1.0)
+        r, z = r * scale, z * scale
+        cos_angle2 = np.clip((r**2 + z**2 - self.L1_sq - self.L2_sq) / self.two_L1_L2, -1.0, 1.0)
+        elbow = np.arccos(cos_angle2)
+        offset = np.arctan2(self.L2 * np.sin(elbow), self.L1 + self.L2 * cos_angle2)
+        base = np.arctan2(y, x)
+
+        branches = []
+        planar = [(base, np.arctan2(z, r))]
+        if allow_flip:
+            planar.append((np.where(base > 0, base - np.pi, base + np.pi), np.arctan2(z, -r)))
+        for theta1, direction in planar:
+            branches.append(np.stack((theta1, direction - offset, elbow), axis=1))   # elbow down
+            branches.append(np.stack((theta1, direction + offset, -elbow), axis=1))  # elbow up
+        return np.stack(branches, axis=1)
+
+    def branches_within_limits(self, candidates):
+        """
+        Boolean mask of the (..., 3) joint solutions inside the limits, the base counting
+        as inside when some whole number of turns brings it there.
+        """
+        import numpy as np
+
+        low, high = np.asarray(self.joint_limits).T
+        feasible = ((candidates[..., 1:] >= low[1:]) & (candidates[..., 1:] <= high[1:])).all(axis=-1)
+        if np.isfinite(self.joint_limits[0]).any():
+            turns = 2 * np.pi
+            base = candidates[..., 0]
+            feasible &= np.ceil((low[0] - base) / turns) <= np.floor((high[0] - base) / turns)
+        return feasible
+
+    def plan_ik(self, points, start=None, weights=None, speeds=None, allow_flip=False):
+        """
+        Joint angles (N, 3) through `points` with the least total travel from `start`
+        (default all zero). The travel of a move is the sum over joints of steps times
+        `weights` (default 1), or with `speeds` (steps/s per joint) the time of its slowest
+        joint. The base is unwrapped, it never turns more than half a turn between two points
+        unless its limits force the long way round. Solutions outside the joint limits are
+        not used, a point with none left raises ValueError.
+        """
+        import numpy as np
+
+        candidates = self.ik_3d_branches(points, allow_flip)
+        n_points, n_branches = candidates.shape[:2]
+        if n_points == 0:
+            return np.empty((0, 3))
+        start = np.zeros(3) if start is None else np.asarray(start, dtype=np.float64)
+        steps_per_rad = np.asarray(self.steps_per_rad)
+        if speeds is not None:
+            scale = steps_per_rad / np.asarray(speeds, dtype=np.float64)
+        else:
+            scale = steps_per_rad * (np.ones(3) if weights is None else np.asarray(weights, dtype=np.float64))
+
+        def travel(delta):
+            delta = delta.copy()
+            delta[..., 0] = (delta[..., 0] + np.pi) % (2 * np.pi) - np.pi  # shortest way round the base
+            cost = np.abs(delta) * scale
+            return cost.max(axis=-1) if speeds is not None else cost.sum(axis=-1)
+
+        feasible = self.branches_within_limits(candidates)
+        if not feasible.any(axis=1).all():
+            bad = np.flatnonzero(~feasible.any(axis=1))
+            raise ValueError(f"no IK solution within the joint limits for points {bad[:10].tolist()}")
+        penalty = np.where(feasible, 0.0, np.inf)
+
+        # Viterbi over the branches : cost[i, a, b] of going from branch a at i - 1 to b at i
+        first = travel(candidates[0] - start) + penalty[0]
+        steps = travel(candidates[1:, None, :, :] - candidates[:-1, :, None, :]) + penalty[1:, None, :]
+        total = first
+        choice = np.empty((n_points - 1, n_branches), dtype=np.intp)
+        for i in range(n_points - 1):
+            options = total[:, None] + steps[i]
+            choice[i] = options.argmin(axis=0)
+            total = options[choice[i], np.arange(n_branches)]
+
+        path = np.empty(n_points, dtype=np.intp)
+        path[-1] = total.argmin()
+        for i in range(n_points - 2, -1, -1):
+            path[i] = choice[i, path[i + 1]]
+        angles = candidates[np.arange(n_points), path]
+
+        # Unwrap the base from the start pose, then use other turns where the limits require
+        delta = np.diff(angles[:, 0], prepend=start[0])
+        base = start[0] + np.cumsum((delta + np.pi) % (2 * np.pi) - np.pi)
+        if np.isfinite(self.joint_limits[0]).any():
+            base_low, base_high = self.joint_limits[0]
+            base = base.tolist()
+            shift = 0.0  # turns added so far, the points after follow on from them
+            for i in range(n_points):
+                value = base[i] + shift
+                while value > base_high and value - 2 * np.pi >= base_low:
+                    value -= 2 * np.pi
+                while value < base_low and value + 2 * np.pi <= base_high:
+                    value += 2 * np.pi
+                if not base_low <= value <= base_high:
+                    raise ValueError(f"base angle of point {i} out of its limits")
+                shift = value - base[i]
+                base[i] = value
+            base = np.asarray(base)
+        angles[:, 0] = base
+        return angles
+
+    def xyz_to_steps_min_travel(self, curve, accumulator=None, weights=None, speeds=None, allow_flip=False):
+        """
+        xyz_to_steps_batch with the joint solutions from plan_ik, starting from the
+        accumulator's pose (or zero angles without one).
+        """
+        start = accumulator.angles() if accumulator is not None else None
+        return self.commands_batch(self.plan_ik(curve, start, weights, speeds, allow_flip), accumulator)
@@ -0,0 +1,175 @@
+import argparse
+import math
+
+# Look-ahead speed planning for step commands.
+#
+# Sent as bare deltas, every move starts and ends at standstill, so the arm brakes to
+# zero at each waypoint. plan() gives each segment a trapezoid profile instead, with
+# the speed at every junction as high as the joints allow :
+#   - all axes of a segment move together, the segment "length" is the step count of
+#     its busiest axis and speeds / accelerations are in those steps, so no joint goes
+#     past its own max_speed / max_accel
+#   - at a junction no joint may change speed by more than max_jerk steps/s at once
+#     (the classic jerk limit, 0 means every change of direction stops)
+#   - a backward then a forward pass make sure every junction speed can be reached and
+#     braked from within the neighbouring segments
+# Works for any number of axes, so for the 2D ([a, 0, c]) and 3D command lists alike.
+#
+#   segments = motion_planner.plan(commands, max_speed=[800, 800, 800], max_accel=[2000, 2000, 2000])
+#   command_str = motion_planner.format_planned(segments)   # "A10,B0,C5,V800,E120,R2000;..."
+#   motion_planner.cycle_time(segments), motion_planner.naive_cycle_time(commands, ...)
+
+
+def _per_axis(value, n_axes):
+    if isinstance(value, (int, float)):
+        return [float(value)] * n_axes
+    value = [float(v) for v in value]
+    if len(value) != n_axes:
+        raise ValueError(f"need {n_axes} values, got {len(value)}")
+    return value
+
+
+def segment_time(length, entry, cruise, exit, accel):
+    """
+    Time of a trapezoid (or triangle) profile over `length` steps.
+    """
+    if length <= 0:
+        return 0.0
+    if accel <= 0:
+        return length / cruise
+    accel_steps = max(0.0, (cruise**2 - entry**2) / (2 * accel))
+    decel_steps = max(0.0, (cruise**2 - exit**2) / (2 * accel))
+    cruise_steps = max(0.0, length - accel_steps - decel_steps)
+    return (cruise - entry) / accel + (cruise - exit) / accel + cruise_steps / cruise
+
+
+def _limits(steps, max_speed, max_accel):
+    """
+    Length, speed limit and acceleration of one segment, in steps of its busiest axis.
+    """
+    length = max(abs(s) for s in steps)
+    if length == 0:
+        return 0, 0.0, 0.0
+    speed = min(max_speed[j] * length / abs(s) for j, s in enumerate(steps) if s)
+    accel = min(max_accel[j] * length / abs(s) for j, s in enumerate(steps) if s)
+    return length, speed, accel
+
+
+def plan(commands, max_speed, max_accel, max_jerk=None):
+    """
+    Plan profiles for a list of step commands, starting and ending at standstill.
+    max_speed / max_accel / max_jerk are per axis (or one number for all), in steps/s
+    and steps/s^2, max_jerk defaults to 10 % of max_speed.
+    Returns one dict per command : steps, length, entry, cruise, exit, accel, time.
+    Segments with no motion keep their place with zero time.
+    """
+    n_axes = len(commands[0]) if len(commands) else 0
+    max_speed = _per_axis(max_speed, n_axes)
+    max_accel = _per_axis(max_accel, n_axes)
+    max_jerk = [0.1 * v for v in max_speed] if max_jerk is None else _per_axis(max_jerk, n_axes)
+
+    segments = []
+    for cmd in commands:
+        steps = [int(s) for s in cmd]
+        length, speed, accel = _limits(steps, max_speed, max_accel)
+        segments.append({"steps": steps, "length": length, "speed_limit": speed, "accel": accel})
+    moving = [seg for seg in segments if seg["length"]]
+
+    # Junction limits : junction[i] is the speed between moving[i - 1] and moving[i]
+    junction = [0.0] * (len(moving) + 1)
+    for i in range(1, len(moving)):
+        before, after = moving[i - 1], moving[i]
+        limit = min(before["speed_limit"], after["speed_limit"])
+        for j in range(n_axes):
+            # Joint speed per unit of path speed, before and after the junction
+            change = abs(before["steps"][j] / before["length"] - after["steps"][j] / after["length"])
+            if change > 0:
+                limit = min(limit, max_jerk[j] / change)
+        junction[i] = limit
+
+    # Backward pass : every junction must be able to brake down to the next one
+    for i in range(len(moving) - 1, -1, -1):
+        seg = moving[i]
+        junction[i] = min(junction[i], math.sqrt(junction[i + 1]**2 + 2 * seg["accel"] * seg["length"]))
+    # Forward pass : and be reachable from the previous one
+    for i, seg in enumerate(moving):
+        junction[i + 1] = min(junction[i + 1], math.sqrt(junction[i]**2 + 2 * seg["accel"] * seg["length"]))
+
+    for i, seg in enumerate(moving):
+        entry, exit = junction[i], junction[i + 1]
+        # Highest speed we can accelerate to and still brake to `exit` in the segment
+        peak = math.sqrt((2 * seg["accel"] * seg["length"] + entry**2 + exit**2) / 2)
+        seg["entry"], seg["exit"] = entry, exit
+        seg["cruise"] = max(entry, exit, min(seg["speed_limit"], peak))
+        seg["time"] = segment_time(seg["length"], entry, seg["cruise"], exit, seg["accel"])
+
+    speed = 0.0
+    for seg in segments:
+        if not seg["length"]:
+            seg.update(entry=speed, cruise=speed, exit=speed, time=0.0)
+        speed = seg["exit"]
+        del seg["speed_limit"]
+    return segments
+
+
+def cycle_time(segments):
+    return sum(seg["time"] for seg in segments)
+
+
+def naive_cycle_time(commands, max_speed, max_accel):
+    """
+    What the same commands take sent bare : every segment from standstill to standstill.
+    """
+    n_axes = len(commands[0]) if len(commands) else 0
+    max_speed = _per_axis(max_speed, n_axes)
+    max_accel = _per_axis(max_accel, n_axes)
+    total = 0.0
+    for cmd in commands:
+        length, speed, accel = _limits([int(s) for s in cmd], max_speed, max_accel)
+        if length:
+            peak = math.sqrt(accel * length)
+            total += segment_time(length, 0.0, min(speed, peak), 0.0, accel)
+    return total
+
+
+def format_planned(segments, axes="ABC"):
+    """
+    The ASCII step format with the profile appended to each move :
+    V cruise speed, E exit speed (steps/s), R acceleration (steps/s^2).
+    The entry speed is the exit speed of the move before.
+    """
+    moves = []
+    for seg in segments:
+        fields = [f"{axis}{steps}" for axis, steps in zip(axes, seg["steps"])]
+        fields.append(f"V{round(seg['cruise'])},E{round(seg['exit'])},R{round(seg['accel'])}")
+        moves.append(",".join(fields))
+    return ";".join(moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare planned and stop-at-every-point cycle times")
+    parser.add_argument("--points", type=int, default=72, help="points on the test circle")
+    parser.add_argument("--radius", type=int, default=2000, help="circle radius in steps")
+    parser.add_argument("--speed", type=float, default=800.0)
+    parser.add_argument("--accel", type=float, default=2000.0)
+    parser.add_argument("--jerk", type=float, default=None)
+    args = parser.parse_args()
+
+    # A circle in the A / B joints, the kind of many-waypoint move that suffers most
+    previous = [0, 0, 0]
+    commands = []
+    for i in range(1, args.points + 1):
+        angle = 2 * math.pi * i / args.points
+        target = [round(args.radius * math.cos(angle)) - args.radius, round(args.radius * math.sin(angle)), 0]
+        commands.append([t - p for t, p in zip(target, previous)])
+        previous = target
+
+    segments = plan(commands, args.speed, args.accel, args.jerk)
+    planned = cycle_time(segments)
+    naive = naive_cycle_time(commands, args.speed, args.accel)
+    print(f"{len(commands)} moves : stop at every point {naive:.2f} s, planned {planned:.2f} s "
+          f"({naive / planned:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,18 @@
+import logging
 import pygame
 import math
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules in the repo root
+import kinematics
+import telemetry
+
+# Lengths (screen pixels) and gearing of the arm, from arm_config.json (ARM_CONFIG points to another file)
+ARM = kinematics.ArmModel.load("arm_2d")
+
+# Per call debug output, shown with ARM_LOG_LEVEL=debug (telemetry.configure_logging)
+log = logging.getLogger(__name__)
 
 # Function to calculate the joint positions using angles
 def get_joint_positions(theta1, theta2, origin, L1, L2):
@@ -22,135 +35,209 @@ def inverse_kinematics(x, y, L1, L2):
     return theta1, theta2
 
 # Function to convert angle changes to stepper motor steps
-def angle_to_step(angle1, angle2, steps_per_rev_1=2200, steps_per_rev_2=5000):
+def angle_to_step(angle1, angle2, steps_per_rev_1=ARM.steps_per_rev[0], steps_per_rev_2=ARM.steps_per_rev[1]):
     steps1 = int((angle1 * steps_per_rev_1) / 360)
     steps2 = int((angle2 * steps_per_rev_2) / 360)
-    print(f"steps1 is {steps1}\nsteps2 is {steps2}")
+    log.debug("steps1 is %s\nsteps2 is %s", steps1, steps2)
     return steps1, steps2
 
-# The main UI function that returns angles when "Move" is pressed
-def run_ui():
-    # Arm lengths
-    L1 = 180  # Length of the first segment (stick 1)
-    L2 = 120  # Length of the second segment (stick 2)
-
-    # Colors
-    WHITE = (255, 255, 255)
-    BLACK = (0, 0, 0)
-    RED = (255, 0, 0)
-    GREEN = (0, 255, 0)
-
-    # Initialize pygame
-    pygame.init()
-    WIDTH, HEIGHT = 800, 600
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption('2-DOF Robotic Arm')
-
-    # Origin point (the shoulder of the arm)
-    origin = (WIDTH // 2, HEIGHT // 2)
-
-    # Button setup
-    BUTTON_WIDTH, BUTTON_HEIGHT = 100, 50
-    go_button_color = GREEN
-    go_button_rect = pygame.Rect(WIDTH - BUTTON_WIDTH - 10, HEIGHT - BUTTON_HEIGHT - 10, BUTTON_WIDTH, BUTTON_HEIGHT)
-
-    move_button_color = RED
-    move_button_rect = pygame.Rect(WIDTH - BUTTON_WIDTH - 10, HEIGHT - (BUTTON_HEIGHT * 2) - 20, BUTTON_WIDTH, BUTTON_HEIGHT)
-
-    running = True
-    arm_angles = [0, 0]
-    move_arm = False
-    final_angles = None
-    prev_angle1 = 0
-    prev_angle2 = 0
-    steps_list = []
-
-    while running:
-        screen.fill(WHITE)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-
-            # Check if the mouse button is pressed
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    move_arm = True  # Start moving the arm
-                    # Get initial mouse position for inverse kinematics
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
-                    rel_x = mouse_x - origin[0]
-                    rel_y = mouse_y - origin[1]
-                    theta1, theta2 = inverse_kinematics(rel_x, rel_y, L1, L2)
-
-                    if theta1 is not None and theta2 is not None:
-                        arm_angles = [theta1, theta2]
-                        final_angles = [theta1, theta2]
-
-            # Check if mouse button is released
-            if event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1:
-                    move_arm = False  # Stop moving the arm
-
-            # Process button presses
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                if go_button_rect.collidepoint(event.pos):
-                    if final_angles:
-                        # Calculate angle changes
-                        final_angle1 = int(math.degrees(final_angles[0]))
-                        final_angle2 = int(math.degrees(final_angles[1]))
-
-                        angle1_change = final_angle1 - prev_angle1
-                        angle2_change = final_angle2 - prev_angle2
-
-                        # Convert to steps and append to the list
-                        steps1, steps2 = angle_to_step(angle1_change, angle2_change)
-                        steps_list.append([steps1, steps2])  # Append to the list
-
-                        # Update previous angles
-                        prev_angle1 = final_angle1
-                        prev_angle2 = final_angle2
-
-                elif move_button_rect.collidepoint(event.pos):
-                    pygame.quit()
-                    return steps_list  # Return the list of steps when Move button is pressed
-
-        # If the mouse is pressed, update arm angles
-        if move_arm:
-            mouse_x, mouse_y = pygame.mouse.get_pos()
-            rel_x = mouse_x - origin[0]
-            rel_y = mouse_y - origin[1]
-            theta1, theta2 = inverse_kinematics(rel_x, rel_y, L1, L2)
-
-            if theta1 is not None and theta2 is not None:
-                arm_angles = [theta1, theta2]
-                final_angles = [theta1, theta2]
-
-        elbow_pos, tip_pos = get_joint_positions(arm_angles[0], arm_angles[1], origin, L1, L2)
-
-        pygame.draw.line(screen, BLACK, origin, elbow_pos, 5)
-        pygame.draw.line(screen, BLACK, elbow_pos, tip_pos, 5)
-        pygame.draw.circle(screen, RED, origin, 10)
-        pygame.draw.circle(screen, RED, elbow_pos, 10)
-        pygame.draw.circle(screen, RED, tip_pos, 10)
+# Colors
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+
+WIDTH, HEIGHT = 800, 600
+FPS = 60  # frame cap, the loop sleeps in between instead of spinning
+
+
+# Persistent UI : pygame, the window, the font and the static parts of the screen (background,
+# buttons, labels) are set up once and reused by every run(), so going back to the UI between
+# moves is instant. Each frame only the areas the arm or the angle text covered, before and
+# after, are redrawn, and nothing is drawn at all while nothing changes.
+class ArmUI:
+    def __init__(self, L1=ARM.L1, L2=ARM.L2, fps=FPS):
+        # Arm lengths
+        self.L1 = L1  # Length of the first segment (stick 1)
+        self.L2 = L2  # Length of the second segment (stick 2)
+        self.fps = fps
+
+        # Initialize pygame
+        pygame.init()
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption('2-DOF Robotic Arm')
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 36)
+
+        # Origin point (the shoulder of the arm)
+        self.origin = (WIDTH // 2, HEIGHT // 2)
+
+        # Button setup
+        BUTTON_WIDTH, BUTTON_HEIGHT = 100, 50
+        self.go_button_rect = pygame.Rect(WIDTH - BUTTON_WIDTH - 10, HEIGHT - BUTTON_HEIGHT - 10, BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.move_button_rect = pygame.Rect(WIDTH - BUTTON_WIDTH - 10, HEIGHT - (BUTTON_HEIGHT * 2) - 20, BUTTON_WIDTH, BUTTON_HEIGHT)
+
+        self.background = self.render_background()
+        self.dirty = []  # areas drawn over the background in the last frame
+
+    def render_background(self):
+        background = pygame.Surface((WIDTH, HEIGHT))
+        background.fill(WHITE)
 
         # Draw the Go button
-        pygame.draw.rect(screen, go_button_color, go_button_rect)
-        font = pygame.font.Font(None, 36)
-        go_button_text = font.render("Store", True, BLACK)
-        screen.blit(go_button_text, (go_button_rect.x + 20, go_button_rect.y + 10))
+        pygame.draw.rect(background, GREEN, self.go_button_rect)
+        go_button_text = self.font.render("Store", True, BLACK)
+        background.blit(go_button_text, (self.go_button_rect.x + 20, self.go_button_rect.y + 10))
 
         # Draw the Move button
-        pygame.draw.rect(screen, move_button_color, move_button_rect)
-        move_button_text = font.render("Move", True, BLACK)
-        screen.blit(move_button_text, (move_button_rect.x + 10, move_button_rect.y + 10))
+        pygame.draw.rect(background, RED, self.move_button_rect)
+        move_button_text = self.font.render("Move", True, BLACK)
+        background.blit(move_button_text, (self.move_button_rect.x + 10, self.move_button_rect.y + 10))
+        return background.convert()
+
+    def draw(self, arm_angles):
+        """
+        Redraw the arm and the angle text, returns the screen areas that changed.
+        """
+        for rect in self.dirty:
+            self.screen.blit(self.background, rect, rect)
+
+        elbow_pos, tip_pos = get_joint_positions(arm_angles[0], arm_angles[1], self.origin, self.L1, self.L2)
+        drawn = [
+            pygame.draw.line(self.screen, BLACK, self.origin, elbow_pos, 5),
+            pygame.draw.line(self.screen, BLACK, elbow_pos, tip_pos, 5),
+            pygame.draw.circle(self.screen, RED, self.origin, 10),
+            pygame.draw.circle(self.screen, RED, elbow_pos, 10),
+            pygame.draw.circle(self.screen, RED, tip_pos, 10),
+        ]
 
         # Display angles
-        angles_text = font.render(f'Angle 1: {math.degrees(arm_angles[0]):.2f}°  Angle 2: {math.degrees(arm_angles[1]):.2f}°', True, BLACK)
-        screen.blit(angles_text, (10, 10))
-
+        angles_text = self.font.render(f'Angle 1: {math.degrees(arm_angles[0]):.2f}°  Angle 2: {math.degrees(arm_angles[1]):.2f}°', True, BLACK)
+        drawn.append(self.screen.blit(angles_text, (10, 10)))
+
+        # Buttons may have been drawn over by the arm, put them back on top
+        for rect in drawn:
+            for button in (self.go_button_rect, self.move_button_rect):
+                if rect.colliderect(button):
+                    self.screen.blit(self.background, button, button)
+
+        changed = self.dirty + drawn
+        self.dirty = drawn
+        return changed
+
+    # Returns the steps list when "Move" is pressed, None if the window is closed.
+    # Pass ARM.accumulator() (a step_accumulator.StepAccumulator) to get drift free steps that
+    # continue from where the previous call left the arm.
+    def run(self, accumulator=None):
+        L1, L2, origin = self.L1, self.L2, self.origin
+        go_button_rect, move_button_rect = self.go_button_rect, self.move_button_rect
+
+        running = True
+        arm_angles = [0, 0]
+        move_arm = False
+        final_angles = None
+        prev_angle1 = 0
+        prev_angle2 = 0
+        steps_list = []
+
+        # Full redraw once when entering
+        self.screen.blit(self.background, (0, 0))
+        self.dirty = []
+        self.draw(arm_angles)
         pygame.display.flip()
+        shown_angles = list(arm_angles)
+
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+
+                # Check if the mouse button is pressed
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1:
+                        move_arm = True  # Start moving the arm
+                        # Get initial mouse position for inverse kinematics
+                        mouse_x, mouse_y = pygame.mouse.get_pos()
+                        rel_x = mouse_x - origin[0]
+                        rel_y = mouse_y - origin[1]
+                        with telemetry.span("ui.ik"):
+                            theta1, theta2 = inverse_kinematics(rel_x, rel_y, L1, L2)
+
+                        if theta1 is not None and theta2 is not None:
+                            arm_angles = [theta1, theta2]
+                            final_angles = [theta1, theta2]
+
+                # Check if mouse button is released
+                if event.type == pygame.MOUSEBUTTONUP:
+                    if event.button == 1:
+                        move_arm = False  # Stop moving the arm
+
+                # Process button presses
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    if go_button_rect.collidepoint(event.pos):
+                        if final_angles and accumulator is not None:
+                            # Steps from the absolute step count of each motor
+                            with telemetry.span("ui.steps"):
+                                steps_list.append(accumulator.to_steps(final_angles[0], final_angles[1]))
+
+                        elif final_angles:
+                            # Calculate angle changes
+                            final_angle1 = int(math.degrees(final_angles[0]))
+                            final_angle2 = int(math.degrees(final_angles[1]))
+
+                            angle1_change = final_angle1 - prev_angle1
+                            angle2_change = final_angle2 - prev_angle2
+
+                            # Convert to steps and append to the list
+                            with telemetry.span("ui.steps"):
+                                steps1, steps2 = angle_to_step(angle1_change, angle2_change)
+                            steps_list.append([steps1, steps2])  # Append to the list
+
+                            # Update previous angles
+                            prev_angle1 = final_angle1
+                            prev_angle2 = final_angle2
+
+                    elif move_button_rect.collidepoint(event.pos):
+                        return steps_list  # Return the list of steps when Move button is pressed, window stays up
+
+            # If the mouse is pressed, update arm angles
+            if move_arm:
+                mouse_x, mouse_y = pygame.mouse.get_pos()
+                rel_x = mouse_x - origin[0]
+                rel_y = mouse_y - origin[1]
+                with telemetry.span("ui.ik"):
+                    theta1, theta2 = inverse_kinematics(rel_x, rel_y, L1, L2)
+
+                if theta1 is not None and theta2 is not None:
+                    arm_angles = [theta1, theta2]
+                    final_angles = [theta1, theta2]
+
+            # Only touch the screen when the arm moved
+            if arm_angles != shown_angles:
+                pygame.display.update(self.draw(arm_angles))
+                shown_angles = list(arm_angles)
+
+            self.clock.tick(self.fps)
+
+        self.close()
+
+    def close(self):
+        global _session
+        if _session is self:
+            _session = None
+        pygame.quit()
+
+
+_session = None
+
 
-    pygame.quit()
+# The main UI function that returns angles when "Move" is pressed.
+# Reuses one ArmUI window across calls instead of opening a new one every time.
+def run_ui(accumulator=None):
+    global _session
+    if _session is None:
+        _session = ArmUI()
+    return _session.run(accumulator)
 
 def main():
     while True:
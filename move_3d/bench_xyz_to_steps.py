@@ -0,0 +1,51 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+import xy_to_step_3D
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules in the repo root
+import kinematics
+
+# Benchmark of the per-point xyz_to_steps loop against xyz_to_steps_batch
+# run from move_3d : python bench_xyz_to_steps.py --sizes 1000 100000 1000000
+
+L1 = 21
+L2 = 15
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="xyz_to_steps loop vs batch benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--skip-loop-above", type=int, default=None,
+                        help="only time the batch version for sizes above this")
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'loop s':>10} {'batch s':>10} {'speedup':>10} {'match':>6}")
+    for n in args.sizes:
+        curve = kinematics.random_curve(n, L1, L2)
+        batch, batch_time = time_call(xy_to_step_3D.xyz_to_steps_batch, curve, L1, L2)
+
+        if args.skip_loop_above is not None and n > args.skip_loop_above:
+            print(f"{n:>10} {'-':>10} {batch_time:>10.4f} {'-':>10} {'-':>6}")
+            continue
+
+        # The scalar path prints every point, keep that out of the terminal
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            loop, loop_time = time_call(xy_to_step_3D.xyz_to_steps, curve.tolist(), L1, L2)
+
+        match = np.array_equal(np.asarray(loop, dtype=np.int32), batch)
+        print(f"{n:>10} {loop_time:>10.4f} {batch_time:>10.4f} {loop_time / batch_time:>9.1f}x {str(match):>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,71 @@
+import os
+import sys
 import serial
+import threading
 import time
 import keyboard  # Make sure to install this library
-import xy_to_step_3D
+import path_interpolation
 
-# This connects to the pyserial communication in Arduino
-arduino = serial.Serial('COM5', 9600, timeout=1)
-time.sleep(2)  # Wait for the connection to establish
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules in the repo root
+import motion_planner
+import serial_protocol
+import command_compress
+import serial_transport
+import command_stream
+import arm_daemon
+import jog_controller
+import cartesian_jog
+import kinematics
+import telemetry
+import waypoint_order
+import preflight
+import trajectory_file
+import gcode
+
+# ARM_TELEMETRY=1 records latency spans and throughput counters (telemetry.py), dumped on exit
+telemetry.setup()
+
+# ARM_DAEMON=<socket> sends through a running arm_daemon.py, which keeps the port open : no board reset
+# and no 2 s wait. Otherwise this connects to the pyserial communication in Arduino, ARDUINO_PORT
+# overrides the port (e.g. virtual_arduino.py)
+USE_DAEMON = bool(os.environ.get("ARM_DAEMON"))
+if USE_DAEMON:
+    arduino = arm_daemon.ArmClient(os.environ["ARM_DAEMON"])
+else:
+    arduino = serial.Serial(os.environ.get("ARDUINO_PORT", "COM5"), 9600, timeout=1)
+    time.sleep(2)  # Wait for the connection to establish
+
+# Stream commands in frames sized to the Arduino receive buffer, paced by its "ok" acks
+# (needs a sketch that acks every line), instead of sending everything at once. Through the daemon
+# this is its --ack-streaming option instead
+ACK_STREAMING = False
+port = command_stream.CommandStreamer(arduino, rx_buffer_size=64, window=4) if ACK_STREAMING and not USE_DAEMON else arduino
+
+# Writes go through a background thread so key handlers and the input loop never block on the port
+writer = serial_transport.SerialWriter(port, maxsize=64, policy="block")
+
+# Send step commands as compact binary frames (serial_protocol.py) instead of "A..,B..,C.." text,
+# the Arduino sketch has to be built with the matching frame decoder
+BINARY_MODE = False
+frame_seq = 0
+
+# Append look-ahead speed profiles (motion_planner.py) to the text commands so the arm doesn't stop
+# at every point, needs a sketch that reads the V / E / R fields. Limits are per motor A, B, C
+MOTION_PLANNING = False
+MAX_SPEED = [800, 800, 800]     # steps/s
+MAX_ACCEL = [2000, 2000, 2000]  # steps/s^2
+
+# Join consecutive moves that go the same way into one (command_compress.py) : fewer moves and
+# bytes, the arm passes the same positions. How far in steps the positions in between may be off
+# the joined move, 0 only joins moves with the same step ratios, None sends the moves as they are
+MERGE_TOLERANCE = None
+
+# Leave zero fields out of the text commands and send n identical moves as one "*n" (command_compress.py),
+# needs a sketch that defaults missing fields to 0 and reads the repeat count
+COMPACT_COMMANDS = False
 
 def send_to_arduino(command):
-    arduino.write((command + '\n').encode())  # Send command with newline to Arduino
+    writer.send((command + '\n').encode())  # Queue command with newline for the Arduino
 
 # Function to send signal to Arduino
 def control_led(state):
@@ -18,45 +75,116 @@ def control_led(state):
     elif state == "off":
         send_to_arduino("off")
 
-def send_commands_to_arduino(commands):
-    command_str = ";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in commands])
+def send_commands_to_arduino(commands, trace=None):
+    global frame_seq
+    telemetry.count("commands", len(commands))
+    if MERGE_TOLERANCE is not None:
+        with telemetry.span("merge"):
+            commands = command_compress.merge_moves(commands, MERGE_TOLERANCE)
+    if BINARY_MODE:
+        with telemetry.span("encode"):
+            frames, frame_seq = serial_protocol.encode_frames(commands, frame_seq)
+        print(f"sending {len(commands)} moves in {len(frames)} binary frames")
+        with telemetry.span("enqueue"):
+            writer.send(b"".join(frames), trace)  # Queue frames for the Arduino
+        return
+    with telemetry.span("encode"):
+        if MOTION_PLANNING:
+            command_str = motion_planner.format_planned(motion_planner.plan(commands, MAX_SPEED, MAX_ACCEL))
+        elif COMPACT_COMMANDS:
+            command_str = command_compress.format_compact(commands).decode().rstrip("\n")
+        else:
+            command_str = ";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in commands])
     print(command_str)
-    arduino.write((command_str + '\n').encode())  # Send command to Arduino
-    time.sleep(0.1)  # Optional delay after sending commands
+    with telemetry.span("enqueue"):
+        writer.send((command_str + '\n').encode(), trace)  # Queue command for the Arduino, returns immediately
+
+# Max distance (same units as the x y z input) the tip may leave the line between entered points,
+# None sends the points as they are
+INTERPOLATION_TOLERANCE = None
+
+# Lengths and gearing of the arm, from arm_config.json (ARM_CONFIG points to another file)
+ARM = kinematics.ArmModel.load("arm_3d")
+
+# Choose elbow up / down and the turn of the base for each point so the motors travel the least
+# from where the arm is (ArmModel.plan_ik), instead of always elbow down with the base in -180..180.
+# Meant for arms with joint_limits_deg in arm_config.json, without limits it may pick elbow up
+MIN_TRAVEL_IK = False
+
+# The entered points are targets to visit in any order (pick-and-place, inspection) : reorder them
+# for the least move time from where the arm is (waypoint_order.py) before the IK
+REORDER_TARGETS = False
+
+# Check the whole curve (reach, joint limits, NaN) before sending any of it, see preflight.py.
+# Reach is checked on the entered points, the rest on the joint angles that are sent (after
+# reordering and interpolation, offender indices count those points). Also trajectory files ('f')
+PREFLIGHT = True
+# Opt-in step rate check : the tip speed (arm units/s) curves and trajectory files run at, preflight
+# then refuses segments whose busiest motor needs more than MAX_SPEED steps/s for it. None leaves it out
+PREFLIGHT_FEED_RATE = None
+
+# Absolute step counts of the motors, kept between curves so nothing is lost to rounding
+# and every curve starts from where the last one ended
+step_tracker = ARM.accumulator()
+# Held by whatever moves step_tracker : typed curves, 'f' / 'g' and the cartesian jog's ticks,
+# so a typed move during a jog loses no steps (the jog waits while a file streams)
+tracker_lock = threading.Lock()
 
 # Initialize commands
 commands = []
+last_curve = []  # the last curve typed in, 'w' saves it as a trajectory file
+GCODE_SCALE = 0.1  # arm units per G-code unit (G21 mm to cm here), 'g' streams a G-code file
+TRAJECTORY_UNITS = "cm"  # units of ARM's lengths, 'w' writes them in trajectory files and 'f' only plays files in them
 
 # Function to handle key presses
 def handle_keypress(event):
     global commands  # Use the global commands variable
+    trace = telemetry.begin()  # key press to bytes on the wire
     if event.name == 'up':
         commands = [[100, 0, 0]]  # Set command for up arrow
         print("--- x moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'down':
         commands = [[-100, 0, 0]]  # Set command for down arrow
         print("--- x moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'left':
         commands = [[0, 100, 0]]  # Set command for left arrow
         print("---  y moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'right':
         commands = [[0, -100, 0]]  # Set command for right arrow
         print("---  y moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'comma':  # Represents the '<' key
         commands = [[0, 0, 100]]  # Set command for '<' key
         print("---  z moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'period':  # Represents the '>' key
         commands = [[0, 0, -100]]  # Set command for '>' key
         print("---  z moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to A,,,,,,...........rduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to A,,,,,,...........rduino
+
+# Hold-to-move jogging (jog_controller.py) : key events are gathered into one command every 100 ms,
+# a tap still moves 100 steps and motion stops once the keys are released. Off by default : a command per key event, as before
+JOG_MODE = False
+# With JOG_MODE, the keys move the tool tip along x / y / z (cartesian_jog.py, 50 ticks/s)
+# instead of one motor each
+CARTESIAN_JOG = False
+if CARTESIAN_JOG:
+    jog = cartesian_jog.CartesianJog(lambda cmd: send_commands_to_arduino([cmd], telemetry.begin()), ARM,
+                                     step_tracker, speed=2.0, rate=50, max_joint_speed=MAX_SPEED,
+                                     lock=tracker_lock)
+else:
+    jog = jog_controller.JogController(lambda cmd: send_commands_to_arduino([cmd], telemetry.begin()), tap_steps=100,
+                                       max_speed=min(MAX_SPEED))
 
 # Listen for key presses
-keyboard.on_press(handle_keypress)
+if JOG_MODE:
+    jog.start()
+    keyboard.hook(jog.handle_event)  # presses and releases
+else:
+    keyboard.on_press(handle_keypress)
 keyboard.add_hotkey('<', lambda: [print("z moving forward"), send_commands_to_arduino([[0, 0, 10]])])
 keyboard.add_hotkey('>', lambda: [print("z moving backward"), send_commands_to_arduino([[0, 0, -10]])])
 
@@ -64,7 +192,8 @@ keyboard.add_hotkey('>', lambda: [print("z moving backward"), send_commands_to_a
 try:
 
     while True:
-        user_input = input("Enter 'y' to turn the LED on, 'n' to turn it off, or anything to quit: ").lower()
+        user_input = input("Enter 'y' to turn the LED on, 'n' to turn it off, 'f' to play a trajectory file, "
+                           "'g' to stream a G-code file, 'w' to save the last curve, or anything to enter a curve: ").lower()
 
         if user_input == "y":
             control_led("on")
@@ -76,6 +205,60 @@ try:
         #     curve = [[-18,12,0],[-18, 7, 0], [-15, 7, 0]]
         #     commands = xy_to_step_3D.xyz_to_steps(curve)
         #     send_commands_to_arduino(commands)
+        elif user_input == "f":
+            # Stream a trajectory file (trajectory_file.py) from where the arm is, a chunk at a time
+            path = input("Trajectory file to play: ").strip()
+            try:
+                job = trajectory_file.TrajectoryFile(path)
+            except (OSError, ValueError) as e:
+                print(f"Can't read {path}: {e}")
+                continue
+            with job, tracker_lock:
+                if job.units != TRAJECTORY_UNITS:
+                    print(f"{path} is in {job.units}, the arm works in {TRAJECTORY_UNITS}. Nothing sent.")
+                    continue
+                # Stored commands made for another arm or start pose : solve the points again, or refuse
+                problem = trajectory_file.command_mismatch(job, ARM, step_tracker.angles())
+                if problem and job.points is None:
+                    print(f"{path}: {problem}. Nothing sent.")
+                    continue
+                if problem:
+                    print(f"{path}: {problem}, solving its points instead.")
+                solve = problem is not None
+                if PREFLIGHT:
+                    report = trajectory_file.check(job, ARM, start=step_tracker.angles(), solve=solve,
+                                                   max_speed=MAX_SPEED, feed_rate=PREFLIGHT_FEED_RATE)
+                    if not report.ok:
+                        print(report.summary())
+                        print("Nothing sent.")
+                        continue
+                moves, sent, frame_seq = trajectory_file.play(job, writer.send, arm=ARM, accumulator=step_tracker,
+                                                              binary=BINARY_MODE, frame_seq=frame_seq, solve=solve)
+            print(f"Queued {moves} moves ({sent} bytes) from {path}")
+        elif user_input == "g":
+            # Parse, solve and send a G-code file (gcode.py) batch by batch, X/Y/Z are arm x/y/z
+            path = input("G-code file to stream: ").strip()
+            try:
+                # Every batch is preflighted before it is sent, at the F feed rates of the file
+                with tracker_lock:
+                    parser, sent, frame_seq = gcode.stream(path, writer.send, ARM, accumulator=step_tracker,
+                                                           scale=GCODE_SCALE, binary=BINARY_MODE,
+                                                           frame_seq=frame_seq, max_speed=MAX_SPEED)
+            except (OSError, gcode.GcodeError) as e:
+                print(f"Can't stream {path}: {e}")
+                continue
+            print(f"Queued {parser.moves} moves ({sent} bytes) from {parser.lines} lines of {path}")
+        elif user_input == "w":
+            path = input("Save the last curve to: ").strip()
+            if not last_curve:
+                print("No curve entered yet.")
+            else:
+                try:
+                    trajectory_file.save(path, ARM, points=last_curve, units=TRAJECTORY_UNITS)
+                except OSError as e:
+                    print(f"Can't write {path}: {e}")
+                    continue
+                print(f"Saved {len(last_curve)} points to {path}")
         elif user_input == "q" :
             print("Exiting...")
             break
@@ -94,19 +277,62 @@ try:
                 except ValueError:
                     print("Invalid input. Please enter integers.")
 
+            last_curve = curve
             commands = []
+            trace = telemetry.begin()  # curve entered to bytes on the wire
             # step_list = two_D_UI.run_ui()
 
             # for point in curve :
-            commands = xy_to_step_3D.xyz_to_steps(curve)
-                # append in this format in commands : [elbow motor, shoulder motor 1, shoulder motor2], shoulder motor 2 and eblow are in one plane
-                # commands.append([-steps[2], steps[0], steps[1]])
-            send_commands_to_arduino(commands)
+            if PREFLIGHT and curve:
+                # Reach first, reordering and interpolation need reachable points
+                with telemetry.span("preflight"):
+                    report = preflight.check_trajectory(curve, ARM, max_speed=None, check_limits=False)
+                if not report.ok:
+                    print(report.summary())
+                    print("Nothing sent.")
+                    continue
+            if REORDER_TARGETS and len(curve) > 1:
+                with telemetry.span("reorder"):
+                    order, report = waypoint_order.order_targets(curve, ARM, start=step_tracker.angles(),
+                                                                 speeds=MAX_SPEED)
+                curve = [curve[i] for i in order]
+                print(waypoint_order.describe(report))
+            if INTERPOLATION_TOLERANCE is not None and len(curve) > 1:
+                # Add the points needed to keep the tip within tolerance of the straight lines
+                with telemetry.span("interpolate"):
+                    # Measured on the elbow up / down solutions plan_ik picks for the entered points
+                    elbow_up = ARM.plan_ik(curve, step_tracker.angles())[:, 2] < 0 if MIN_TRAVEL_IK else None
+                    curve = path_interpolation.densify(curve, INTERPOLATION_TOLERANCE, ARM.L1, ARM.L2,
+                                                       elbow_up=elbow_up)
+            with telemetry.span("ik"):
+                if MIN_TRAVEL_IK:
+                    angles = ARM.plan_ik(curve, step_tracker.angles())
+                else:
+                    angles = ARM.ik_3d_batch(curve)
+            if PREFLIGHT and len(curve):
+                with telemetry.span("preflight"):
+                    report = preflight.check_trajectory(curve, ARM, start=step_tracker.angles(), angles=angles,
+                                                        max_speed=MAX_SPEED, feed_rate=PREFLIGHT_FEED_RATE)
+                if not report.ok:
+                    print(report.summary())
+                    print("Nothing sent.")
+                    continue
+            with telemetry.span("steps"), tracker_lock:
+                commands = ARM.commands_batch(angles, accumulator=step_tracker).tolist()
+            # append in this format in commands : [elbow motor, shoulder motor 1, shoulder motor2], shoulder motor 2 and eblow are in one plane
+            # commands.append([-steps[2], steps[0], steps[1]])
+            send_commands_to_arduino(commands, trace)
 
 except KeyboardInterrupt:
     print("\nProgram interrupted.")
 
 finally:
-    # Always close the serial connection when done
+    # Always close the serial connection when done, after the queued commands went out
+    if JOG_MODE:
+        keyboard.unhook_all()
+        jog.stop()
+    writer.close()
     arduino.close()
-    print("Serial connection closed.")
\ No newline at end of file
+    print("Serial connection closed.")
+    if telemetry.ENABLED:
+        print(f"Telemetry written to {telemetry.dump()}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import warnings
+
+import numpy as np
+import xy_to_step_3D
+
+# Adaptive densification of sparse Cartesian waypoints.
+#
+# Between two points the steppers move in joint space, so the tool tip sweeps an arc
+# instead of following the straight line (or spline) we want. This inserts
+# intermediate points only where needed : a piece of path is split in two while the
+# tip position half way through the joint move (FK of the mean joint angles) is more
+# than `tolerance` away from the half way point on the wanted path (or from the closest
+# the arm gets to it, for points out of reach).
+# All pieces of all segments are checked together with numpy on every pass.
+#
+#   curve = path_interpolation.densify([[-18, 12, 0], [-18, 7, 0], [-15, 7, 0]], tolerance=0.05)
+#   commands = xy_to_step_3D.xyz_to_steps_batch(curve)
+
+LINEAR = "linear"
+SPLINE = "spline"
+
+
+def _segment_points(waypoints, kinds, seg, u):
+    """
+    Points at parameters u (0..1) along segments seg, (n,3).
+    Spline segments are uniform Catmull-Rom through the waypoints, end points repeated.
+    """
+    last = len(waypoints) - 1
+    p1 = waypoints[seg]
+    p2 = waypoints[seg + 1]
+    points = p1 + (p2 - p1) * u[:, None]
+
+    spline = kinds[seg]
+    if spline.any():
+        s = seg[spline]
+        t = u[spline][:, None]
+        p0 = waypoints[np.maximum(s - 1, 0)]
+        p3 = waypoints[np.minimum(s + 2, last)]
+        a, b = waypoints[s], waypoints[s + 1]
+        points[spline] = 0.5 * ((2 * a) + (-p0 + b) * t + (2 * p0 - 5 * a + 4 * b - p3) * t**2
+                                + (-p0 + 3 * a - 3 * b + p3) * t**3)
+    return points
+
+
+def _tip(theta, L1, L2):
+    _, tip = xy_to_step_3D.forward_kinematics(theta[:, 0], theta[:, 1], theta[:, 2], L1, L2)
+    return tip.T
+
+
+def _joint_path(start, end, f):
+    # Joint angles a fraction f of the way from start to end, the base turning the short way
+    # round : atan2 jumps from pi to -pi on the -x axis, a plain average would be half a turn off
+    delta = end - start
+    delta[..., 0] = (delta[..., 0] + np.pi) % (2 * np.pi) - np.pi
+    return start + delta * f
+
+
+def _solve(points, L1, L2, up=None):
+    # Elbow down IK, elbow up (its mirror image about the line to the point) where `up` is set
+    theta = np.stack(xy_to_step_3D.inverse_kinematics_batch(points, L1, L2), axis=1)
+    if up is not None and up.any():
+        r = np.hypot(points[up, 0], points[up, 1])
+        theta[up, 1] = 2 * np.arctan2(points[up, 2], r) - theta[up, 1]
+        theta[up, 2] = -theta[up, 2]
+    return theta
+
+
+def _deviation(start, end, wanted_mid, L1, L2, up=None):
+    n = len(start)
+    theta = _solve(np.vstack((start, end, wanted_mid)), L1, L2, None if up is None else np.tile(up, 3))
+    mid_angles = _joint_path(theta[:n], theta[n:2 * n], 0.5)
+    # Compare with where the arm ends up for the wanted point, so targets out of reach
+    # (pulled back by the IK) don't make the split go on forever
+    return np.linalg.norm(_tip(mid_angles, L1, L2) - _tip(theta[2 * n:], L1, L2), axis=1)
+
+
+def iter_densify(waypoints, tolerance=0.1, L1=21, L2=15, kinds=LINEAR, max_depth=10, chunk_segments=4096,
+                 elbow_up=None):
+    """
+    Yields (n,3) arrays of points, chunk by chunk, that together make the densified path.
+    The first chunk starts with the first waypoint, every chunk ends on a waypoint.
+    kinds is "linear", "spline" or one of those per segment. The moves are measured elbow
+    down, or with `elbow_up` (one bool per waypoint, e.g. from ArmModel.plan_ik angles) in
+    the elbow of the waypoint each segment starts from. Warns (RuntimeWarning) when pieces
+    are still off by more than `tolerance` after max_depth splits.
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 3)
+    if len(waypoints) == 0:
+        return
+    yield waypoints[:1]
+    n_segments = len(waypoints) - 1
+    if n_segments == 0:
+        return
+
+    if isinstance(kinds, str):
+        kinds = [kinds] * n_segments
+    if len(kinds) != n_segments:
+        raise ValueError(f"need one kind per segment ({n_segments}), got {len(kinds)}")
+    is_spline = np.array([kind == SPLINE for kind in kinds])
+    if elbow_up is not None:
+        elbow_up = np.asarray(elbow_up, dtype=bool).reshape(-1)
+        if len(elbow_up) != len(waypoints):
+            raise ValueError(f"need one elbow_up per waypoint ({len(waypoints)}), got {len(elbow_up)}")
+
+    for first in range(0, n_segments, chunk_segments):
+        seg = np.arange(first, min(first + chunk_segments, n_segments))
+        u0 = np.zeros(len(seg))
+        u1 = np.ones(len(seg))
+        done_seg, done_u = [], []
+
+        for _ in range(max_depth):
+            start = _segment_points(waypoints, is_spline, seg, u0)
+            end = _segment_points(waypoints, is_spline, seg, u1)
+            mid_u = (u0 + u1) / 2
+            wanted_mid = _segment_points(waypoints, is_spline, seg, mid_u)
+            deviation = _deviation(start, end, wanted_mid, L1, L2, None if elbow_up is None else elbow_up[seg])
+            split = deviation > tolerance
+
+            done_seg.append(seg[~split])
+            done_u.append(u1[~split])
+            if not split.any():
+                break
+            # Each split piece becomes [u0, mid] and [mid, u1]
+            seg = np.repeat(seg[split], 2)
+            u0 = np.column_stack((u0[split], mid_u[split])).ravel()
+            u1 = np.column_stack((mid_u[split], u1[split])).ravel()
+        else:
+            warnings.warn(f"densify: {split.sum()} pieces of segments {np.unique(seg).tolist()[:10]} are still "
+                          f"up to {deviation.max():.3g} off after max_depth={max_depth} splits "
+                          f"(tolerance {tolerance})", RuntimeWarning, stacklevel=2)
+            done_seg.append(seg)
+            done_u.append(u1)
+
+        # Piece end points, in path order
+        seg = np.concatenate(done_seg)
+        u = np.concatenate(done_u)
+        order = np.lexsort((u, seg))
+        yield _segment_points(waypoints, is_spline, seg[order], u[order])
+
+
+def densify(waypoints, tolerance=0.1, L1=21, L2=15, kinds=LINEAR, max_depth=10, elbow_up=None):
+    """
+    The whole densified path as one (n,3) array, ready for xyz_to_steps_batch
+    (or xyz_to_steps_min_travel with the `elbow_up` of its plan, see iter_densify).
+    """
+    chunks = list(iter_densify(waypoints, tolerance, L1, L2, kinds, max_depth, elbow_up=elbow_up))
+    if not chunks:
+        return np.empty((0, 3))
+    return np.concatenate(chunks)
+
+
+def max_deviation(points, waypoints, L1=21, L2=15, kinds=LINEAR, samples=8):
+    """
+    Check a path : worst distance between the joint space moves through `points` and the
+    nearest point of the (reachable) wanted path, sampled `samples` times per move.
+    Slow, for testing.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    waypoints = np.asarray(waypoints, dtype=np.float64)
+    n_segments = len(waypoints) - 1
+    if isinstance(kinds, str):
+        kinds = [kinds] * n_segments
+    is_spline = np.array([kind == SPLINE for kind in kinds])
+    u = np.linspace(0, 1, 2000)
+    wanted = np.concatenate([_segment_points(waypoints, is_spline, np.full(len(u), s), u) for s in range(n_segments)])
+
+    wanted = _tip(np.stack(xy_to_step_3D.inverse_kinematics_batch(wanted, L1, L2), axis=1), L1, L2)
+
+    theta = np.stack(xy_to_step_3D.inverse_kinematics_batch(points, L1, L2), axis=1)
+    f = np.linspace(0, 1, samples + 1)[1:-1, None, None]
+    moving = _joint_path(theta[:-1], theta[1:], f).reshape(-1, 3)
+    distances = np.linalg.norm(_tip(moving, L1, L2)[:, None, :] - wanted[None, :, :], axis=2).min(axis=1)
+    return distances.max() if len(distances) else 0.0
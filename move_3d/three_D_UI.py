@@ -1,17 +1,29 @@
+import logging
 import numpy as np
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+from dash import Patch, ctx
 from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import math
+import os
+import sys
 
-# Arm parameters
-L1 = 10  # Length of first segment (shoulder to elbow)
-L2 = 10  # Length of second segment (elbow to wrist)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules in the repo root
+import kinematics
+import telemetry
+
+# Arm parameters from arm_config.json (ARM_CONFIG points to another file)
+ARM = kinematics.ArmModel.load("arm_3d_ui")
+L1 = ARM.L1  # Length of first segment (shoulder to elbow)
+L2 = ARM.L2  # Length of second segment (elbow to wrist)
 
 stored_angles = []  # List to store angles
 
+# Per call debug output, shown with ARM_LOG_LEVEL=debug (telemetry.configure_logging)
+log = logging.getLogger(__name__)
+
 # Inverse kinematics function
 def inverse_kinematics(x, y, z):
     r = np.sqrt(x**2 + y**2)  # Projection in the xy-plane
@@ -31,7 +43,7 @@ def inverse_kinematics(x, y, z):
     
     # Calculate theta3 as the angle between the two links
     # theta3 = np.arccos((L1**2 + L2**2 - d**2) / (2 * L1 * L2))    
-    print(f"theatas are - {np.degrees(theta1):.2f}, {np.degrees(theta2):.2f}, {np.degrees(theta3):.2f}")
+    log.debug("theatas are - %.2f, %.2f, %.2f", np.degrees(theta1), np.degrees(theta2), np.degrees(theta3))
     return theta1, theta2, theta3
 
 def inverse_kinematics2(x, y, L1, L2):
@@ -56,23 +68,65 @@ def forward_kinematics(theta1, theta2, theta3):
     wrist_x = elbow_x + L2 * np.cos(theta1) * np.cos(theta2 + theta3)
     wrist_y = elbow_y + L2 * np.sin(theta1) * np.cos(theta2 + theta3)
     wrist_z = elbow_z + L2 * np.sin(theta2 + theta3)
-    print(f"calculated x y and z are {wrist_x, wrist_y, wrist_z}")
+    log.debug("calculated x y and z are %s", (wrist_x, wrist_y, wrist_z))
     
     return np.array([elbow_x, elbow_y, elbow_z]), np.array([wrist_x, wrist_y, wrist_z])
 
-def angle_to_step(angle1, angle2, angle3, steps_per_rev_1=800, steps_per_rev_2=1600, steps_per_rev_3 = 800):
+def angle_to_step(angle1, angle2, angle3, steps_per_rev_1=ARM.steps_per_rev[0], steps_per_rev_2=ARM.steps_per_rev[1],
+                  steps_per_rev_3=ARM.steps_per_rev[2]):
     steps1 = int((angle1 * steps_per_rev_1) / 360)
     steps2 = int((angle2 * steps_per_rev_2) / 360)
     steps3 = int((angle3 * steps_per_rev_3) / 360)
-    print(f"steps1 is {steps1}\nsteps2 is {steps2}\nsteps3 is {steps3}")
+    log.debug("steps1 is %s\nsteps2 is %s\nsteps3 is %s", steps1, steps2, steps3)
     return steps1, steps2, steps3
 
 
+# Static part of the figure (axes, layout), built once and sent with the page.
+# The callback below only patches the arm trace (index ARM_TRACE), so a slider drag sends a few
+# numbers instead of the whole figure, and the camera set by the user is never overwritten.
+ARM_TRACE = 3
+
+
+def build_base_figure():
+    axes = [
+        go.Scatter3d(x=[0, 20], y=[0, 0], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='X-axis'),
+        go.Scatter3d(x=[0, 0], y=[0, 20], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='Y-axis'),
+        go.Scatter3d(x=[0, 0], y=[0, 0], z=[0, 20], mode='lines', line=dict(color='black', width=3), name='Z-axis'),
+    ]
+
+    arm_segments = go.Scatter3d(
+        x=[0, 0, 0],
+        y=[0, 0, 0],
+        z=[0, 0, 0],
+        mode='lines+markers+text',
+        line=dict(color='blue', width=5),
+        marker=dict(size=5, color=['red', 'black', 'green']),
+        text=[None, None, None],
+        textposition="top center",
+        name='Arm'
+    )
+
+    layout = go.Layout(
+        scene=dict(
+            xaxis=dict(range=[-20, 20]),
+            yaxis=dict(range=[-20, 20]),
+            zaxis=dict(range=[-20, 20]),
+            aspectmode='cube'
+        ),
+        margin=dict(l=0, r=0, b=0, t=0),
+        uirevision='arm'  # keep the camera when the figure is updated
+    )
+    return go.Figure(data=axes + [arm_segments], layout=layout)
+
+
+base_figure = build_base_figure()
+
+
 # Dash app
 app = dash.Dash(__name__)
 
 app.layout = html.Div([
-    dcc.Graph(id='3d-arm', style={'height': '600px'}),
+    dcc.Graph(id='3d-arm', figure=base_figure, style={'height': '600px'}),
     html.Div([
         html.Label('X Coordinate', style={'fontWeight': 'bold', 'fontSize': '16px'}),
         dcc.Slider(id='x-slider', min=-20, max=20, step=0.1, value=15, 
@@ -103,53 +157,30 @@ app.layout = html.Div([
      Input('y-slider', 'value'),
      Input('z-slider', 'value'),
      Input('store-btn', 'n_clicks')],
-    [State('3d-arm', 'figure'), State('angles-store', 'data')]
 )
-def update_graph(x, y, z, n_clicks, existing_fig, angles_list):
-    theta1, theta2, theta3 = inverse_kinematics(x, y, z)
-   
-    elbow_pos, wrist_pos = forward_kinematics(theta1, theta2, theta3)
-    step1, step2, step3 = angle_to_step(theta1, theta2, theta3)
+def update_graph(x, y, z, n_clicks):
+    with telemetry.span("ui.ik"):
+        theta1, theta2, theta3 = inverse_kinematics(x, y, z)
 
-    # Create axis and arm lines
-    axes = [
-        go.Scatter3d(x=[0, 20], y=[0, 0], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='X-axis'),
-        go.Scatter3d(x=[0, 0], y=[0, 20], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='Y-axis'),
-        go.Scatter3d(x=[0, 0], y=[0, 0], z=[0, 20], mode='lines', line=dict(color='black', width=3), name='Z-axis'),
-    ]
-    
-    arm_segments = go.Scatter3d(
-        x=[0, elbow_pos[0], wrist_pos[0]],
-        y=[0, elbow_pos[1], wrist_pos[1]],
-        z=[0, elbow_pos[2], wrist_pos[2]],
-        mode='lines+markers+text',
-        line=dict(color='blue', width=5),
-        marker=dict(size=5, color=['red', 'black', 'green']),
-        text=[None, f'{np.degrees(theta3):.2f}°', f'{np.degrees(theta2):.2f}°'],
-        textposition="top center",
-        name='Arm'
-    )
-    
-    # Store angles if 'Store Angles' button is clicked
-    if n_clicks > len(angles_list):
-        angles_list.append([np.degrees(theta1), np.degrees(theta2), np.degrees(theta3)])
+    elbow_pos, wrist_pos = forward_kinematics(theta1, theta2, theta3)
+    with telemetry.span("ui.steps"):
+        step1, step2, step3 = angle_to_step(theta1, theta2, theta3)
 
-    data = axes + [arm_segments]
-    layout = go.Layout(
-        scene=dict(
-            xaxis=dict(range=[-20, 20]),
-            yaxis=dict(range=[-20, 20]),
-            zaxis=dict(range=[-20, 20]),
-            aspectmode='cube'
-        ),
-        margin=dict(l=0, r=0, b=0, t=0)
-    )
+    # Only the arm trace changes
+    fig_patch = Patch()
+    arm = fig_patch['data'][ARM_TRACE]
+    arm['x'] = [0, float(elbow_pos[0]), float(wrist_pos[0])]
+    arm['y'] = [0, float(elbow_pos[1]), float(wrist_pos[1])]
+    arm['z'] = [0, float(elbow_pos[2]), float(wrist_pos[2])]
+    arm['text'] = [None, f'{np.degrees(theta3):.2f}°', f'{np.degrees(theta2):.2f}°']
 
-    if existing_fig:
-        # Retain the camera (view) settings from the previous figure
-        layout.scene.camera = existing_fig['layout']['scene'].get('camera')
+    # Store angles if 'Store Angles' button is clicked, appended in place in the browser
+    if ctx.triggered_id == 'store-btn':
+        angles_patch = Patch()
+        angles_patch.append([float(np.degrees(theta1)), float(np.degrees(theta2)), float(np.degrees(theta3))])
+        return fig_patch, angles_patch
 
-    return go.Figure(data=data, layout=layout), angles_list
+    return fig_patch, dash.no_update
 
 @app.callback(
     Output('angles-store', 'clear_data'),
@@ -164,4 +195,5 @@ def move(n_clicks, angles_list):
     return dash.no_update
 
 if __name__ == '__main__':
+    telemetry.setup()  # ARM_LOG_LEVEL=debug shows the kinematics output, ARM_TELEMETRY_PORT serves the timings
     app.run_server(debug=True)
@@ -1,6 +1,16 @@
+import logging
+import os
+import sys
 import numpy as np
 import math
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared modules in the repo root
+# The vectorized versions live in the dependency free kinematics core, re-exported here
+from kinematics import inverse_kinematics_batch, xyz_to_steps_batch
+
+# Per call debug output, shown with ARM_LOG_LEVEL=debug (telemetry.configure_logging)
+log = logging.getLogger(__name__)
+
 # Arm lengths
 # L1 = 10  # Length of the first arm segment
 # L2 = 10  # Length of the second arm segment
@@ -15,7 +25,7 @@ def angle_to_step(angle1, angle2, angle3, steps_per_rev_1=2500, steps_per_rev_2=
     steps2 = int((angle2_deg * steps_per_rev_2) / 360)
     steps3 = int((angle3_deg * steps_per_rev_3) / 360)
     
-    print(f"steps1 is {steps1}\nsteps2 is {steps2}\nsteps3 is {steps3}")
+    log.debug("steps1 is %s\nsteps2 is %s\nsteps3 is %s", steps1, steps2, steps3)
     return steps1, steps2, steps3
 
 def inverse_kinematics(x, y, z,L1=10,L2=10):
@@ -79,10 +89,12 @@ def forward_kinematics(theta1, theta2, theta3, L1=10, L2=10):
 #         commands.append[step1, step2, step3]
 #     return commands
 
-def xyz_to_steps(curve, L1=21, L2=15):
+def xyz_to_steps(curve, L1=21, L2=15, accumulator=None):
     """
     Calculates the steps for each joint to move the robotic arm to each point in the curve,
     considering the current position.
+    With a step_accumulator.StepAccumulator the steps are taken from its absolute
+    step counts (no truncation drift) and it keeps the position between calls.
     """
     commands = []
     
@@ -91,6 +103,11 @@ def xyz_to_steps(curve, L1=21, L2=15):
     
     for x, y, z in curve:
         theta1, theta2, theta3 = inverse_kinematics(x, y, z, L1, L2)
+
+        if accumulator is not None:
+            step1, step2, step3 = accumulator.to_steps(theta1, theta2, theta3)
+            commands.append([-step3, step1, step2])
+            continue
         
         # Calculate angle differences (relative movement)
         delta_theta1 = theta1 - current_theta1
@@ -106,7 +123,7 @@ def xyz_to_steps(curve, L1=21, L2=15):
         
         # Update current angles to the new ones
         current_theta1, current_theta2, current_theta3 = theta1, theta2, theta3
-    
+
     return commands
 
 
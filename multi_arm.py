@@ -0,0 +1,241 @@
+import argparse
+import os
+import threading
+import time
+import tty
+
+import serial
+
+import command_stream
+import kinematics
+import serial_protocol
+import serial_transport
+
+# Several 3D arms driven from one process.
+#
+# Every arm gets its own port, StepAccumulator and SerialWriter (queue + writer thread),
+# so a port that is slow or stuck only holds up its own queue. The IK runs here, once per
+# trajectory, with the vectorized ArmModel.xyz_to_steps_batch of the arm in arm_config.json.
+# An arm's step counts (and frame numbers) only move on once its trajectory is queued,
+# a trajectory that couldn't be queued leaves them where they were.
+#
+#   cell = MultiArmController({"left": "/dev/ttyUSB0", "right": "/dev/ttyUSB1"})
+#   cell.move("left", curve)                                  # queued, returns at once
+#   start = cell.move_all({"left": curve_a, "right": curve_b}, delay=0.2)
+#   cell.flush(); cell.close()
+#
+# move_all() does the IK and encoding of every arm first, then queues each trajectory
+# to be written at the same time.monotonic() timestamp, so the arms start together
+# (to within the thread wake ups, about a millisecond on an idle host). An arm still
+# busy writing earlier moves at that time starts late, the others don't wait for it.
+# An arm whose queue is full is not waited for either : move_all() queues the others and
+# then raises StuckArmsError naming it. Ports are opened with `write_timeout`, so a port
+# nobody reads fails its writer (status() shows the error) instead of hanging close().
+#
+#   python multi_arm.py --arms 8 --stall 1       # check on pty stand-ins, one port never read
+
+
+class StuckArmsError(RuntimeError):
+    """
+    move_all() couldn't queue the trajectory of `arms` (name -> error), the other arms
+    were queued to start at `start`.
+    """
+
+    def __init__(self, arms, start):
+        super().__init__("not started : " + ", ".join(f"{name} ({error!r})" for name, error in arms.items()))
+        self.arms = arms
+        self.start = start
+
+
+class Arm:
+    def __init__(self, name, port, writer, model, binary=False):
+        self.name = name
+        self.port = port
+        self.writer = writer
+        self.model = model  # kinematics.ArmModel
+        self.tracker = model.accumulator()
+        self.binary = binary
+        self.frame_seq = 0
+
+    def commands(self, curve):
+        """
+        Step commands of `curve` from the tracker's position, and the position they end on.
+        The tracker itself is left as it is, see queue().
+        """
+        start = self.tracker.position
+        try:
+            commands = self.model.xyz_to_steps_batch(curve, accumulator=self.tracker)
+            return commands, self.tracker.position
+        finally:
+            self.tracker.position = start
+
+    def encode(self, commands):
+        """
+        The bytes to send and the frame number after them.
+        """
+        if self.binary:
+            frames, frame_seq = serial_protocol.encode_frames(commands, self.frame_seq)
+            return b"".join(frames), frame_seq
+        return serial_protocol.format_ascii(commands), self.frame_seq
+
+    def queue(self, encoded, position=None, at=None, timeout=None):
+        """
+        Send encode()'s bytes to the writer, then move the frame number and the tracker
+        (to `position`, when given) on. Nothing moves if the send raises.
+        """
+        data, frame_seq = encoded
+        self.writer.send(data, at=at, timeout=timeout)
+        self.frame_seq = frame_seq
+        if position is not None:
+            self.tracker.position = position
+
+
+class MultiArmController:
+    def __init__(self, ports, baudrate=9600, maxsize=64, binary=False, ack_streaming=False, arm="arm_3d",
+                 write_timeout=2.0):
+        """
+        ports maps arm names to serial port paths, all of them arms `arm` of arm_config.json.
+        Queues hold whole trajectories, maxsize per arm before move() blocks on that arm.
+        A port write taking longer than `write_timeout` seconds fails that arm's writer
+        (None waits for ever).
+        """
+        model = kinematics.ArmModel.load(arm)
+        self.arms = {}
+        try:
+            for name, path in ports.items():
+                port = serial.Serial(path, baudrate, timeout=1, write_timeout=write_timeout)
+                stream = command_stream.CommandStreamer(port, rx_buffer_size=64, window=4) if ack_streaming else port
+                writer = serial_transport.SerialWriter(stream, maxsize=maxsize, policy="block")
+                self.arms[name] = Arm(name, port, writer, model, binary=binary)
+        except Exception:
+            self.close(flush=False)
+            raise
+
+    def __getitem__(self, name):
+        return self.arms[name]
+
+    def send(self, name, commands, at=None):
+        arm = self.arms[name]
+        arm.queue(arm.encode(commands), at=at)
+
+    def move(self, name, curve, at=None):
+        """
+        IK, steps and encoding for one arm, queued for its writer. Returns the move count.
+        """
+        arm = self.arms[name]
+        commands, position = arm.commands(curve)
+        arm.queue(arm.encode(commands), position, at)
+        return len(commands)
+
+    def move_all(self, curves, delay=0.1):
+        """
+        Start a trajectory on every arm in `curves` (name -> points) at one shared time,
+        `delay` seconds from now, after all the IK is done. Returns that time (time.monotonic).
+        Arms with a full queue or a failed writer are skipped, see StuckArmsError.
+        """
+        payloads = {}
+        for name, curve in curves.items():
+            commands, position = self.arms[name].commands(curve)
+            payloads[name] = self.arms[name].encode(commands), position
+        start = time.monotonic() + delay
+        stuck = {}
+        for name, (encoded, position) in payloads.items():
+            try:
+                self.arms[name].queue(encoded, position, at=start, timeout=0)
+            except Exception as exc:  # queue.Full, or the port error that failed the writer
+                stuck[name] = exc
+        if stuck:
+            raise StuckArmsError(stuck, start)
+        return start
+
+    def status(self):
+        return {name: {"queued": arm.writer.depth(), "bytes_written": arm.writer.bytes_written,
+                       "messages_written": arm.writer.messages_written,
+                       "error": repr(arm.writer.error) if arm.writer.error else None}
+                for name, arm in self.arms.items()}
+
+    def flush(self, names=None):
+        for name in names or self.arms:
+            self.arms[name].writer.flush()
+
+    def close(self, flush=True):
+        for arm in self.arms.values():
+            arm.writer.close(flush=flush)
+            arm.port.close()
+
+
+def _pty():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave), slave
+
+
+def main():
+    parser = argparse.ArgumentParser(description="coordinated start of several arms on pty stand-ins")
+    parser.add_argument("--arms", type=int, default=8)
+    parser.add_argument("--stall", type=int, default=1, help="ports whose other end is never read")
+    parser.add_argument("--points", type=int, default=2000, help="points per trajectory")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--binary", action="store_true")
+    args = parser.parse_args()
+
+    ptys = {f"arm{i}": _pty() for i in range(args.arms)}
+    cell = MultiArmController({name: path for name, (_, path, _) in ptys.items()}, baudrate=115200, binary=args.binary)
+    stalled = set(list(ptys)[:args.stall])
+
+    # The board side : note when the first byte of each round arrives
+    first_byte = {name: [] for name in ptys}
+    received = {name: 0 for name in ptys}
+    waiting = {name: False for name in ptys}
+
+    def board(name, master):
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+            if waiting[name]:
+                first_byte[name].append(time.monotonic())
+                waiting[name] = False
+            received[name] += len(data)
+
+    for name, (master, _, _) in ptys.items():
+        if name not in stalled:
+            threading.Thread(target=board, args=(name, master), daemon=True).start()
+
+    fast = [name for name in ptys if name not in stalled]
+    skews = []
+    for r in range(args.rounds):
+        curves = {name: kinematics.random_curve(args.points, seed=r * 100 + i) for i, name in enumerate(ptys)}
+        waiting.update((name, True) for name in fast)
+        start = time.perf_counter()
+        try:
+            at = cell.move_all(curves, delay=0.05)
+        except StuckArmsError as exc:
+            at = exc.start
+            print(f"round {r} : {exc}")
+        dispatch = time.perf_counter() - start
+        cell.flush(fast)
+        time.sleep(0.02)
+        arrivals = [first_byte[name][r] for name in fast if len(first_byte[name]) > r]
+        skew = max(arrivals) - min(arrivals)
+        skews.append(skew)
+        print(f"round {r} : IK + encode + queue for {args.arms} x {args.points} points {dispatch * 1000:.1f} ms, "
+              f"{len(arrivals)}/{len(fast)} fast arms started {min(arrivals) - at:+.4f} s from the shared time, "
+              f"skew {skew * 1e6:.0f} us")
+
+    status = cell.status()
+    for name in stalled:
+        print(f"{name} (never read) : {status[name]['queued']} trajectories still queued, the others finished")
+    print(f"max skew {max(skews) * 1e6:.0f} us, bytes per fast arm {received[fast[0]]}")
+    start = time.perf_counter()
+    cell.close()
+    status = cell.status()
+    print(f"closed in {time.perf_counter() - start:.2f} s, stalled writers : "
+          + ", ".join(f"{name} {status[name]['error']}" for name in stalled))
+
+
+if __name__ == '__main__':
+    main()
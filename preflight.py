@@ -0,0 +1,276 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import kinematics
+
+# Checks on a whole trajectory before any of it is sent.
+#
+# The IK functions don't stop a bad job, they let it go wrong half way through :
+# xy_to_step_3D.inverse_kinematics pulls unreachable points onto the reach sphere without
+# a word, inverse_kinematics2D returns None (a TypeError in the step arithmetic once the
+# arm is already moving) or fails in acos for points closer than |L1 - L2|, and nothing
+# looks at joint limits or at how many steps a segment asks for in the time it has.
+# check_trajectory() looks at every point in one vectorized pass and reports the index
+# of each offender, so a job is refused before the first move :
+#   report = preflight.check_trajectory(curve, ARM, start=tracker.angles(), feed_rate=5.0)
+#   if not report.ok:
+#       print(report.summary())          # or report.check() to raise PreflightError
+#
+# Checks :
+#   invalid      NaN / inf coordinates
+#   unreachable  no IK solution inside the joint limits, or outside the shell
+#                |L1 - L2| .. L1 + L2 around the shoulder. With joint limits that means
+#                solving every branch, so the points are first looked up in a voxel map
+#                of the workspace (WorkspaceMap, built once per arm) and only those in
+#                voxels on its edge are solved. Without limits the distance alone is
+#                cheaper than the lookup and is used directly
+#   joint_limits the IK solution (or the given angles) outside ArmModel.joint_limits
+#   step_rate    segments whose busiest joint needs more than max_speed steps/s to make
+#                the segment time (segment_time s per segment, or length / feed_rate)
+#   step_size    segments with more than max_steps steps on a joint (e.g. 32767 to keep
+#                binary frames int16)
+# Segment i is the move into point i, segment 0 starts from the `start` pose.
+#
+#   python preflight.py --points 1000000     # time the checks on a long random job
+
+OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+CHECKS = ("invalid", "unreachable", "joint_limits", "step_rate", "step_size")
+
+
+class PreflightError(ValueError):
+    pass
+
+
+def _has_limits(arm):
+    return any(low > -math.inf or high < math.inf for low, high in arm.joint_limits)
+
+
+def reachable_exact(arm, points, chunk=1 << 18):
+    """
+    Boolean (N,) mask of the (N, 3) points with an IK solution inside the joint limits,
+    any of elbow up / down and the base either way.
+    """
+    dist = np.sqrt((points ** 2).sum(axis=1))
+    mask = (dist >= abs(arm.L1 - arm.L2)) & (dist <= arm.reach)
+    if _has_limits(arm):
+        for start in range(0, len(points), chunk):
+            branches = arm.ik_3d_branches(points[start:start + chunk], allow_flip=True)
+            mask[start:start + chunk] &= arm.branches_within_limits(branches).any(axis=1)
+    return mask
+
+
+class WorkspaceMap:
+    """
+    Voxel grid over the arm's reach, each voxel OUTSIDE, INSIDE or BOUNDARY of the
+    reachable workspace. Built once per arm geometry, limits and resolution, see for_arm().
+    """
+
+    _cache = {}
+
+    def __init__(self, arm, resolution):
+        self.arm = arm
+        self.resolution = float(resolution)
+        cells = int(np.ceil(2 * arm.reach / self.resolution)) + 2
+        self.origin = -arm.reach - self.resolution
+        self.shape = (cells, cells, cells)
+        # Voxels the shell surfaces pass through, from the distance of their centres
+        centres = self.origin + (np.arange(cells) + 0.5) * self.resolution
+        dist = np.sqrt(centres[:, None, None] ** 2 + centres[None, :, None] ** 2 + centres[None, None, :] ** 2)
+        half_diagonal = np.sqrt(3) / 2 * self.resolution
+        inner, outer = abs(arm.L1 - arm.L2), arm.reach
+        inside = (dist - half_diagonal >= inner) & (dist + half_diagonal <= outer)
+        outside = (dist + half_diagonal < inner) | (dist - half_diagonal > outer)
+        if _has_limits(arm):
+            # The joint limits cut the shell along curved surfaces with no simple distance
+            # test : solve at every voxel corner, voxels whose corners disagree are on the
+            # edge, and so are their neighbours in case a thin sliver fell between corners
+            ticks = self.origin + np.arange(cells + 1) * self.resolution
+            corners = np.stack(np.meshgrid(ticks, ticks, ticks, indexing="ij"), axis=-1).reshape(-1, 3)
+            ok = reachable_exact(arm, corners).reshape(cells + 1, cells + 1, cells + 1)
+            views = [ok[a:a + cells, b:b + cells, c:c + cells] for a in (0, 1) for b in (0, 1) for c in (0, 1)]
+            all_ok = np.logical_and.reduce(views)
+            none_ok = ~np.logical_or.reduce(views)
+            edge = ~all_ok & ~none_ok
+            for axis in range(3):
+                differs = np.diff(all_ok, axis=axis) | np.diff(none_ok, axis=axis)
+                lower = [slice(None)] * 3
+                upper = [slice(None)] * 3
+                lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+                edge[tuple(lower)] |= differs
+                edge[tuple(upper)] |= differs
+            inside &= all_ok & ~edge
+            outside |= none_ok & ~edge
+        grid = np.full(self.shape, BOUNDARY, dtype=np.int8)
+        grid[inside] = INSIDE
+        grid[outside] = OUTSIDE
+        self.flat = grid.ravel()
+
+    @classmethod
+    def for_arm(cls, arm, resolution=None):
+        resolution = resolution if resolution is not None else arm.reach / 64
+        key = (arm.L1, arm.L2, arm.joint_limits, resolution)
+        if key not in cls._cache:
+            cls._cache[key] = cls(arm, resolution)
+        return cls._cache[key]
+
+    def classify(self, points):
+        """
+        (N,) voxel states of (N, 3) finite points, OUTSIDE beyond the grid.
+        """
+        # The outermost layer of voxels is all OUTSIDE, so clipping sends every point
+        # beyond the grid to one of them, with no separate bounds mask
+        n = self.shape[0]
+        index = np.zeros(len(points), dtype=np.intp)
+        for axis in range(3):
+            cell = (points[:, axis] - self.origin) * (1.0 / self.resolution)
+            np.clip(cell, 0, n - 1, out=cell)
+            index *= n
+            index += cell.astype(np.intp)
+        return self.flat[index]
+
+    def reachable(self, points):
+        """
+        Boolean (N,) mask of the points the arm can reach.
+        """
+        states = self.classify(points)
+        mask = states == INSIDE
+        edge = np.flatnonzero(states == BOUNDARY)
+        if len(edge):
+            mask[edge] = reachable_exact(self.arm, points[edge])
+        return mask
+
+
+class PreflightReport:
+    def __init__(self, n_points, offenders, steps, segment_times):
+        self.n_points = n_points
+        self.offenders = offenders          # check name -> int array of point / segment indices
+        self.steps = steps                  # (N, 3) joint steps per segment, base, shoulder, elbow
+        self.segment_times = segment_times  # (N,) seconds each segment has, None without timing
+
+    @property
+    def ok(self):
+        return not any(len(indices) for indices in self.offenders.values())
+
+    def __getitem__(self, check):
+        return self.offenders[check]
+
+    def summary(self, show=10):
+        if self.ok:
+            return f"{self.n_points} points : ok"
+        lines = [f"{self.n_points} points :"]
+        for check in CHECKS:
+            indices = self.offenders[check]
+            if len(indices):
+                more = f" ... (+{len(indices) - show})" if len(indices) > show else ""
+                lines.append(f"  {check:<12} {len(indices):>7} at {indices[:show].tolist()}{more}")
+        return "\n".join(lines)
+
+    def check(self):
+        """
+        Raise PreflightError with the summary unless every check passed.
+        """
+        if not self.ok:
+            raise PreflightError(self.summary())
+        return self
+
+
+def check_trajectory(points, arm, start=None, angles=None, max_speed=(800, 800, 800), segment_time=None,
+                     feed_rate=None, max_steps=None, check_limits=True, workspace=None):
+    """
+    Validate a whole trajectory of (N, 3) points for `arm` (kinematics.ArmModel) from the
+    joint pose `start` (default zero angles). `angles` are the joint solutions that will be
+    sent (e.g. from plan_ik), by default arm.ik_3d_batch. check_limits=False leaves out the
+    joint limits of those angles, for callers whose IK picks in-limit solutions itself.
+    Returns a PreflightReport.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    start = np.zeros(3) if start is None else np.asarray(start, dtype=np.float64)
+    if workspace is None and _has_limits(arm):
+        workspace = WorkspaceMap.for_arm(arm)
+    offenders = {check: np.empty(0, dtype=np.intp) for check in CHECKS}
+
+    finite = np.isfinite(points).all(axis=1)
+    offenders["invalid"] = np.flatnonzero(~finite)
+    points = np.where(finite[:, None], points, 0.0)  # the checks below skip them
+    reachable = workspace.reachable(points) if workspace is not None else reachable_exact(arm, points)
+    offenders["unreachable"] = np.flatnonzero(finite & ~reachable)
+
+    angles = arm.ik_3d_batch(points) if angles is None else np.asarray(angles, dtype=np.float64).reshape(-1, 3)
+    if check_limits:
+        offenders["joint_limits"] = np.flatnonzero(finite & reachable & ~arm.within_limits_batch(angles))
+
+    # Whole steps like StepAccumulator : the rounded absolute targets, differenced
+    steps_per_rad = np.asarray(arm.steps_per_rad)
+    target = np.rint(angles * steps_per_rad)
+    steps = np.diff(target, axis=0, prepend=np.rint(start * steps_per_rad)[None, :]).astype(np.int64)
+    # Segments to or from an invalid point are already reported with it
+    valid = finite & np.concatenate(([True], finite[:-1]))
+    if max_steps is not None:
+        offenders["step_size"] = np.flatnonzero(valid & (np.abs(steps) > max_steps).any(axis=1))
+
+    times = None
+    if segment_time is not None:
+        times = np.broadcast_to(np.asarray(segment_time, dtype=np.float64), (len(points),))
+    elif feed_rate is not None:
+        tips = np.vstack((np.asarray(arm.fk_3d(*start)[1])[None, :], points))
+        times = np.sqrt((np.diff(tips, axis=0) ** 2).sum(axis=1)) / feed_rate
+    if times is not None:
+        needed = (np.abs(steps) / np.asarray(max_speed, dtype=np.float64)).max(axis=1)
+        offenders["step_rate"] = np.flatnonzero(valid & (needed > times * (1 + 1e-9)))
+    return PreflightReport(len(points), offenders, steps, times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time the pre-flight checks on a random trajectory")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    parser.add_argument("--limits", type=float, nargs=6, default=(-170, 170, -90, 120, -150, 150),
+                        metavar="DEG", help="base, shoulder and elbow low / high, for an arm without limits")
+    parser.add_argument("--feed-rate", type=float, default=2.0, help="length units/s")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    arm = kinematics.ArmModel.load(args.arm)
+    if not _has_limits(arm):
+        limits = [(math.radians(low), math.radians(high)) for low, high in zip(args.limits[::2], args.limits[1::2])]
+        arm = kinematics.ArmModel(arm.L1, arm.L2, arm.steps_per_rev, limits, arm.name)
+    rng = np.random.default_rng(0)
+    # A random walk in front of the arm, with a few faults put in
+    points = np.cumsum(rng.normal(0.0, 0.002 * arm.reach, (args.points, 3)), axis=0)
+    points = (points - points.mean(axis=0)) / np.abs(points - points.mean(axis=0)).max() * 0.35 * arm.reach
+    points += [0.5 * arm.reach, 0.0, 0.2 * arm.reach]
+    points[rng.integers(0, args.points, 5)] = np.nan
+    points[rng.integers(0, args.points, 5)] = [2 * arm.reach, 0.0, 0.0]
+    points[rng.integers(0, args.points, 5)] = [0.0, 0.0, 0.0]
+
+    start = time.perf_counter()
+    workspace = WorkspaceMap.for_arm(arm)
+    build = time.perf_counter() - start
+    finite = np.nan_to_num(points)
+    start = time.perf_counter()
+    exact = reachable_exact(arm, finite)
+    exact_time = time.perf_counter() - start
+    start = time.perf_counter()
+    mapped = workspace.reachable(finite)
+    mapped_time = time.perf_counter() - start
+    assert (mapped == exact).all()
+    print(f"workspace map {workspace.shape[0]}^3 voxels built in {build * 1000:.0f} ms, reachability "
+          f"{mapped_time * 1000:.0f} ms with it / {exact_time * 1000:.0f} ms solving every point, "
+          f"{(workspace.classify(finite) == BOUNDARY).mean():.1%} of the points on edge voxels")
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        report = check_trajectory(points, arm, feed_rate=args.feed_rate)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(report.summary())
+    print(f"checked {args.points} points in {best * 1000:.1f} ms ({args.points / best / 1e6:.1f} M points/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,39 @@
+import os
 import serial
 import time
 import keyboard  # Make sure to install this library
 import two_D_UI
+import serial_transport
+import command_stream
+import arm_daemon
+import jog_controller
+import kinematics
+import telemetry
 
-# This connects to the pyserial communication in Arduino
-arduino = serial.Serial('COM5', 9600, timeout=1)
-time.sleep(2)  # Wait for the connection to establish
+# ARM_TELEMETRY=1 records latency spans and throughput counters (telemetry.py), dumped on exit
+telemetry.setup()
+
+# ARM_DAEMON=<socket> sends through a running arm_daemon.py, which keeps the port open : no board reset
+# and no 2 s wait. Otherwise this connects to the pyserial communication in Arduino, ARDUINO_PORT
+# overrides the port (e.g. virtual_arduino.py)
+USE_DAEMON = bool(os.environ.get("ARM_DAEMON"))
+if USE_DAEMON:
+    arduino = arm_daemon.ArmClient(os.environ["ARM_DAEMON"])
+else:
+    arduino = serial.Serial(os.environ.get("ARDUINO_PORT", "COM5"), 9600, timeout=1)
+    time.sleep(2)  # Wait for the connection to establish
+
+# Stream commands in frames sized to the Arduino receive buffer, paced by its "ok" acks
+# (needs a sketch that acks every line), instead of sending everything at once. Through the daemon
+# this is its --ack-streaming option instead
+ACK_STREAMING = False
+port = command_stream.CommandStreamer(arduino, rx_buffer_size=64, window=4) if ACK_STREAMING and not USE_DAEMON else arduino
+
+# Writes go through a background thread so key handlers and the input loop never block on the port
+writer = serial_transport.SerialWriter(port, maxsize=64, policy="block")
 
 def send_to_arduino(command):
-    arduino.write((command + '\n').encode())  # Send command with newline to Arduino
+    writer.send((command + '\n').encode())  # Queue command with newline for the Arduino
 
 # Function to send signal to Arduino
 def control_led(state):
@@ -18,11 +43,19 @@ def control_led(state):
     elif state == "off":
         send_to_arduino("off")
 
-def send_commands_to_arduino(commands):
-    command_str = ";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in commands])
+def send_commands_to_arduino(commands, trace=None):
+    telemetry.count("commands", len(commands))
+    with telemetry.span("encode"):
+        command_str = ";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in commands])
     print(command_str)
-    arduino.write((command_str + '\n').encode())  # Send command to Arduino
-    time.sleep(0.1)  # Optional delay after sending commands
+    with telemetry.span("enqueue"):
+        writer.send((command_str + '\n').encode(), trace)  # Queue command for the Arduino, returns immediately
+
+# Gearing of the two motors, from arm_config.json (ARM_CONFIG points to another file)
+ARM = kinematics.ArmModel.load("arm_2d")
+
+# Absolute step counts of the two motors, kept across UI sessions so nothing is lost to rounding
+step_tracker = ARM.accumulator()
 
 # Initialize commands
 commands = []
@@ -30,33 +63,45 @@ commands = []
 # Function to handle key presses
 def handle_keypress(event):
     global commands  # Use the global commands variable
+    trace = telemetry.begin()  # key press to bytes on the wire
     if event.name == 'up':
         commands = [[10, 0, 0]]  # Set command for up arrow
         print("--- x moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'down':
         commands = [[-10, 0, 0]]  # Set command for down arrow
         print("--- x moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'left':
         commands = [[0, 10, 0]]  # Set command for left arrow
         print("---  y moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'right':
         commands = [[0, -10, 0]]  # Set command for right arrow
         print("---  y moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'comma':  # Represents the '<' key
         commands = [[0, 0, 10]]  # Set command for '<' key
         print("---  z moving forward")
-        send_commands_to_arduino(commands)  # Call function to send command to Arduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to Arduino
     elif event.name == 'period':  # Represents the '>' key
         commands = [[0, 0, -10]]  # Set command for '>' key
         print("---  z moving backward")
-        send_commands_to_arduino(commands)  # Call function to send command to A,,,,,,...........rduino
+        send_commands_to_arduino(commands, trace)  # Call function to send command to A,,,,,,...........rduino
+
+# Hold-to-move jogging (jog_controller.py) : key events are gathered into one command every 100 ms,
+# a tap still moves 10 steps and motion stops once the keys are released. Off by default : a command per key event, as before
+JOG_MODE = False
+JOG_MAX_SPEED = 800  # steps/s the motors run at, jogging never queues steps faster than that
+jog = jog_controller.JogController(lambda cmd: send_commands_to_arduino([cmd], telemetry.begin()), tap_steps=10,
+                                   max_speed=JOG_MAX_SPEED)
 
 # Listen for key presses
-keyboard.on_press(handle_keypress)
+if JOG_MODE:
+    jog.start()
+    keyboard.hook(jog.handle_event)  # presses and releases
+else:
+    keyboard.on_press(handle_keypress)
 keyboard.add_hotkey('<', lambda: [print("z moving forward"), send_commands_to_arduino([[0, 0, 10]])])
 keyboard.add_hotkey('>', lambda: [print("z moving backward"), send_commands_to_arduino([[0, 0, -10]])])
 
@@ -79,16 +124,23 @@ try:
             
             while user_input != "q" :
                 commands = []
-                step_list = two_D_UI.run_ui()
+                step_list = two_D_UI.run_ui(step_tracker)
+                trace = telemetry.begin()  # Move clicked to bytes on the wire
                 for steps in step_list :
                     commands.append([-steps[1], 0, steps[0]])
-                send_commands_to_arduino(commands)
+                send_commands_to_arduino(commands, trace)
                 user_input = input("give e to stop or 3 ints, one for each motor : ")
 
 except KeyboardInterrupt:
     print("\nProgram interrupted.")
 
 finally:
-    # Always close the serial connection when done
+    # Always close the serial connection when done, after the queued commands went out
+    if JOG_MODE:
+        keyboard.unhook_all()
+        jog.stop()
+    writer.close()
     arduino.close()
-    print("Serial connection closed.")
\ No newline at end of file
+    print("Serial connection closed.")
+    if telemetry.ENABLED:
+        print(f"Telemetry written to {telemetry.dump()}")
\ No newline at end of file
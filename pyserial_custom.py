@@ -1,8 +1,9 @@
+import os
 import serial
 import time
 
-# Replace 'COM3' with your Arduino's serial port (check in Arduino IDE under Tools > Port)
-arduino = serial.Serial('COM5', 9600, timeout=1)
+# Replace 'COM3' with your Arduino's serial port (check in Arduino IDE under Tools > Port), or set ARDUINO_PORT
+arduino = serial.Serial(os.environ.get("ARDUINO_PORT", "COM5"), 9600, timeout=1)
 time.sleep(2)  # Wait for the connection to establish
 
 def send_to_arduino(command):
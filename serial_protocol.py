@@ -0,0 +1,132 @@
+import binascii
+import struct
+
+# Command encodings for the Arduino link.
+#
+# ASCII (what the sketches parse today) :
+#   "A10,B0,C5;A-3,B2,C0\n"
+#
+# Binary frame (optional, much smaller per move) :
+#   SYNC | flags | seq | count | count * (a, b, c) | crc16
+#   1 B    1 B     1 B   1 B     3, 6 or 12 B per move     2 B
+#
+# flags bits 0-1 select the triple width : 0 int16, 1 int32, 2 int8. The encoder
+# picks the narrowest one every value of the frame fits in. All integers are little
+# endian except the crc, which is CRC-CCITT (binascii.crc_hqx, init 0xFFFF) over
+# flags..payload sent big endian, the usual order for the Arduino CRC16 helpers.
+
+SYNC = 0xA5
+FLAG_INT16 = 0x00
+FLAG_INT32 = 0x01
+FLAG_INT8 = 0x02
+WIDTH_MASK = 0x03
+MAX_MOVES_PER_FRAME = 255
+HEADER_SIZE = 4
+CRC_SIZE = 2
+
+# flags -> (struct code, bytes per value)
+WIDTHS = {FLAG_INT8: ("b", 1), FLAG_INT16: ("h", 2), FLAG_INT32: ("i", 4)}
+
+
+def format_ascii(commands):
+    """
+    The existing text format : [[a, b, c], ...] -> b"Aa,Bb,Cc;...\\n"
+    """
+    return (";".join([f"A{cmd[0]},B{cmd[1]},C{cmd[2]}" for cmd in commands]) + "\n").encode()
+
+
+def _flatten(commands):
+    if hasattr(commands, "ravel"):  # numpy array, no need to import numpy here
+        return [int(v) for v in commands.ravel()]
+    return [int(v) for cmd in commands for v in cmd[:3]]
+
+
+def encode_frame(commands, seq=0):
+    """
+    Pack up to MAX_MOVES_PER_FRAME [a, b, c] step triples into one binary frame,
+    using the narrowest of int8 / int16 / int32 that holds every value.
+    """
+    values = _flatten(commands)
+    count = len(values) // 3
+    if count > MAX_MOVES_PER_FRAME:
+        raise ValueError(f"a frame holds at most {MAX_MOVES_PER_FRAME} moves, got {count}")
+
+    low, high = (min(values), max(values)) if values else (0, 0)
+    if -128 <= low and high <= 127:
+        flags = FLAG_INT8
+    elif -32768 <= low and high <= 32767:
+        flags = FLAG_INT16
+    else:
+        flags = FLAG_INT32
+    fmt = WIDTHS[flags][0]
+
+    body = struct.pack(f"<BBB{len(values)}{fmt}", flags, seq & 0xFF, count, *values)
+    crc = binascii.crc_hqx(body, 0xFFFF)
+    return bytes([SYNC]) + body + crc.to_bytes(2, "big")
+
+
+def encode_frames(commands, seq=0, max_moves=MAX_MOVES_PER_FRAME):
+    """
+    Split a whole trajectory into consecutive frames, returns (frames, next_seq).
+    """
+    frames = []
+    for start in range(0, len(commands), max_moves):
+        frames.append(encode_frame(commands[start:start + max_moves], seq))
+        seq = (seq + 1) & 0xFF
+    return frames, seq
+
+
+def frame_size(count, flags=FLAG_INT16):
+    return HEADER_SIZE + count * 3 * WIDTHS[flags & WIDTH_MASK][1] + CRC_SIZE
+
+
+class FrameDecoder:
+    """
+    Reference decoder that mirrors what the firmware has to do : feed it raw bytes
+    in any chunking and it returns the complete frames as (seq, [[a, b, c], ...]).
+    Bytes that do not start a valid frame are skipped and counted in `dropped`,
+    a bad crc drops the sync byte and resyncs on the next one.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.dropped = 0
+        self.crc_errors = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        buf = self.buffer
+        while True:
+            start = buf.find(SYNC)
+            if start < 0:
+                self.dropped += len(buf)
+                buf.clear()
+                break
+            if start:
+                self.dropped += start
+                del buf[:start]
+            if len(buf) < HEADER_SIZE:
+                break
+
+            flags, seq, count = buf[1], buf[2], buf[3]
+            if flags & WIDTH_MASK not in WIDTHS:
+                self.dropped += 1
+                del buf[:1]
+                continue
+            size = frame_size(count, flags)
+            if len(buf) < size:
+                break
+
+            body = bytes(buf[1:size - CRC_SIZE])
+            crc = int.from_bytes(buf[size - CRC_SIZE:size], "big")
+            if binascii.crc_hqx(body, 0xFFFF) != crc:
+                self.crc_errors += 1
+                self.dropped += 1
+                del buf[:1]
+                continue
+
+            values = struct.unpack_from(f"<{count * 3}{WIDTHS[flags & WIDTH_MASK][0]}", body, 3)
+            frames.append((seq, [list(values[i:i + 3]) for i in range(0, len(values), 3)]))
+            del buf[:size]
+        return frames
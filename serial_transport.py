@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+
+import telemetry
+
+# Background writer for the Arduino serial port.
+# Callers put bytes on a bounded queue and return straight away, one thread does the
+# blocking port.write calls in order. What happens when the queue is full is chosen
+# with `policy` :
+#   "block"       wait for room (optionally up to `timeout`, then queue.Full)
+#   "drop-oldest" throw away the oldest queued message to make room
+#   "raise"       raise queue.Full immediately
+# drop-oldest loses motion, only use it for messages where the latest one wins.
+# A telemetry.begin() token passed to send() is closed once its bytes are written.
+# send(data, at=t) holds the data back until time.monotonic() reaches t, several writers
+# given the same t start their ports together (multi_arm.py).
+
+POLICIES = ("block", "drop-oldest", "raise")
+
+_STOP = object()
+
+
+class SerialWriter:
+    def __init__(self, port, maxsize=64, policy="block", timeout=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, got {policy!r}")
+        self.port = port
+        self.policy = policy
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.bytes_written = 0
+        self.messages_written = 0
+        self.dropped = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="serial-writer", daemon=True)
+        self._thread.start()
+
+    def send(self, data, trace=None, at=None, timeout=None):
+        """
+        Queue bytes (or str, sent utf-8 encoded) for the writer thread, to be written
+        no earlier than time.monotonic() `at` if given. `timeout` overrides the writer's
+        for this call with the "block" policy, 0 raises queue.Full at once.
+        """
+        if self._closed:
+            raise RuntimeError("SerialWriter is closed")
+        if self.error is not None:
+            raise self.error
+        if isinstance(data, str):
+            data = data.encode()
+        item = (data, trace, at)
+
+        if self.policy == "block":
+            self.queue.put(item, timeout=self.timeout if timeout is None else timeout)
+        elif self.policy == "raise":
+            self.queue.put_nowait(item)
+        else:
+            # Pop and push under a lock so two producers can't both evict for one slot
+            with self._lock:
+                while True:
+                    try:
+                        self.queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            self.queue.get_nowait()
+                            self.queue.task_done()
+                            self.dropped += 1
+                            telemetry.count("serial.dropped")
+                        except queue.Empty:
+                            pass
+        telemetry.gauge("writer.queue_depth", self.queue.qsize())
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def flush(self):
+        """
+        Block until everything queued so far has been written to the port.
+        """
+        self.queue.join()
+
+    def close(self, flush=True):
+        if self._closed:
+            return
+        if flush:
+            self.flush()
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self.error is None:
+                    data, trace, at = item
+                    if at is not None:
+                        delay = at - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    with telemetry.span("serial.write"):
+                        self.port.write(data)
+                    self.bytes_written += len(data)
+                    self.messages_written += 1
+                    telemetry.count("serial.bytes", len(data))
+                    telemetry.count("serial.messages")
+                    telemetry.finish(trace)
+            except Exception as exc:  # keep draining so flush() can't hang, report on next send
+                self.error = exc
+            finally:
+                self.queue.task_done()
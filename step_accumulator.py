@@ -0,0 +1,66 @@
+import math
+
+# Absolute step bookkeeping for the joints.
+#
+# angle_to_step() turns every relative angle change into steps with int(), so the
+# fraction of a step cut off on each move is lost for good and the arm drifts on long
+# jobs. StepAccumulator instead remembers how many steps each motor has been commanded
+# in total, rounds the absolute target of every new pose, and sends the difference :
+# the commanded position is never more than half a step off, however long the job.
+#
+#   tracker = StepAccumulator([2500, 2500, 2500])
+#   d1, d2, d3 = tracker.to_steps(theta1, theta2, theta3)      # radians, absolute pose
+#   deltas = tracker.to_steps_batch(angles)                    # (N, joints) array of poses
+#
+# Keep one tracker for the whole session so moves stay relative to where the arm is.
+
+
+class StepAccumulator:
+    def __init__(self, steps_per_rev, start_angles=None):
+        self.steps_per_rev = [float(s) for s in steps_per_rev]
+        self.steps_per_rad = [s / (2 * math.pi) for s in self.steps_per_rev]
+        if start_angles is None:
+            start_angles = [0.0] * len(self.steps_per_rev)
+        self.position = self.target_steps(start_angles)
+
+    def target_steps(self, angles):
+        """
+        Absolute step count of each joint for absolute joint angles in radians.
+        """
+        return [round(angle * k) for angle, k in zip(angles, self.steps_per_rad)]
+
+    def to_steps(self, *angles):
+        """
+        Relative steps to go from the last commanded pose to `angles`, and remember them.
+        """
+        target = self.target_steps(angles)
+        deltas = [t - p for t, p in zip(target, self.position)]
+        self.position = target
+        return deltas
+
+    def to_steps_batch(self, angles):
+        """
+        Same as to_steps for an (N, joints) array of poses, returns (N, joints) int32 deltas.
+        """
+        import numpy as np  # only the batch path needs numpy
+
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1, len(self.steps_per_rad))
+        if len(angles) == 0:
+            return np.empty((0, len(self.steps_per_rad)), dtype=np.int32)
+        # np.rint rounds halves to even where round() does too, so both paths agree
+        target = np.rint(angles * np.asarray(self.steps_per_rad)).astype(np.int64)
+        deltas = np.diff(target, axis=0, prepend=np.asarray(self.position, dtype=np.int64)[None, :])
+        self.position = [int(t) for t in target[-1]]
+        return deltas.astype(np.int32)
+
+    def angles(self):
+        """
+        The commanded pose in radians, as the motors see it.
+        """
+        return [p / k for p, k in zip(self.position, self.steps_per_rad)]
+
+    def reset(self, angles=None):
+        """
+        After homing : the arm is at `angles` (default all zero).
+        """
+        self.position = self.target_steps(angles if angles is not None else [0.0] * len(self.steps_per_rad))
@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Timing spans, histograms and counters from operator input to bytes on the wire.
+#
+# Off unless ARM_TELEMETRY=1 (or enable()). When off, span() hands back one shared
+# do-nothing context manager and begin() returns None, so the instrumented code pays a
+# function call and nothing else.
+#
+#   trace = telemetry.begin()                  # when the key press / click comes in
+#   with telemetry.span("ik"):
+#       ...
+#   writer.send(data, trace)                   # SerialWriter closes the trace after port.write
+#   telemetry.count("serial.bytes", len(data))
+#   telemetry.gauge("writer.queue_depth", writer.depth())
+#
+#   print(telemetry.report())                  # or dump() to ARM_TELEMETRY_FILE, or serve(9109)
+#
+# The control scripts call setup() at start and dump() on exit, ARM_TELEMETRY_PORT=9109
+# also serves the report as text while they run.
+#
+# Debug output of the kinematics goes through logging instead of print(),
+# configure_logging() sets the level from ARM_LOG_LEVEL (default info, so it is hidden).
+
+ENABLED = os.environ.get("ARM_TELEMETRY", "") not in ("", "0")
+
+_lock = threading.Lock()
+_started = time.monotonic()
+histograms = {}
+counters = {}
+gauges = {}
+
+
+def configure_logging(level=None):
+    level = level or os.environ.get("ARM_LOG_LEVEL", "info")
+    logging.basicConfig(level=level.upper(), format="%(message)s")
+
+
+def setup():
+    configure_logging()
+    if ENABLED and os.environ.get("ARM_TELEMETRY_PORT"):
+        serve(int(os.environ["ARM_TELEMETRY_PORT"]))
+
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = flag
+
+
+def reset():
+    global _started
+    with _lock:
+        histograms.clear()
+        counters.clear()
+        gauges.clear()
+        _started = time.monotonic()
+
+
+class Histogram:
+    """
+    Durations in ns in power of two buckets, so recording stays O(1) and memory flat.
+    Percentiles are the upper edge of the bucket they fall in (within 2x).
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def add(self, ns):
+        bucket = max(0, int(ns)).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += ns
+        self.min = ns if self.min is None else min(self.min, ns)
+        self.max = max(self.max, ns)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, (1 << bucket) - 1)
+        return self.max
+
+
+def observe(name, ns):
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(ns)
+
+
+def count(name, n=1):
+    if ENABLED:
+        with _lock:
+            counters[name] = counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    if ENABLED:
+        gauges[name] = value
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    return _Span(name) if ENABLED else _NO_SPAN
+
+
+def begin():
+    """
+    Start an end-to-end trace, returns a token to hand along with the command (None when off).
+    """
+    return time.perf_counter_ns() if ENABLED else None
+
+
+def finish(token, name="input_to_wire"):
+    if token is not None:
+        observe(name, time.perf_counter_ns() - token)
+
+
+def report():
+    elapsed = max(time.monotonic() - _started, 1e-9)
+    lines = [f"# telemetry over {elapsed:.1f} s"]
+    with _lock:
+        for name in sorted(histograms):
+            h = histograms[name]
+            lines.append(f"{name:<28} n={h.count:<8} mean={h.total / h.count / 1e3:>10.1f}us "
+                         f"p50={h.percentile(50) / 1e3:>10.1f}us p99={h.percentile(99) / 1e3:>10.1f}us "
+                         f"max={h.max / 1e3:>10.1f}us")
+        for name in sorted(counters):
+            lines.append(f"{name:<28} total={counters[name]:<10} rate={counters[name] / elapsed:.1f}/s")
+        for name in sorted(gauges):
+            lines.append(f"{name:<28} now={gauges[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path=None):
+    path = path or os.environ.get("ARM_TELEMETRY_FILE", "telemetry.txt")
+    with open(path, "w") as f:
+        f.write(report())
+    return path
+
+
+def serve(port=9109, host="127.0.0.1"):
+    """
+    Serve report() as plain text on http://host:port/ from a daemon thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = report().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="telemetry-http", daemon=True).start()
+    return server
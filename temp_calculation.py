@@ -1,7 +1,9 @@
+import logging
 import numpy as np
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+from dash import Patch, ctx
 from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import math
@@ -12,6 +14,9 @@ L2 = 10  # Length of second segment (elbow to wrist)
 
 stored_angles = []  # List to store angles
 
+# Per call debug output, shown with ARM_LOG_LEVEL=debug (telemetry.configure_logging)
+log = logging.getLogger(__name__)
+
 # Inverse kinematics function
 def inverse_kinematics(x, y, z):
     r = np.sqrt(x**2 + y**2)  # Projection in the xy-plane
@@ -36,11 +41,11 @@ def inverse_kinematics(x, y, z):
     theta1_deg = np.degrees(theta1)
     if -30 <= theta1_deg <= 30:
         # Return elbow up configuration
-        print("up angles (in degrees): ", math.degrees(theta1_elbow_up), math.degrees(theta2_elbow_up), math.degrees(theta3_elbow_up))
+        log.debug("up angles (in degrees): %s %s %s", math.degrees(theta1_elbow_up), math.degrees(theta2_elbow_up), math.degrees(theta3_elbow_up))
         return theta1_elbow_up, theta2_elbow_up, theta3_elbow_up
     else:
         # Return elbow down configuration
-        print("down angles (in degrees): ", math.degrees(theta1_elbow_down), math.degrees(theta2_elbow_down), math.degrees(theta3_elbow_down))
+        log.debug("down angles (in degrees): %s %s %s", math.degrees(theta1_elbow_down), math.degrees(theta2_elbow_down), math.degrees(theta3_elbow_down))
         return theta1_elbow_down, theta2_elbow_down, theta3_elbow_down
 
 # Function to calculate theta1 and theta2 for both elbow configurations
@@ -117,7 +122,7 @@ def forward_kinematics(theta1, theta2, theta3):
     wrist_y = elbow_y + L2 * np.sin(theta1) * np.cos(theta2 + theta3)
     wrist_z = elbow_z + L2 * np.sin(theta2 + theta3)
     
-    print(f"Calculated wrist x, y, z are: {wrist_x:.2f}, {wrist_y:.2f}, {wrist_z:.2f}")
+    log.debug("Calculated wrist x, y, z are: %.2f, %.2f, %.2f", wrist_x, wrist_y, wrist_z)
     
     return np.array([elbow_x, elbow_y, elbow_z]), np.array([wrist_x, wrist_y, wrist_z])
 
@@ -125,15 +130,56 @@ def angle_to_step(angle1, angle2, angle3, steps_per_rev_1=800, steps_per_rev_2=1
     steps1 = int((angle1 * steps_per_rev_1) / 360)
     steps2 = int((angle2 * steps_per_rev_2) / 360)
     steps3 = int((angle3 * steps_per_rev_3) / 360)
-    print(f"steps1 is {steps1}\nsteps2 is {steps2}\nsteps3 is {steps3}")
+    log.debug("steps1 is %s\nsteps2 is %s\nsteps3 is %s", steps1, steps2, steps3)
     return steps1, steps2, steps3
 
 
+# Static part of the figure (axes, layout), built once and sent with the page.
+# The callback below only patches the arm trace (index ARM_TRACE), so a slider drag sends a few
+# numbers instead of the whole figure, and the camera set by the user is never overwritten.
+ARM_TRACE = 3
+
+
+def build_base_figure():
+    axes = [
+        go.Scatter3d(x=[0, 20], y=[0, 0], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='X-axis'),
+        go.Scatter3d(x=[0, 0], y=[0, 20], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='Y-axis'),
+        go.Scatter3d(x=[0, 0], y=[0, 0], z=[0, 20], mode='lines', line=dict(color='black', width=3), name='Z-axis'),
+    ]
+
+    arm_segments = go.Scatter3d(
+        x=[0, 0, 0],
+        y=[0, 0, 0],
+        z=[0, 0, 0],
+        mode='lines+markers+text',
+        line=dict(color='blue', width=5),
+        marker=dict(size=5, color=['red', 'black', 'green']),
+        text=[None, None, None],
+        textposition="top center",
+        name='Arm'
+    )
+
+    layout = go.Layout(
+        scene=dict(
+            xaxis=dict(range=[-20, 20]),
+            yaxis=dict(range=[-20, 20]),
+            zaxis=dict(range=[-20, 20]),
+            aspectmode='cube'
+        ),
+        margin=dict(l=0, r=0, b=0, t=0),
+        uirevision='arm'  # keep the camera when the figure is updated
+    )
+    return go.Figure(data=axes + [arm_segments], layout=layout)
+
+
+base_figure = build_base_figure()
+
+
 # Dash app
 app = dash.Dash(__name__)
 
 app.layout = html.Div([
-    dcc.Graph(id='3d-arm', style={'height': '600px'}),
+    dcc.Graph(id='3d-arm', figure=base_figure, style={'height': '600px'}),
     html.Div([
         html.Label('X Coordinate', style={'fontWeight': 'bold', 'fontSize': '16px'}),
         dcc.Slider(id='x-slider', min=-20, max=20, step=0.1, value=15, 
@@ -164,53 +210,28 @@ app.layout = html.Div([
      Input('y-slider', 'value'),
      Input('z-slider', 'value'),
      Input('store-btn', 'n_clicks')],
-    [State('3d-arm', 'figure'), State('angles-store', 'data')]
 )
-def update_graph(x, y, z, n_clicks, existing_fig, angles_list):
+def update_graph(x, y, z, n_clicks):
     theta1, theta2, theta3 = inverse_kinematics(x, y, z)
-   
+
     elbow_pos, wrist_pos = forward_kinematics(theta1, theta2, theta3)
     step1, step2, step3 = angle_to_step(theta1, theta2, theta3)
 
-    # Create axis and arm lines
-    axes = [
-        go.Scatter3d(x=[0, 20], y=[0, 0], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='X-axis'),
-        go.Scatter3d(x=[0, 0], y=[0, 20], z=[0, 0], mode='lines', line=dict(color='black', width=3), name='Y-axis'),
-        go.Scatter3d(x=[0, 0], y=[0, 0], z=[0, 20], mode='lines', line=dict(color='black', width=3), name='Z-axis'),
-    ]
-    
-    arm_segments = go.Scatter3d(
-        x=[0, elbow_pos[0], wrist_pos[0]],
-        y=[0, elbow_pos[1], wrist_pos[1]],
-        z=[0, elbow_pos[2], wrist_pos[2]],
-        mode='lines+markers+text',
-        line=dict(color='blue', width=5),
-        marker=dict(size=5, color=['red', 'black', 'green']),
-        text=[None, f'{np.degrees(theta3):.2f}°', f'{np.degrees(theta2):.2f}°'],
-        textposition="top center",
-        name='Arm'
-    )
-    
-    # Store angles if 'Store Angles' button is clicked
-    if n_clicks > len(angles_list):
-        angles_list.append([np.degrees(theta1), np.degrees(theta2), np.degrees(theta3)])
-
-    data = axes + [arm_segments]
-    layout = go.Layout(
-        scene=dict(
-            xaxis=dict(range=[-20, 20]),
-            yaxis=dict(range=[-20, 20]),
-            zaxis=dict(range=[-20, 20]),
-            aspectmode='cube'
-        ),
-        margin=dict(l=0, r=0, b=0, t=0)
-    )
-
-    if existing_fig:
-        # Retain the camera (view) settings from the previous figure
-        layout.scene.camera = existing_fig['layout']['scene'].get('camera')
-
-    return go.Figure(data=data, layout=layout), angles_list
+    # Only the arm trace changes
+    fig_patch = Patch()
+    arm = fig_patch['data'][ARM_TRACE]
+    arm['x'] = [0, float(elbow_pos[0]), float(wrist_pos[0])]
+    arm['y'] = [0, float(elbow_pos[1]), float(wrist_pos[1])]
+    arm['z'] = [0, float(elbow_pos[2]), float(wrist_pos[2])]
+    arm['text'] = [None, f'{np.degrees(theta3):.2f}°', f'{np.degrees(theta2):.2f}°']
+
+    # Store angles if 'Store Angles' button is clicked, appended in place in the browser
+    if ctx.triggered_id == 'store-btn':
+        angles_patch = Patch()
+        angles_patch.append([float(np.degrees(theta1)), float(np.degrees(theta2)), float(np.degrees(theta3))])
+        return fig_patch, angles_patch
+
+    return fig_patch, dash.no_update
 
 @app.callback(
     Output('angles-store', 'clear_data'),
@@ -0,0 +1,424 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+import kinematics
+import preflight
+import serial_protocol
+import serial_transport
+
+# Trajectory files : Cartesian points and / or step commands on disk, played from a
+# memory map a chunk at a time.
+#
+# Layout :
+#   MAGIC (8 B) | header length (uint32 LE) | JSON header, space padded | records
+# The records start at DATA_OFFSET (4096, page aligned) and are a numpy structured array
+# with a "points" (3 float64, x y z in `units`) and / or a "commands" (3 int32, relative
+# motor steps [-elbow, base, shoulder] like xyz_to_steps) field. The header holds the
+# record dtype and count, the arm geometry the commands were made for (name, L1, L2,
+# steps_per_rev), the units and the joint pose the commands start from.
+#
+#   with trajectory_file.TrajectoryWriter("job.traj", ARM, commands=True) as out:
+#       for part in parts:                            # any number of appends, never all in memory
+#           out.append(points=part, commands=ARM.xyz_to_steps_batch(part, accumulator=tracker))
+#
+#   job = trajectory_file.TrajectoryFile("job.traj")   # maps the file, reads nothing else
+#   trajectory_file.check(job, ARM, start=tracker.angles()).check()   # preflight, chunk by chunk
+#   trajectory_file.play(job, writer.send, accumulator=tracker)
+#
+# Stored commands only fit the arm and the start pose they were made for,
+# command_mismatch() says when they don't, solve=True plays the points instead.
+#
+# play() does the IK (when there are no commands) and the encoding one chunk at a time
+# and hands each chunk to `send`, a SerialWriter's bounded queue keeps it from running
+# ahead of the port. Pages already played are given back (madvise, where the platform
+# has it), so a 10M point job starts in milliseconds and memory stays flat.
+#
+#   python trajectory_file.py generate job.traj --points 10000000
+#   python trajectory_file.py info job.traj
+#   python trajectory_file.py play job.traj --port /dev/ttyACM0   # --null times it without a board
+
+MAGIC = b"ARMTRAJ\0"
+FORMAT_VERSION = 1
+DATA_OFFSET = 4096
+CHUNK_POINTS = 1 << 16
+FIRST_CHUNK = 256
+LINE_MOVES = 32  # moves per ASCII line, like arm_daemon.CHUNK_MOVES
+
+POINT_FIELD = ("points", "<f8", (3,))
+COMMAND_FIELD = ("commands", "<i4", (3,))
+
+
+def record_dtype(points=True, commands=False):
+    fields = ([POINT_FIELD] if points else []) + ([COMMAND_FIELD] if commands else [])
+    if not fields:
+        raise ValueError("a trajectory needs points, commands or both")
+    return np.dtype(fields)
+
+
+def _header_bytes(header):
+    body = json.dumps(header).encode()
+    room = DATA_OFFSET - len(MAGIC) - 4
+    if len(body) > room:
+        raise ValueError(f"trajectory header is {len(body)} bytes, at most {room} fit")
+    return MAGIC + struct.pack("<I", len(body)) + body.ljust(room)
+
+
+class TrajectoryWriter:
+    def __init__(self, path, arm, points=True, commands=False, units="cm", start_angles=None, meta=None):
+        """
+        Records are appended as they come, the file only appears at `path` once close()
+        has written the final header.
+        """
+        self.path = path
+        self.dtype = record_dtype(points, commands)
+        self.count = 0
+        self.header = {
+            "format": "robotic-arm-trajectory", "version": FORMAT_VERSION,
+            "dtype": [[name, fmt, list(shape)] for name, fmt, shape in
+                      ([POINT_FIELD] if points else []) + ([COMMAND_FIELD] if commands else [])],
+            "count": 0, "units": units,
+            "arm": {"name": arm.name, "L1": arm.L1, "L2": arm.L2, "steps_per_rev": list(arm.steps_per_rev)},
+            "start_angles": [float(a) for a in (start_angles if start_angles is not None else (0.0, 0.0, 0.0))],
+            "meta": meta or {},
+        }
+        self._tmp = path + ".tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(_header_bytes(self.header))
+
+    def append(self, points=None, commands=None):
+        """
+        Add (n, 3) points and / or commands, whichever fields the file has.
+        """
+        n = len(points) if points is not None else len(commands)
+        records = np.empty(n, dtype=self.dtype)
+        for name, values in (("points", points), ("commands", commands)):
+            if name in self.dtype.names:
+                if values is None:
+                    raise ValueError(f"this trajectory has {name}, append() needs them")
+                records[name] = np.asarray(values).reshape(n, 3)
+        self._file.write(records.tobytes())
+        self.count += n
+
+    def close(self):
+        if self._file is None:
+            return
+        self.header["count"] = self.count
+        self._file.seek(0)
+        self._file.write(_header_bytes(self.header))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp, self.path)  # readers never see half a file
+
+    def abort(self):
+        self._file.close()
+        self._file = None
+        os.unlink(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save(path, arm, points=None, commands=None, **kwargs):
+    """
+    Write a whole trajectory held in memory, e.g. a curve typed in main_3D.
+    """
+    with TrajectoryWriter(path, arm, points=points is not None, commands=commands is not None, **kwargs) as out:
+        out.append(points=points, commands=commands)
+
+
+class TrajectoryFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            start = f.read(len(MAGIC) + 4)
+            if start[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a trajectory file")
+            (length,) = struct.unpack("<I", start[len(MAGIC):])
+            self.header = json.loads(f.read(length))
+            if self.header["version"] > FORMAT_VERSION:
+                raise ValueError(f"{path} is format version {self.header['version']}, this reads {FORMAT_VERSION}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.header["count"] else None
+        self.dtype = np.dtype([(name, fmt, tuple(shape)) for name, fmt, shape in self.header["dtype"]])
+        self.count = self.header["count"]
+        self.units = self.header["units"]
+        self.start_angles = self.header["start_angles"]
+        if self._mmap is None:
+            self.records = np.empty(0, dtype=self.dtype)
+        else:
+            self.records = np.frombuffer(self._mmap, dtype=self.dtype, count=self.count, offset=DATA_OFFSET)
+
+    @property
+    def arm(self):
+        """
+        The ArmModel the file was written for (no joint limits, they aren't stored).
+        """
+        arm = self.header["arm"]
+        return kinematics.ArmModel(arm["L1"], arm["L2"], arm["steps_per_rev"], name=arm["name"])
+
+    @property
+    def points(self):
+        return self.records["points"] if "points" in self.dtype.names else None
+
+    @property
+    def commands(self):
+        return self.records["commands"] if "commands" in self.dtype.names else None
+
+    def __len__(self):
+        return self.count
+
+    def release(self, start, stop):
+        """
+        Drop the pages of records [start, stop) from memory, they are read again from the
+        file if touched later.
+        """
+        if self._mmap is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        first = DATA_OFFSET + start * self.dtype.itemsize
+        last = DATA_OFFSET + stop * self.dtype.itemsize
+        first -= first % mmap.PAGESIZE
+        last -= last % mmap.PAGESIZE
+        if last > first:
+            self._mmap.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+    def command_chunks(self, size=CHUNK_POINTS, arm=None, accumulator=None, solve=False):
+        """
+        (n, 3) int32 commands, up to `size` records at a time : the stored commands, or the
+        IK of the points from `accumulator`'s pose with `arm` (default the file's arm) when
+        there are none or with `solve`.
+        """
+        arm = arm or self.arm
+        use_commands = self.commands is not None and not solve
+        # Small chunks first so the port gets its first bytes straight away, then doubling
+        step = min(size, FIRST_CHUNK)
+        start = 0
+        while start < self.count:
+            stop = min(start + step, self.count)
+            step = min(2 * step, size)
+            if use_commands:
+                commands = np.array(self.commands[start:stop])
+                if accumulator is not None:  # keep the session's step counts up to date
+                    total = commands.sum(axis=0, dtype=np.int64)
+                    base, shoulder, elbow = accumulator.position
+                    accumulator.position = [base + int(total[1]), shoulder + int(total[2]), elbow - int(total[0])]
+            else:
+                commands = arm.xyz_to_steps_batch(self.points[start:stop], accumulator=accumulator)
+            self.release(start, stop)
+            start = stop
+            yield commands
+
+    def close(self):
+        """
+        Unmap the file. Arrays still held from points / commands keep the map alive (closing
+        it under them would raise BufferError), it goes away with the last of them.
+        """
+        self.records = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def command_mismatch(trajectory, arm, start=None):
+    """
+    Why the stored commands can't be played on `arm` from the joint pose `start` : made
+    for other lengths / gearing or from another pose. None when they can, or there are none.
+    """
+    if trajectory.commands is None:
+        return None
+    made = trajectory.header["arm"]
+    if (made["L1"], made["L2"], tuple(made["steps_per_rev"])) != (arm.L1, arm.L2, tuple(arm.steps_per_rev)):
+        return (f"the commands are for {made['name']} (L1 {made['L1']}, L2 {made['L2']}, steps_per_rev "
+                f"{made['steps_per_rev']}), not {arm.name}")
+    steps_per_rad = np.asarray(arm.steps_per_rad)
+    if start is not None and (np.rint(np.asarray(trajectory.start_angles) * steps_per_rad)
+                              != np.rint(np.asarray(start, dtype=np.float64) * steps_per_rad)).any():
+        return f"the commands start from {trajectory.start_angles}, the arm is at {list(start)}"
+    return None
+
+
+def check(trajectory, arm=None, start=None, chunk=CHUNK_POINTS, solve=False, **checks):
+    """
+    preflight.check_trajectory over the whole file, `chunk` records at a time, before any
+    of it is played : the points as play() solves them from `start`, or the poses the
+    stored commands go through from the file's start_angles (their reach is a given, the
+    joint limits and step rate / size checks still apply). `checks` are passed on
+    (max_speed, feed_rate, max_steps ...). Returns a PreflightReport with file indices.
+    """
+    arm = arm or trajectory.arm
+    use_commands = trajectory.commands is not None and not solve
+    pose = np.asarray(trajectory.start_angles if use_commands else (start if start is not None else (0.0, 0.0, 0.0)),
+                      dtype=np.float64)
+    steps_per_rad = np.asarray(arm.steps_per_rad)
+    position = np.rint(pose * steps_per_rad)
+    offenders = {name: [] for name in preflight.CHECKS}
+    for first in range(0, trajectory.count, chunk):
+        stop = min(first + chunk, trajectory.count)
+        if use_commands:
+            commands = np.asarray(trajectory.commands[first:stop], dtype=np.int64)
+            # [-elbow, base, shoulder] back to absolute base, shoulder, elbow steps
+            steps = np.cumsum(np.column_stack((commands[:, 1], commands[:, 2], -commands[:, 0])), axis=0) + position
+            angles = steps / steps_per_rad
+            points = arm.fk_3d_batch(angles)[1]
+            position = steps[-1]
+        else:
+            points = np.asarray(trajectory.points[first:stop])
+            angles = arm.ik_3d_batch(points)
+        report = preflight.check_trajectory(points, arm, start=pose, angles=angles, **checks)
+        for name, indices in report.offenders.items():
+            offenders[name].append(indices + first)
+        pose = angles[-1]
+        trajectory.release(first, stop)
+    offenders = {name: np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+                 for name, parts in offenders.items()}
+    return preflight.PreflightReport(trajectory.count, offenders, None, None)
+
+
+def encode_chunk(commands, binary=False, frame_seq=0):
+    """
+    Bytes for a chunk of commands, ASCII lines of LINE_MOVES moves or binary frames.
+    Returns the bytes and the next frame sequence number.
+    """
+    if binary:
+        frames, frame_seq = serial_protocol.encode_frames(commands, frame_seq)
+        return b"".join(frames), frame_seq
+    rows = commands.tolist()
+    return b"".join(serial_protocol.format_ascii(rows[i:i + LINE_MOVES])
+                    for i in range(0, len(rows), LINE_MOVES)), frame_seq
+
+
+def play(trajectory, send, chunk=CHUNK_POINTS, arm=None, accumulator=None, binary=False, frame_seq=0, solve=False):
+    """
+    Stream a TrajectoryFile to `send` (e.g. SerialWriter.send) one encoded chunk at a time,
+    `solve` ignores stored commands (see command_chunks). Returns the moves sent, the bytes
+    sent and the next frame sequence number.
+    """
+    moves = sent = 0
+    for commands in trajectory.command_chunks(chunk, arm, accumulator, solve):
+        data, frame_seq = encode_chunk(commands, binary, frame_seq)
+        send(data)
+        moves += len(commands)
+        sent += len(data)
+    return moves, sent, frame_seq
+
+
+class _NullPort:
+    def __init__(self):
+        self.first_write = None
+
+    def write(self, data):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        return len(data)
+
+
+def _memory():
+    """
+    Resident anonymous and file backed kB of this process (Linux), None elsewhere.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return int(fields["RssAnon"].split()[0]), int(fields["RssFile"].split()[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write, inspect and play trajectory files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    generate = sub.add_parser("generate", help="a helix of --points points, written in chunks")
+    generate.add_argument("path")
+    generate.add_argument("--points", type=int, default=10_000_000)
+    generate.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    generate.add_argument("--commands", action="store_true", help="store the step commands too")
+    info = sub.add_parser("info")
+    info.add_argument("path")
+    run = sub.add_parser("play")
+    run.add_argument("path")
+    run.add_argument("--port", default=os.environ.get("ARDUINO_PORT"))
+    run.add_argument("--baud", type=int, default=9600)
+    run.add_argument("--null", action="store_true", help="write to nowhere, to time the pipeline")
+    run.add_argument("--binary", action="store_true")
+    run.add_argument("--chunk", type=int, default=CHUNK_POINTS)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        arm = kinematics.ArmModel.load(args.arm)
+        tracker = arm.accumulator()
+        start = time.perf_counter()
+        with TrajectoryWriter(args.path, arm, commands=args.commands, meta={"source": "helix"}) as out:
+            for first in range(0, args.points, CHUNK_POINTS):
+                t = np.arange(first, min(first + CHUNK_POINTS, args.points)) * 0.001
+                part = np.column_stack((0.5 * arm.reach + 0.2 * arm.reach * np.cos(t),
+                                        0.2 * arm.reach * np.sin(t), 0.1 * arm.reach * np.sin(t / 50)))
+                out.append(points=part, commands=arm.xyz_to_steps_batch(part, accumulator=tracker)
+                           if args.commands else None)
+        print(f"{args.points} points, {os.path.getsize(args.path) / 1e6:.0f} MB written in "
+              f"{time.perf_counter() - start:.1f} s")
+        return
+
+    if args.command == "info":
+        with TrajectoryFile(args.path) as job:
+            print(json.dumps({**job.header, "record_bytes": job.dtype.itemsize}, indent=2))
+        return
+
+    before = _memory()
+    start = time.perf_counter()
+    job = TrajectoryFile(args.path)
+    opened = time.perf_counter() - start
+    if args.null:
+        port = _NullPort()
+    else:
+        import serial
+
+        port = serial.Serial(args.port, args.baud, timeout=1)
+        time.sleep(2)  # board reset
+    writer = serial_transport.SerialWriter(port, maxsize=4, policy="block")
+    peak = before
+    streamed = time.perf_counter()
+
+    def send(data):
+        nonlocal peak
+        writer.send(data)
+        now = _memory()
+        if now is not None:
+            peak = (max(peak[0], now[0]), max(peak[1], now[1]))
+
+    moves, sent, _ = play(job, send, args.chunk, accumulator=job.arm.accumulator(job.start_angles),
+                          binary=args.binary)
+    writer.close()
+    elapsed = time.perf_counter() - streamed
+    print(f"opened {len(job)} records in {opened * 1000:.2f} ms, first bytes on the port "
+          f"{((port.first_write if args.null else streamed) - start) * 1000:.1f} ms after opening")
+    print(f"{moves} moves, {sent / 1e6:.0f} MB in {elapsed:.1f} s ({moves / elapsed / 1e6:.2f} M moves/s)")
+    if before is not None:
+        print(f"resident memory : anonymous {before[0] / 1024:.0f} -> peak {peak[0] / 1024:.0f} MB, "
+              f"file backed {before[1] / 1024:.0f} -> peak {peak[1] / 1024:.0f} MB, "
+              f"the file is {os.path.getsize(args.path) / 1e6:.0f} MB")
+    job.close()
+    if not args.null:
+        port.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import argparse
+import json
+import math
+import os
+import select
+import signal
+import sys
+import time
+import tty
+from collections import deque
+
+import motion_planner
+import serial_protocol
+
+# Stand-in for the Arduino on a Linux pseudo-terminal, so the Python side can be run
+# and benchmarked without the board :
+#   python virtual_arduino.py --baud 9600 --speed 800 --time-scale 10
+#   ARDUINO_PORT=/dev/pts/N python move_3d/main_3D.py
+#
+# It understands what the sketches get sent : "on" / "off", single motor "A50", step
+# lists "A10,B0,C5;A-3,B2,C0", the compact "A10,C5;B2*3" of command_compress.py and
+# serial_protocol binary frames. The model :
+#   - bytes reach the board at baud / 10 bytes/s (8N1), after they were written
+#   - one line / frame is executed at a time, all axes move together and the move
+#     takes as long as the slowest axis (constant speed, or trapezoid with --accel)
+#   - moves with a motion_planner profile ("A10,B0,C5,V800,E120,R2000") take the time
+#     of that profile, entering at the exit speed of the move before
+#   - while a move runs, incoming bytes land in an rx buffer of --rx-buffer bytes,
+#     anything beyond that is lost and counted as overrun, like the real hardware
+#   - "ok" (or "ok <seq>" for binary frames) is sent back when a line has been executed,
+#     which is what command_stream.CommandStreamer waits for
+# Time is simulated : --time-scale 10 runs the board ten times faster than real time.
+# Stats are printed as json on stdout when it is stopped (Ctrl-C / SIGTERM).
+
+BITS_PER_BYTE = 10
+
+
+class VirtualArduino:
+    def __init__(self, baud=9600, speed=800.0, accel=0.0, rx_buffer=64, time_scale=1.0, ack=True):
+        self.byte_time = BITS_PER_BYTE / baud
+        self.speed = speed
+        self.accel = accel
+        self.rx_buffer = rx_buffer
+        self.time_scale = time_scale
+        self.ack = ack
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # no echo, no newline translation
+        self.path = os.ttyname(self.slave)
+
+        self.real_start = time.monotonic()
+        self.wire_free_at = 0.0    # sim time the host -> board wire is free again
+        self.pending = deque()     # (arrival sim time, byte) still on the wire
+        self.rx = bytearray()      # hardware rx buffer, fills while a move runs
+        self.line = bytearray()    # what the sketch has read but not executed yet
+        self.busy_until = None     # sim time the current move ends
+        self.busy_ack = b""
+        self.decoder = serial_protocol.FrameDecoder()
+
+        self.led = False
+        self.position = [0, 0, 0]
+        self.speed_now = 0.0  # exit speed of the last planned move
+        self.stats = {"bytes_in": 0, "lines": 0, "moves": 0, "frames": 0, "overrun_bytes": 0,
+                      "errors": 0, "dropped_bytes": 0, "busy_s": 0.0, "acks": 0}
+
+    # --- clock
+    def sim_now(self):
+        return (time.monotonic() - self.real_start) * self.time_scale
+
+    def real_delay(self, sim_time):
+        return max(0.0, (sim_time - self.sim_now()) / self.time_scale)
+
+    # --- motion model
+    def axis_time(self, steps):
+        steps = abs(steps)
+        if steps == 0:
+            return 0.0
+        if self.accel <= 0:
+            return steps / self.speed
+        ramp_steps = self.speed ** 2 / (2 * self.accel)
+        if steps < 2 * ramp_steps:  # triangle profile, never reaches full speed
+            return 2 * math.sqrt(steps / self.accel)
+        return 2 * self.speed / self.accel + (steps - 2 * ramp_steps) / self.speed
+
+    def move_time(self, moves):
+        total = 0.0
+        for move in moves:
+            steps, profile = move[:3], move[3:]
+            for axis, delta in enumerate(steps):
+                self.position[axis] += delta
+            if profile:
+                cruise, exit, accel = profile
+                total += motion_planner.segment_time(max(abs(d) for d in steps), self.speed_now, cruise, exit, accel)
+                self.speed_now = exit
+            else:
+                total += max(self.axis_time(delta) for delta in steps)
+                self.speed_now = 0.0
+            self.stats["moves"] += 1
+        return total
+
+    # --- command parsing
+    def parse_text(self, text):
+        """
+        Returns the moves for one line, raises ValueError on bad input.
+        A move is [a, b, c], or [a, b, c, cruise, exit, accel] when it carries a profile.
+        """
+        text = text.strip().lower()
+        if text in ("on", "off"):
+            self.led = text == "on"
+            return []
+        moves = []
+        for command in text.split(";"):
+            # "*n" repeats the move n times (command_compress.format_compact), missing fields are 0
+            command, star, count = command.partition("*")
+            count = int(count) if star else 1
+            if count < 1:
+                raise ValueError(command)
+            move = [0, 0, 0]
+            profile = {}
+            for field in command.split(","):
+                field = field.strip()
+                if len(field) < 2 or field[0] not in "abcver":
+                    raise ValueError(field)
+                if field[0] in "abc":
+                    move["abc".index(field[0])] = int(field[1:])
+                else:
+                    profile[field[0]] = float(field[1:])
+            if profile:
+                if len(profile) != 3:
+                    raise ValueError(command)
+                move += [profile["v"], profile["e"], profile["r"]]
+            moves.extend(list(move) for _ in range(count))
+        return moves
+
+    def next_unit(self):
+        """
+        Take one complete line or binary frame out of the sketch buffer.
+        Returns (moves, ack) or None if nothing complete is buffered.
+        """
+        buf = self.line
+        while buf[:1] == b"\n" or buf[:1] == b"\r":
+            del buf[:1]
+        if not buf:
+            return None
+
+        if buf[0] == serial_protocol.SYNC:
+            if len(buf) < serial_protocol.HEADER_SIZE:
+                return None
+            size = None
+            if buf[1] & serial_protocol.WIDTH_MASK in serial_protocol.WIDTHS:
+                size = serial_protocol.frame_size(buf[3], buf[1])
+                # A header hit by an overrun can claim more bytes than will ever come : wait
+                # for them only until a whole valid frame turns up inside what it claims
+                if len(buf) < size:
+                    if not any(self.frame_at(i) for i in range(1, len(buf)) if buf[i] == serial_protocol.SYNC):
+                        return None
+                    size = None
+            # One frame at a time through an empty decoder, nothing of a bad one is kept
+            self.decoder.buffer.clear()
+            frames = self.decoder.feed(bytes(buf[:size])) if size else []
+            self.decoder.buffer.clear()
+            if not frames:
+                # The next frame may start inside what the bad header claimed
+                self.resync()
+                self.stats["errors"] += 1
+                return [], b"error: bad frame\n"
+            del buf[:size]
+            seq, moves = frames[0]
+            self.stats["frames"] += 1
+            return moves, f"ok {seq}\n".encode()
+
+        end = buf.find(b"\n")
+        sync = buf.find(serial_protocol.SYNC)
+        if sync >= 0 and (end < 0 or sync < end):
+            # Text never holds a sync byte : the tail of a frame whose start was lost
+            del buf[:sync]
+            self.stats["dropped_bytes"] += sync
+            return self.next_unit()
+        if end < 0:
+            return None
+        text = buf[:end].decode(errors="replace")
+        del buf[:end + 1]
+        self.stats["lines"] += 1
+        try:
+            return self.parse_text(text), b"ok\n"
+        except ValueError:
+            self.stats["errors"] += 1
+            return [], f"error: bad command {text.strip()!r}\n".encode()
+
+    def frame_at(self, i):
+        """
+        Whether a whole frame with a good crc starts at self.line[i].
+        """
+        buf = self.line
+        if len(buf) - i < serial_protocol.HEADER_SIZE:
+            return False
+        if buf[i + 1] & serial_protocol.WIDTH_MASK not in serial_protocol.WIDTHS:
+            return False
+        size = serial_protocol.frame_size(buf[i + 3], buf[i + 1])
+        return len(buf) - i >= size and bool(serial_protocol.FrameDecoder().feed(bytes(buf[i:i + size])))
+
+    def resync(self):
+        """
+        Drop the bytes up to the next sync byte after the first, or past the next newline
+        when no frame follows, like the firmware does after a bad frame.
+        """
+        buf = self.line
+        start = buf.find(serial_protocol.SYNC, 1)
+        if start < 0:
+            start = buf.find(b"\n") + 1 or len(buf)
+        del buf[:start]
+        self.stats["dropped_bytes"] += start
+
+    # --- event loop
+    def receive(self, data):
+        now = max(self.sim_now(), self.wire_free_at)
+        for i, byte in enumerate(data):
+            self.pending.append((now + (i + 1) * self.byte_time, byte))
+        self.wire_free_at = now + len(data) * self.byte_time
+        self.stats["bytes_in"] += len(data)
+
+    def start_next(self, at):
+        unit = self.next_unit()
+        if unit is None:
+            return
+        moves, ack = unit
+        # Like readStringUntil('\n'), whatever follows the line stays in the rx buffer
+        self.rx[:0] = self.line
+        self.line.clear()
+        duration = self.move_time(moves)
+        self.stats["busy_s"] += duration
+        self.busy_until = at + duration
+        self.busy_ack = ack
+
+    def advance(self, now):
+        """
+        Run every byte arrival and move completion up to sim time `now`, in time order.
+        """
+        while True:
+            next_byte = self.pending[0][0] if self.pending else math.inf
+            if self.busy_until is not None and self.busy_until <= min(next_byte, now):
+                at = self.busy_until
+                self.busy_until = None
+                if self.ack:
+                    os.write(self.master, self.busy_ack)
+                    self.stats["acks"] += 1
+                self.line += self.rx  # the sketch reads what piled up during the move
+                self.rx.clear()
+                self.start_next(at)
+            elif next_byte <= now:
+                at, byte = self.pending.popleft()
+                if self.busy_until is not None:
+                    if len(self.rx) < self.rx_buffer:
+                        self.rx.append(byte)
+                    else:
+                        self.stats["overrun_bytes"] += 1
+                else:
+                    self.line.append(byte)
+                    self.start_next(at)
+            else:
+                return
+
+    def next_event(self):
+        events = [t for t in (self.busy_until, self.pending[0][0] if self.pending else None) if t is not None]
+        return min(events) if events else None
+
+    def run(self):
+        while True:
+            event = self.next_event()
+            timeout = None if event is None else self.real_delay(event)
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if readable:
+                self.receive(os.read(self.master, 4096))
+            self.advance(self.sim_now())
+
+    def summary(self):
+        stats = dict(self.stats)
+        stats.update(position=self.position, led=self.led, sim_time_s=round(self.sim_now(), 3),
+                     busy_s=round(self.stats["busy_s"], 3))
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="virtual Arduino on a pty")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--speed", type=float, default=800.0, help="max stepper speed, steps/s")
+    parser.add_argument("--accel", type=float, default=0.0, help="steps/s^2, 0 for constant speed")
+    parser.add_argument("--rx-buffer", type=int, default=64)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="simulated seconds per real second")
+    parser.add_argument("--no-ack", action="store_true", help="behave like a sketch that never answers")
+    parser.add_argument("--link", help="also expose the pty under this path (symlink)")
+    args = parser.parse_args()
+
+    board = VirtualArduino(args.baud, args.speed, args.accel, args.rx_buffer, args.time_scale, not args.no_ack)
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(board.path, args.link)
+    print(board.path, flush=True)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        board.run()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)
+        print(json.dumps(board.summary()), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+import kinematics
+
+# Visiting order for targets whose order doesn't matter (pick-and-place, inspection).
+#
+# The cost of going from one target to the next is the time of the move in joint space :
+# every joint moves at the same time, so it is the time of the joint with the most work,
+# |steps| / max speed, with the base going the short way round. order_targets() builds a
+# nearest neighbour tour from the current pose and then improves it with 2-opt, trying
+# only the k nearest targets of each one, which keeps a few thousand targets well under
+# a second.
+#
+#   order, report = waypoint_order.order_targets(points, arm, start=tracker.angles())
+#   curve = [points[i] for i in order]
+#   print(waypoint_order.describe(report))
+#
+# The arm doesn't come back at the end, so the tour is an open path from the start pose.
+
+DEFAULT_SPEEDS = (800, 800, 800)  # steps/s, MAX_SPEED of the main scripts
+
+
+def _joint_times(arm, speeds):
+    return np.asarray(arm.steps_per_rad) / np.asarray(speeds, dtype=np.float64)
+
+
+def move_times(angles, other, scale):
+    """
+    Move time from each pose in `angles` (N, 3) to `other` (3,) or (N, 3).
+    """
+    delta = np.abs(angles - other)
+    delta[..., 0] = np.minimum(delta[..., 0] % (2 * np.pi), 2 * np.pi - delta[..., 0] % (2 * np.pi))
+    return (delta * scale).max(axis=-1)
+
+
+def path_time(angles, order, start, scale):
+    poses = np.vstack((start[None, :], angles[order]))
+    return float(move_times(poses[1:], poses[:-1], scale).sum())
+
+
+def nearest_neighbour(angles, start, scale):
+    n = len(angles)
+    # Remaining targets as scaled joint columns, the picked one is swapped out with the last
+    cols = [np.ascontiguousarray(angles[:, j] * scale[j]) for j in range(3)]
+    ids = np.arange(n)
+    period = 2 * np.pi * scale[0]
+    current = [start[0] * scale[0], start[1] * scale[1], start[2] * scale[2]]
+    order = np.empty(n, dtype=np.intp)
+    for i in range(n):
+        left = n - i
+        base = np.abs(cols[0][:left] - current[0]) % period
+        cost = np.maximum(np.minimum(base, period - base),
+                          np.maximum(np.abs(cols[1][:left] - current[1]), np.abs(cols[2][:left] - current[2])))
+        k = int(cost.argmin())
+        order[i] = ids[k]
+        current = [cols[0][k], cols[1][k], cols[2][k]]
+        last = left - 1
+        for col in cols:
+            col[k] = col[last]
+        ids[k] = ids[last]
+    return order
+
+
+def _neighbours(angles, scale, k, chunk=512):
+    """
+    The k targets with the shortest moves from each target and those move times, (N, k) each.
+    """
+    n = len(angles)
+    k = min(k, n - 1)
+    result = np.empty((n, k), dtype=np.intp)
+    times = np.empty((n, k))
+    # Column by column in float32, the (chunk, N) temporaries are the whole cost here.
+    # The IK base angles are in [-pi, pi], so the short way round needs no modulo
+    cols = [(angles[:, j] * scale[j]).astype(np.float32) for j in range(3)]
+    period = np.float32(2 * np.pi * scale[0])
+    for start in range(0, n, chunk):
+        rows = slice(start, start + chunk)
+        base = np.abs(cols[0][rows, None] - cols[0][None, :])
+        cost = np.minimum(base, period - base, out=base)
+        for col in cols[1:]:
+            np.maximum(cost, np.abs(col[rows, None] - col[None, :]), out=cost)
+        cost[np.arange(len(cost)), np.arange(start, start + len(cost))] = np.inf
+        nearest = np.argpartition(cost, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(cost))[:, None]
+        nearest = nearest[rows, np.argsort(cost[rows, nearest], axis=1)]
+        result[start:start + chunk] = nearest
+        times[start:start + chunk] = cost[rows, nearest]
+    return result, times
+
+
+def two_opt(angles, order, start, scale, k=8, deadline=None):
+    """
+    Improve an open tour with 2-opt moves towards the k nearest neighbours of each target.
+    tour[0] is the start pose and never moves. Returns the improved order.
+    """
+    poses = [tuple(start)] + [tuple(a) for a in angles.tolist()]
+    tour = [0] + [int(i) + 1 for i in order]  # node 0 is the start pose
+    n = len(tour)
+    position = [0] * n
+    for p, node in enumerate(tour):
+        position[node] = p
+    nearest, times = _neighbours(angles, scale, k)
+    neighbours = [[]] + [list(zip((row + 1).tolist(), row_times)) for row, row_times in zip(nearest, times.tolist())]
+    s0, s1, s2 = scale.tolist()
+    two_pi = 2 * math.pi
+
+    def cost(a, b):
+        if b is None:
+            return 0.0
+        pa, pb = poses[a], poses[b]
+        base = abs(pa[0] - pb[0]) % two_pi
+        return max(min(base, two_pi - base) * s0, abs(pa[1] - pb[1]) * s1, abs(pa[2] - pb[2]) * s2)
+
+    def node(p):
+        return tour[p] if p < n else None
+
+    # Targets still worth looking at ("don't look bits"), every one to begin with
+    queue = deque(range(1, n))
+    queued = [True] * n
+    queued[0] = False
+    while queue:
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        a = queue.popleft()
+        queued[a] = False
+        i = position[a]
+        after = cost(a, node(i + 1))
+        before = cost(tour[i - 1], a)
+        for c, a_to_c in neighbours[a]:
+            if a_to_c >= after and a_to_c >= before:
+                break  # sorted, no closer neighbour left that could pay off
+            j = position[c]
+            lo, hi = min(i, j), max(i, j)
+            # Reversing tour[p + 1 .. q] swaps edges (p, p+1), (q, q+1) for (p, q), (p+1, q+1).
+            # (lo, hi) drops the edges after a and c, (lo - 1, hi - 1) the ones before them,
+            # both put a and c next to each other
+            moved = None
+            for p, q, removed in ((lo, hi, after), (lo - 1, hi - 1, before)):
+                if a_to_c >= removed or p < 0 or q <= p + 1:
+                    continue
+                gain = (cost(tour[p], tour[p + 1]) + cost(tour[q], node(q + 1))
+                        - cost(tour[p], tour[q]) - cost(tour[p + 1], node(q + 1)))
+                if gain > 1e-12:
+                    moved = (p, q)
+                    break
+            if moved:
+                p, q = moved
+                ends = [tour[p], tour[p + 1], tour[q]] + ([tour[q + 1]] if q + 1 < n else [])
+                tour[p + 1:q + 1] = tour[p + 1:q + 1][::-1]
+                for r in range(p + 1, q + 1):
+                    position[tour[r]] = r
+                for end in ends:
+                    if end and not queued[end]:
+                        queued[end] = True
+                        queue.append(end)
+                break
+    return [node - 1 for node in tour[1:]]
+
+
+def order_targets(points, arm, start=None, speeds=DEFAULT_SPEEDS, k=8, time_limit=None):
+    """
+    Order of `points` (N, 3) with a short total move time, from joint pose `start`
+    (default zero angles). Returns the order and a report dict with the move times in
+    seconds of the input order, the nearest neighbour tour and the final tour.
+    """
+    began = time.perf_counter()
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    start = np.zeros(3) if start is None else np.asarray(start, dtype=np.float64)
+    scale = _joint_times(arm, speeds)
+    angles = arm.ik_3d_batch(points)
+    if len(points) < 3:
+        order = list(nearest_neighbour(angles, start, scale))
+        nn_time = opt_time = path_time(angles, order, start, scale)
+    else:
+        order = nearest_neighbour(angles, start, scale)
+        nn_time = path_time(angles, order, start, scale)
+        deadline = began + time_limit if time_limit is not None else None
+        order = two_opt(angles, order, start, scale, k, deadline)
+        opt_time = path_time(angles, order, start, scale)
+    input_time = path_time(angles, np.arange(len(points)), start, scale)
+    report = {"targets": len(points), "input_time": input_time, "nearest_neighbour_time": nn_time,
+              "ordered_time": opt_time, "saved": input_time - opt_time,
+              "compute_time": time.perf_counter() - began}
+    return [int(i) for i in order], report
+
+
+def describe(report):
+    saved = report["saved"] / report["input_time"] if report["input_time"] else 0.0
+    return (f"{report['targets']} targets : input order {report['input_time']:.1f} s of moves, "
+            f"nearest neighbour {report['nearest_neighbour_time']:.1f} s, 2-opt {report['ordered_time']:.1f} s, "
+            f"saves {report['saved']:.1f} s ({saved:.0%}), ordered in {report['compute_time'] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="order random targets for the least move time")
+    parser.add_argument("--targets", type=int, default=3000)
+    parser.add_argument("--arm", default="arm_3d", help="arm name in arm_config.json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    arm = kinematics.ArmModel.load(args.arm)
+    rng = np.random.default_rng(args.seed)
+    # Targets on a table in front of the arm, like a pick-and-place tray
+    points = np.column_stack((rng.uniform(-0.7, 0.7, args.targets) * arm.reach,
+                              rng.uniform(0.1, 0.7, args.targets) * arm.reach,
+                              rng.uniform(-0.3, 0.1, args.targets) * arm.reach))
+    order, report = order_targets(points, arm)
+    assert sorted(order) == list(range(args.targets))
+    print(describe(report))
+
+
+if __name__ == '__main__':
+    main()